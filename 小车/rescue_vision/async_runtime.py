@@ -0,0 +1,142 @@
+"""基于asyncio的串口运行方式：事件循环监听串口fd，检测放到单独的线程里执行
+
+阻塞方式（main.serve）下，处理一条命令时不会读取串口。这里改为：
+- 串口设置为非阻塞，数据到达时由事件循环回调读取，增量切分成命令放入队列，检测期间也不会漏读
+- 队列里的命令按顺序交给单线程执行器检测（检测器不是线程安全的），OpenCV运算时释放GIL，不阻塞事件循环
+- 回复交给单独的写线程发送：9600波特率下发送一条回复要约10ms，不能在事件循环里阻塞写；
+  发送上一条回复的同时就可以检测下一条命令，回复仍按顺序发出
+- 取帧仍由camera_capture的后台线程完成，几者互不等待
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from config import ELECTRONIC_CONTROL_CONFIG, VISION_CONFIG
+from binary_protocol import FrameReader
+from command_handler import SerialLineReader, LatencyStats, report_stats
+from vision_log import get_logger
+
+logger = get_logger("async")
+
+
+class AsyncSerialServer:
+    """在asyncio事件循环里服务串口命令"""
+
+    def __init__(self, ser, handler, protocol=None):
+        """
+        Args:
+            ser: 已打开的串口
+            handler: CommandHandler对象
+            protocol: "text"或"binary"，默认读取ELECTRONIC_CONTROL_CONFIG["protocol"]
+        """
+        self.ser = ser
+        self.handler = handler
+        self.protocol = protocol or ELECTRONIC_CONTROL_CONFIG.get("protocol", "text")
+        if self.protocol == "binary":
+            self.reader = FrameReader()
+            self.respond = handler.handle_frame
+        else:
+            self.reader = SerialLineReader()
+            self.respond = lambda line: handler.handle(line).encode('utf-8')
+
+        self.command_count = 0
+        self.queue_wait = LatencyStats(budgets={})  # 命令从收到到开始检测的排队时间（毫秒）
+        self.loop = None
+        self.requests = None
+        self.stop_event = None
+        self.sending = None  # 正在发送的上一条回复（写线程的future）
+
+    def _on_readable(self):
+        """串口有数据时由事件循环调用，只读取已到达的字节，不会阻塞"""
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except serial.SerialException as e:
+            logger.error("串口通信错误: %s", e)
+            self.stop_event.set()
+            return
+        if not data:
+            return
+        received = time.perf_counter()
+        for request in self.reader.feed(data):
+            self.requests.put_nowait((request, received))
+
+    async def _process(self, executor, writer):
+        """按顺序处理排队的命令，回复在写线程里发送"""
+        debug_mode = VISION_CONFIG.get("debug_mode", False)
+        while True:
+            request, received = await self.requests.get()
+            self.queue_wait.record("queue", (time.perf_counter() - received) * 1000)
+            try:
+                response = await self.loop.run_in_executor(executor, self.respond, request)
+                if self.sending is not None:
+                    # 等上一条发完再发这一条（写线程只有一个，这里主要是取出发送时的异常）；
+                    # shield保证退出时取消本任务不会连带取消这次发送，由_finish_sending收尾
+                    sending = self.sending
+                    try:
+                        await asyncio.shield(sending)
+                    finally:
+                        if sending.done():
+                            self.sending = None
+                self.sending = self.loop.run_in_executor(writer, self.ser.write, response)
+            except serial.SerialException as e:
+                logger.error("串口通信错误: %s", e)
+                self.stop_event.set()
+                return
+            except Exception as e:
+                # 单条命令处理出错不影响后续命令
+                logger.error("处理命令时发生错误: %s", e)
+                continue
+
+            self.command_count += 1
+            report_stats(self.handler, self.command_count, debug_mode)
+
+    async def run(self):
+        """运行直到stop()被调用或串口出错，返回处理的命令数"""
+        self.loop = asyncio.get_running_loop()
+        self.requests = asyncio.Queue()
+        self.stop_event = asyncio.Event()
+
+        self.ser.timeout = 0  # 非阻塞读取，由事件循环通知何时有数据
+        fd = self.ser.fileno()
+        self.loop.add_reader(fd, self._on_readable)
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="detect")
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="serial-write")
+        worker = asyncio.create_task(self._process(executor, writer))
+        try:
+            await self.stop_event.wait()
+        finally:
+            self.loop.remove_reader(fd)
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+            await self._finish_sending()
+            executor.shutdown(wait=True)
+            writer.shutdown(wait=True)
+        return self.command_count
+
+    async def _finish_sending(self):
+        """退出前等最后一条回复发完，发送出错时记录下来，不能悄悄丢掉"""
+        if self.sending is None:
+            return
+        sending, self.sending = self.sending, None
+        try:
+            await sending
+        except serial.SerialException as e:
+            logger.error("串口通信错误（最后一条回复未发出）: %s", e)
+        except Exception as e:
+            logger.error("发送最后一条回复时发生错误: %s", e)
+
+    def stop(self):
+        """请求停止，可以在其他线程调用"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+
+def serve_async(ser, handler, protocol=None):
+    """用asyncio方式运行串口主循环，直到串口出错或Ctrl+C"""
+    server = AsyncSerialServer(ser, handler, protocol)
+    try:
+        return asyncio.run(server.run())
+    except KeyboardInterrupt:
+        return server.command_count
@@ -0,0 +1,162 @@
+"""小球跟踪：找到球以后只在预测位置附近的小区域内检测，不用每次都扫描整幅图像"""
+import time
+
+import cv2
+import numpy as np
+
+from config import TRACKER_CONFIG
+
+
+class BallTrack:
+    """单个球的跟踪状态，用匀速模型的卡尔曼滤波平滑位置"""
+
+    def __init__(self, cx, cy, distance, diameter, timestamp, config=TRACKER_CONFIG):
+        self.config = config
+        self.distance = distance  # 平滑后的距离（mm）
+        self.diameter = diameter  # 图像中的直径（像素）
+        self.misses = 0           # 连续没有检测到的次数
+        self.last_time = timestamp
+
+        # 状态[x, y, vx, vy]，测量[x, y]
+        self.kalman = cv2.KalmanFilter(4, 2)
+        self.kalman.measurementMatrix = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], np.float32)
+        self.kalman.measurementNoiseCov = np.eye(2, dtype=np.float32) * config["measurement_noise"] ** 2
+        self.kalman.errorCovPost = np.diag([10, 10, 1000, 1000]).astype(np.float32)
+        self.kalman.statePost = np.array([[cx], [cy], [0], [0]], np.float32)
+
+    @property
+    def position(self):
+        state = self.kalman.statePost
+        return float(state[0, 0]), float(state[1, 0])
+
+    def predict(self, timestamp):
+        """按时间间隔预测球的当前位置"""
+        dt = max(timestamp - self.last_time, 1e-3)
+        self.last_time = timestamp
+        self.kalman.transitionMatrix = np.array([[1, 0, dt, 0],
+                                                 [0, 1, 0, dt],
+                                                 [0, 0, 1, 0],
+                                                 [0, 0, 0, 1]], np.float32)
+        # 匀速模型的过程噪声：加速度当作白噪声
+        q = self.config["process_noise"] ** 2
+        dt2, dt3, dt4 = dt * dt, dt ** 3 / 2, dt ** 4 / 4
+        self.kalman.processNoiseCov = np.array([[dt4, 0, dt3, 0],
+                                                [0, dt4, 0, dt3],
+                                                [dt3, 0, dt2, 0],
+                                                [0, dt3, 0, dt2]], np.float32) * q
+        state = self.kalman.predict()
+        # 没有测量时predict的结果就是当前估计
+        self.kalman.statePost = state.copy()
+        self.kalman.errorCovPost = self.kalman.errorCovPre.copy()
+        return float(state[0, 0]), float(state[1, 0])
+
+    def correct(self, cx, cy, distance, diameter):
+        """用新的检测结果修正跟踪状态"""
+        self.kalman.correct(np.array([[cx], [cy]], np.float32))
+        alpha = self.config["distance_smoothing"]
+        self.distance = alpha * distance + (1 - alpha) * self.distance
+        self.diameter = diameter
+        self.misses = 0
+
+    def roi(self, frame_shape):
+        """根据预测位置、直径和速度计算下一次检测的区域(x, y, w, h)"""
+        height, width = frame_shape[:2]
+        x, y = self.position
+        speed = float(np.hypot(self.kalman.statePost[2, 0], self.kalman.statePost[3, 0]))
+        half = max(self.diameter * self.config["roi_scale"], self.config["min_roi_size"] / 2)
+        half += speed * 0.1  # 多留出约0.1秒的移动距离
+        x0 = int(max(x - half, 0))
+        y0 = int(max(y - half, 0))
+        x1 = int(min(x + half, width))
+        y1 = int(min(y + half, height))
+        return x0, y0, max(x1 - x0, 0), max(y1 - y0, 0)
+
+
+class BallTracker:
+    """某一种颜色的多球跟踪器
+
+    有跟踪目标时只在各个球的预测区域内检测，每隔full_search_interval次或者跟丢时做一次全图搜索
+    """
+
+    def __init__(self, detector, color, config=TRACKER_CONFIG):
+        self.detector = detector
+        self.color = color
+        self.config = config
+        self.tracks = []
+        self.update_count = 0
+
+    def reset(self):
+        self.tracks = []
+        self.update_count = 0
+
+    def update(self, frame, timestamp=None):
+        """在新的一帧上更新跟踪，返回按距离排序的(中心x, 中心y, 距离)列表"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.update_count += 1
+
+        for track in self.tracks:
+            track.predict(timestamp)
+
+        # 没有跟踪目标、有目标跟丢（上一帧未检测到）或到了定期搜索的时候做全图搜索，全图搜索时允许新建跟踪目标
+        full_search = (not self.tracks or any(t.misses for t in self.tracks)
+                       or self.update_count % self.config["full_search_interval"] == 0)
+        if full_search:
+            detections, _ = self.detector.detect_color(frame, self.color)
+        else:
+            detections = []
+            for track in self.tracks:
+                roi = track.roi(frame.shape)
+                if roi[2] > 0 and roi[3] > 0:
+                    found, _ = self.detector.detect_color(frame, self.color, roi)
+                    detections.extend(found)
+            detections = _unique(detections)
+
+        self._associate(detections, timestamp, allow_new=full_search)
+
+        targets = [(int(round(t.position[0])), int(round(t.position[1])), t.distance)
+                   for t in self.tracks if t.misses == 0]
+        targets.sort(key=lambda x: x[2])
+        return targets
+
+    def _associate(self, detections, timestamp, allow_new):
+        """贪心最近邻关联：每个检测结果配给距离最近且在门限内的跟踪目标"""
+        unmatched = list(detections)
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            tx, ty = track.position
+            gate = max(track.diameter * self.config["roi_scale"], self.config["min_roi_size"] / 2)
+            for di, (cx, cy, _) in enumerate(unmatched):
+                d = np.hypot(cx - tx, cy - ty)
+                if d <= gate:
+                    pairs.append((d, ti, di))
+        pairs.sort()
+
+        used_tracks, used_detections = set(), set()
+        for _, ti, di in pairs:
+            if ti in used_tracks or di in used_detections:
+                continue
+            cx, cy, distance = unmatched[di]
+            self.tracks[ti].correct(cx, cy, distance, self.detector.ball_diameter(distance))
+            used_tracks.add(ti)
+            used_detections.add(di)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.config["max_misses"]]
+
+        if allow_new:
+            for di, (cx, cy, distance) in enumerate(unmatched):
+                if di not in used_detections:
+                    self.tracks.append(BallTrack(cx, cy, distance, self.detector.ball_diameter(distance),
+                                                 timestamp, self.config))
+
+
+def _unique(detections, min_separation=3):
+    """相邻跟踪区域重叠时同一个球会被检测两次，去掉重复的结果"""
+    result = []
+    for det in detections:
+        if all(abs(det[0] - r[0]) > min_separation or abs(det[1] - r[1]) > min_separation for r in result):
+            result.append(det)
+    return result
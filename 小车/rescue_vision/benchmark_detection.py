@@ -0,0 +1,197 @@
+"""离线检测基准测试：在合成画面上测量ObjectDetector的速度和准确率，不需要摄像头和显示器
+
+用法：
+    python benchmark_detection.py                  # 运行并打印结果
+    python benchmark_detection.py --save-baseline  # 把本次结果保存为本机基准
+    python benchmark_detection.py --check          # 与基准比较，变慢或准确率下降时返回非0
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from config import BENCHMARK_CONFIG
+from object_detection import ObjectDetector
+from synthetic_scene import SceneGenerator
+from vision_log import setup_logging
+
+
+class DetectionBenchmark:
+    def __init__(self, frames=100, seed=0, ball_colors=("red", "blue", "yellow", "black"),
+                 safe_zone_color="red", warmup=5):
+        self.ball_colors = list(ball_colors)
+        self.safe_zone_color = safe_zone_color
+        self.warmup = warmup
+
+        # 预先生成所有画面，计时只包含检测
+        generator = SceneGenerator(seed)
+        self.scenes = [generator.generate(ball_colors=ball_colors, safe_zone_color=safe_zone_color)
+                       for _ in range(frames + warmup)]
+
+    def run(self, detector=None):
+        """运行基准测试，返回结果字典"""
+        detector = detector or ObjectDetector()
+        ball_times, zone_times, frame_times = [], [], []
+        ball_stats = {"truth": 0, "detected": 0, "matched": 0, "center_error": [], "distance_error": []}
+        zone_stats = {"truth": 0, "matched": 0, "iou": []}
+
+        for index, (frame, truth) in enumerate(self.scenes):
+            detector.clear_cache()
+            start = time.perf_counter()
+            results = detector.detect_many(frame, self.ball_colors)
+            middle = time.perf_counter()
+            safe_zone, _ = detector.detect_safe_zone(frame, self.safe_zone_color)
+            end = time.perf_counter()
+
+            if index < self.warmup:
+                continue
+            ball_times.append(middle - start)
+            zone_times.append(end - middle)
+            frame_times.append(end - start)
+            self._score_balls(detector, results, truth["balls"], ball_stats)
+            self._score_safe_zone(safe_zone, truth["safe_zone"], zone_stats)
+
+        total = sum(frame_times)
+        return {
+            "frames": len(frame_times),
+            "fps": len(frame_times) / total if total > 0 else 0.0,
+            "frame_ms": _percentiles(frame_times),
+            "balls_ms": _percentiles(ball_times),
+            "safe_zone_ms": _percentiles(zone_times),
+            "ball_recall": ball_stats["matched"] / max(ball_stats["truth"], 1),
+            "ball_precision": ball_stats["matched"] / max(ball_stats["detected"], 1),
+            "ball_center_error_px": float(np.mean(ball_stats["center_error"])) if ball_stats["center_error"] else 0.0,
+            "ball_distance_error": float(np.mean(ball_stats["distance_error"])) if ball_stats["distance_error"] else 0.0,
+            "safe_zone_recall": zone_stats["matched"] / max(zone_stats["truth"], 1),
+            "safe_zone_iou": float(np.mean(zone_stats["iou"])) if zone_stats["iou"] else 0.0,
+        }
+
+    @staticmethod
+    def _score_balls(detector, results, truth_balls, stats):
+        """按颜色把检测结果和真值一一匹配（中心距离小于半径算命中）"""
+        for color, (targets, _) in results.items():
+            truths = [(cx, cy, d) for c, cx, cy, d in truth_balls if c == color]
+            stats["truth"] += len(truths)
+            stats["detected"] += len(targets)
+            used = set()
+            for tx, ty, diameter in truths:
+                best, best_error = None, max(diameter / 2, 4)
+                for i, (cx, cy, _) in enumerate(targets):
+                    error = np.hypot(cx - tx, cy - ty)
+                    if i not in used and error <= best_error:
+                        best, best_error = i, error
+                if best is None:
+                    continue
+                used.add(best)
+                stats["matched"] += 1
+                stats["center_error"].append(best_error)
+                expected = detector.calculate_distance(diameter)
+                stats["distance_error"].append(abs(targets[best][2] - expected) / expected)
+
+    @staticmethod
+    def _score_safe_zone(safe_zone, truth_zone, stats):
+        if truth_zone is None:
+            return
+        stats["truth"] += 1
+        if safe_zone is None:
+            return
+        iou = _iou(safe_zone, truth_zone[1])
+        if iou >= 0.5:
+            stats["matched"] += 1
+            stats["iou"].append(iou)
+
+
+def _percentiles(samples):
+    """返回毫秒为单位的p50/p95/p99"""
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    values = np.array(samples) * 1000
+    return {f"p{p}": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = w * h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def check_regression(result, baseline=None, config=BENCHMARK_CONFIG):
+    """检查结果是否变慢或准确率下降，返回失败原因列表（空列表表示通过）"""
+    failures = []
+    for key in ("ball_recall", "ball_precision", "safe_zone_recall"):
+        minimum = config.get(f"min_{key}")
+        if minimum is not None and result[key] < minimum:
+            failures.append(f"{key}={result[key]:.3f} 低于下限{minimum}")
+
+    if baseline is not None:
+        tolerance = config.get("latency_tolerance", 0.2)
+        for key in ("frame_ms", "balls_ms", "safe_zone_ms"):
+            for p in ("p50", "p95"):
+                limit = baseline[key][p] * (1 + tolerance)
+                if result[key][p] > limit:
+                    failures.append(f"{key}.{p}={result[key][p]:.2f}ms 超过基准{baseline[key][p]:.2f}ms的{1 + tolerance:.0%}")
+    return failures
+
+
+def format_result(result):
+    lines = [
+        f"帧数: {result['frames']}  FPS: {result['fps']:.1f}",
+        "每帧耗时: p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms".format(**result["frame_ms"]),
+        "  球检测: p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms".format(**result["balls_ms"]),
+        "  安全区: p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms".format(**result["safe_zone_ms"]),
+        f"球: 召回率={result['ball_recall']:.3f} 精确率={result['ball_precision']:.3f} "
+        f"中心误差={result['ball_center_error_px']:.2f}px 距离相对误差={result['ball_distance_error']:.3f}",
+        f"安全区: 召回率={result['safe_zone_recall']:.3f} IoU={result['safe_zone_iou']:.3f}",
+    ]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ObjectDetector离线基准测试")
+    parser.add_argument("--frames", type=int, default=BENCHMARK_CONFIG["frames"], help="测试帧数")
+    parser.add_argument("--seed", type=int, default=0, help="合成画面随机种子")
+    parser.add_argument("--baseline", default=BENCHMARK_CONFIG["baseline_path"], help="基准结果文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基准")
+    parser.add_argument("--check", action="store_true", help="与基准比较，失败时返回1")
+    args = parser.parse_args(argv)
+
+    setup_logging(debug_mode=False)
+    benchmark = DetectionBenchmark(frames=args.frames, seed=args.seed)
+    result = benchmark.run()
+    print(format_result(result))
+
+    baseline_path = args.baseline
+    if not os.path.isabs(baseline_path):
+        baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), baseline_path)
+
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"基准已保存到 {baseline_path}")
+
+    if args.check:
+        baseline = None
+        if os.path.exists(baseline_path):
+            with open(baseline_path, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        else:
+            print("没有找到基准文件，只检查准确率下限")
+        failures = check_regression(result, baseline)
+        if failures:
+            print("基准测试未通过:")
+            for failure in failures:
+                print(f"  {failure}")
+            return 1
+        print("基准测试通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
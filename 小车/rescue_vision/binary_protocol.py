@@ -0,0 +1,200 @@
+"""二进制串口协议：短帧，带命令ID、序号和CRC，可以代替文本协议（[FindBall]/[12,-3,45]）
+
+请求帧（3字节）：
+    0xA5 | 命令ID和序号 | CRC8
+回复帧（4 + 2×值个数 字节）：
+    0xA5 | 命令ID和序号 | 标志 | 值... | CRC8
+    命令ID和序号合在一个字节里：高3位为命令ID，低5位为序号（0~31循环）
+    值为int16小端，角度单位0.1度，距离单位0.1厘米（即毫米）；每种命令只发它用到的值（见COMMAND_VALUES），
+    FindTeamColor/FindBall 3个值（回复10字节），FindPlace 2个值（8字节），未知命令没有值（4字节）
+    ReloadConfig的值1为是否接受请求、值2为已完成的加载次数（同样放大10倍）
+    Snapshot的值个数不固定，在标志之后多一个字节给出值个数N：0xA5 | 命令ID和序号 | 标志 | N | N个值 | CRC8，
+    值的排列见CommandHandler.snapshot，单位和放大倍数同上
+    标志 bit0：本帧检测到目标（为0时值沿用上一次结果）；bit1：未知命令；
+        bit2~7：回复所依据画面的年龄（从取帧到回复，单位10ms，63表示≥630ms或未知），
+        只在ELECTRONIC_CONTROL_CONFIG["report_frame_age"]为True时填写
+
+9600波特率下每字节约1ms：文本协议一次FindBall往返约22字节，二进制协议13字节。
+CRC为CRC-8/SMBUS（多项式0x07，初值0x00），覆盖同步字节之后、CRC之前的所有字节。
+回复里带着请求的序号，电控可以据此丢弃过期或错位的回复；回复长度由命令ID决定，电控按发出的命令确定要读几个字节。
+"""
+import struct
+
+SYNC = 0xA5
+
+# 命令ID -> 文本命令（CommandHandler.commands里的名字），ID只有3位，最多7种命令
+COMMAND_IDS = {
+    0x01: "[FindTeamColor]",
+    0x02: "[FindBall]",
+    0x03: "[FindPlace]",
+    0x04: "[ReloadConfig]",
+    0x05: "[Snapshot]",
+}
+COMMAND_NAMES = {name: command_id for command_id, name in COMMAND_IDS.items()}
+# 命令ID -> 回复里值的个数，不在这里的命令（未知命令）回复没有值
+COMMAND_VALUES = {
+    0x01: 3,
+    0x02: 3,
+    0x03: 2,
+    0x04: 2,
+}
+VARIABLE_LENGTH_COMMANDS = {0x05}  # 回复在标志之后带值个数的命令ID
+VARIABLE_MAX_VALUES = 255
+
+COMMAND_SHIFT = 5   # 命令ID在ID字节里的起始位
+SEQ_MASK = 0x1F     # 序号占ID字节的低5位
+
+FLAG_FOUND = 0x01
+FLAG_UNKNOWN_COMMAND = 0x02
+FRAME_AGE_SHIFT = 2       # 画面年龄在标志字节里的起始位
+FRAME_AGE_UNIT_MS = 10    # 画面年龄的单位（毫秒）
+FRAME_AGE_MAX = 0x3F      # 画面年龄的最大值，同时表示未知
+
+VALUE_SCALE = 10  # 定点数放大倍数：角度0.1度，距离0.1厘米
+
+REQUEST = struct.Struct("<BBB")          # 同步字节、命令ID和序号、CRC8
+RESPONSE_HEADER = struct.Struct("<BBB")  # 同步字节、命令ID和序号、标志
+
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) if crc & 0x80 else (crc << 1)
+        table.append(crc & 0xFF)
+    return table
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc8(data, crc=0x00):
+    """CRC-8/SMBUS，查表计算"""
+    for byte in data:
+        crc = _CRC_TABLE[crc ^ byte]
+    return crc
+
+
+def pack_id(command_id, seq):
+    """命令ID和序号合成一个字节"""
+    return ((command_id & 0x07) << COMMAND_SHIFT) | (seq & SEQ_MASK)
+
+
+def unpack_id(byte):
+    """ID字节 -> (命令ID, 序号)"""
+    return byte >> COMMAND_SHIFT, byte & SEQ_MASK
+
+
+def encode_request(command_id, seq):
+    """构建请求帧（电控一侧使用，或用于测试）"""
+    id_byte = pack_id(command_id, seq)
+    return REQUEST.pack(SYNC, id_byte, crc8((id_byte,)))
+
+
+def decode_request(frame):
+    """解析请求帧，返回(命令ID, 序号)"""
+    _, id_byte, _ = REQUEST.unpack(frame)
+    return unpack_id(id_byte)
+
+
+def _to_fixed(value):
+    """转换成int16定点数，超出范围时截断"""
+    return max(-32768, min(32767, int(round(value * VALUE_SCALE))))
+
+
+def encode_frame_age(age_ms):
+    """把画面年龄（毫秒，None表示未知）编码成标志字节的bit2~7"""
+    units = FRAME_AGE_MAX if age_ms is None else min(FRAME_AGE_MAX, max(0, int(age_ms // FRAME_AGE_UNIT_MS)))
+    return units << FRAME_AGE_SHIFT
+
+
+def decode_frame_age(flags):
+    """从标志字节取出画面年龄（毫秒），未知或超出范围时返回None"""
+    units = (flags >> FRAME_AGE_SHIFT) & FRAME_AGE_MAX
+    return None if units == FRAME_AGE_MAX else units * FRAME_AGE_UNIT_MS
+
+
+def encode_response(command_id, seq, values, flags=0):
+    """构建回复帧
+
+    Args:
+        command_id: 请求的命令ID
+        seq: 请求的序号
+        values: 值列表（角度单位度，距离单位厘米），按COMMAND_VALUES截断或补0；不定长命令全部发送
+        flags: FLAG_FOUND / FLAG_UNKNOWN_COMMAND，可以再或上encode_frame_age()的结果
+    """
+    if command_id in VARIABLE_LENGTH_COMMANDS:
+        fixed = [_to_fixed(v) for v in values[:VARIABLE_MAX_VALUES]]
+        frame = RESPONSE_HEADER.pack(SYNC, pack_id(command_id, seq), flags) + bytes((len(fixed),))
+    else:
+        count = COMMAND_VALUES.get(command_id, 0)
+        fixed = [_to_fixed(v) for v in values[:count]]
+        fixed += [0] * (count - len(fixed))
+        frame = RESPONSE_HEADER.pack(SYNC, pack_id(command_id, seq), flags)
+    frame += struct.pack("<%dh" % len(fixed), *fixed)
+    return frame + bytes((crc8(frame[1:]),))
+
+
+def response_size(data):
+    """根据已收到的回复开头算出整个回复帧的长度，字节还不够判断时返回None"""
+    if len(data) < 2:
+        return None
+    command_id, _ = unpack_id(data[1])
+    if command_id in VARIABLE_LENGTH_COMMANDS:
+        if len(data) < RESPONSE_HEADER.size + 1:
+            return None
+        return RESPONSE_HEADER.size + 1 + 2 * data[RESPONSE_HEADER.size] + 1
+    return RESPONSE_HEADER.size + 2 * COMMAND_VALUES.get(command_id, 0) + 1
+
+
+def decode_response(frame):
+    """解析回复帧，返回(命令ID, 序号, 标志, [值...])，长度或CRC错误时返回None"""
+    if len(frame) < RESPONSE_HEADER.size + 1 or response_size(frame) != len(frame):
+        return None
+    sync, id_byte, flags = RESPONSE_HEADER.unpack_from(frame)
+    if sync != SYNC or crc8(frame[1:-1]) != frame[-1]:
+        return None
+    command_id, seq = unpack_id(id_byte)
+    offset = RESPONSE_HEADER.size + (1 if command_id in VARIABLE_LENGTH_COMMANDS else 0)
+    values = struct.unpack_from("<%dh" % ((len(frame) - offset - 1) // 2), frame, offset)
+    return command_id, seq, flags, [v / VALUE_SCALE for v in values]
+
+
+class FrameReader:
+    """增量解析固定长度的请求帧：按同步字节对齐，CRC错误时跳过一个字节重新对齐"""
+
+    def __init__(self, frame_struct=REQUEST):
+        self.size = frame_struct.size
+        self.buffer = bytearray()
+        self.crc_errors = 0
+
+    def feed(self, data):
+        """放入新收到的字节，返回完整且CRC正确的帧列表"""
+        self.buffer += data
+        frames = []
+        while True:
+            start = self.buffer.find(SYNC)
+            if start < 0:
+                self.buffer.clear()
+                break
+            if start:
+                del self.buffer[:start]
+            if len(self.buffer) < self.size:
+                break
+
+            frame = bytes(self.buffer[:self.size])
+            if crc8(frame[1:-1]) == frame[-1]:
+                frames.append(frame)
+                del self.buffer[:self.size]
+            else:
+                self.crc_errors += 1
+                del self.buffer[:1]
+        return frames
+
+    def read_frames(self, ser):
+        """从串口读取数据，有数据到达时立即返回，用法同SerialLineReader.read_lines"""
+        data = ser.read(ser.in_waiting or 1)
+        if not data:
+            return []
+        return self.feed(data)
@@ -1,18 +1,47 @@
 import cv2
 import time
+import threading
+from collections import namedtuple
+from vision_log import get_logger
+from jpeg_frame import JpegFrame
+
+logger = get_logger("camera")
 
 # 全局变量存储摄像头对象
 camera = None
 
+# 后台取帧线程：不断读空摄像头缓冲区，只保留最新一帧
+_grabber_thread = None
+_grabber_running = False
+_grabber_stop = None     # 通知当前取帧线程退出的Event，每个线程一个，停止超时的旧线程不会被新线程复活
+_grabber_release = None  # 置位时由取帧线程在退出前释放摄像头
+_frame_condition = threading.Condition()
+_latest_frame = None
+_latest_seq = 0          # 帧序号，每取到一帧加1
+_latest_timestamp = 0.0  # 取帧时间（time.monotonic()）
+
+# 一帧图像及其元数据：seq为帧序号，timestamp为取帧时间（time.monotonic()），source为图像来源标识
+FrameEnvelope = namedtuple("FrameEnvelope", ["frame", "seq", "timestamp", "source"])
+_source_id = None  # 当前图像来源，如"camera0"、"replay:match.mp4"
+
+# 原始MJPEG模式：不在OpenCV里解码，get_frame()返回JpegFrame，需要时才解码
+_raw_mjpeg = False
+
 # 默认配置参数
 DEFAULT_WIDTH = 640
 DEFAULT_HEIGHT = 480
 DEFAULT_FPS = 30
 DEFAULT_CAMERA_INDEX = 0
 
-def init_camera(camera_index=DEFAULT_CAMERA_INDEX, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, fps=DEFAULT_FPS):
-    """初始化摄像头"""
-    global camera
+def init_camera(camera_index=DEFAULT_CAMERA_INDEX, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, fps=DEFAULT_FPS,
+                threaded=False, raw_mjpeg=False):
+    """初始化摄像头
+    
+    threaded为True时启动后台取帧线程，get_frame()只返回最新一帧，不会拿到缓冲区里的旧帧
+    raw_mjpeg为True时读取摄像头输出的原始MJPEG数据，get_frame()返回JpegFrame（需要时才解码），
+    get_jpeg()直接返回jpeg字节；后端不支持时自动退回普通模式
+    """
+    global camera, _raw_mjpeg, _source_id
     
     # 尝试打开摄像头
     camera = cv2.VideoCapture(camera_index)
@@ -21,6 +50,7 @@ def init_camera(camera_index=DEFAULT_CAMERA_INDEX, width=DEFAULT_WIDTH, height=D
     if not camera.isOpened():
         print(f"错误: 无法打开摄像头索引 {camera_index}")
         return False
+    _source_id = f"camera{camera_index}"
     
     # 确保使用MJPG格式
     camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
@@ -30,16 +60,185 @@ def init_camera(camera_index=DEFAULT_CAMERA_INDEX, width=DEFAULT_WIDTH, height=D
     camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
     camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
     camera.set(cv2.CAP_PROP_FPS, fps)
+    # 尽量减小驱动缓冲区，避免读到排队的旧帧
+    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    
+    # 关闭OpenCV内部的解码，read()得到一维的jpeg数据（V4L2后端支持）
+    _raw_mjpeg = bool(raw_mjpeg) and camera.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    if raw_mjpeg and not _raw_mjpeg:
+        print("警告: 摄像头后端不支持原始MJPEG输出，使用普通模式")
     
     print("摄像头初始化成功")
     print(f"设置分辨率: {width}x{height}")
     print(f"设置帧率: {fps}")
+    
+    if threaded:
+        start_grabber()
     return True
 
 
-def get_frame():
-    """获取一帧图像"""
-    global camera
+def init_source(source, threaded=True):
+    """使用其他图像来源代替摄像头（如replay.ReplayCapture回放录像）
+
+    Args:
+        source: 提供read()/isOpened()/release()方法的对象，接口同cv2.VideoCapture，
+            有source_id属性时用作来源标识
+        threaded: 是否启动后台取帧线程
+    """
+    global camera, _raw_mjpeg, _source_id
+
+    if not source.isOpened():
+        print("错误: 图像来源无法打开")
+        return False
+
+    camera = source
+    _raw_mjpeg = False
+    _source_id = getattr(source, "source_id", type(source).__name__)
+    if threaded:
+        start_grabber()
+    return True
+
+
+def _wrap_frame(frame):
+    """原始MJPEG模式下把read()得到的数据包装成JpegFrame"""
+    global _raw_mjpeg
+    
+    if not _raw_mjpeg:
+        return frame
+    if frame.ndim == 3 and frame.shape[2] == 3:
+        # 后端接受了设置但仍然输出解码后的图像
+        logger.warning("摄像头仍输出解码后的图像，退回普通模式")
+        _raw_mjpeg = False
+        return frame
+    return JpegFrame(frame)
+
+
+def _grab_loop(source, stop, release):
+    """后台线程：持续读取摄像头，只保留最新一帧
+
+    source由线程自己持有：stop_grabber等待超时时线程可能还卡在read()里，
+    这时由线程在read()返回后自己释放摄像头，不能在别的线程里释放正在读取的摄像头。
+    """
+    global _latest_frame, _latest_seq, _latest_timestamp
+    
+    try:
+        while not stop.is_set():
+            ret, frame = source.read()
+            if stop.is_set():
+                break  # 停止后才返回的帧不再发布
+            if not ret:
+                time.sleep(0.005)  # 读取失败时稍等，避免空转
+                continue
+            
+            timestamp = time.monotonic()
+            frame = _wrap_frame(frame)
+            with _frame_condition:
+                _latest_frame = frame
+                _latest_seq += 1
+                _latest_timestamp = timestamp
+                _frame_condition.notify_all()
+    finally:
+        if release.is_set():
+            source.release()
+
+
+def start_grabber():
+    """启动后台取帧线程"""
+    global _grabber_thread, _grabber_running, _grabber_stop, _grabber_release
+    
+    if camera is None:
+        print("错误: 摄像头未初始化")
+        return False
+    if _grabber_thread is not None and _grabber_thread.is_alive():
+        return True
+    
+    _grabber_running = True
+    _grabber_stop = threading.Event()
+    _grabber_release = threading.Event()
+    _grabber_thread = threading.Thread(target=_grab_loop, args=(camera, _grabber_stop, _grabber_release),
+                                       name="camera-grabber", daemon=True)
+    _grabber_thread.start()
+    print("后台取帧线程已启动")
+    return True
+
+
+def stop_grabber(release=False):
+    """停止后台取帧线程
+
+    Args:
+        release: 是否由取帧线程在退出前释放摄像头（release_camera使用）
+
+    Returns:
+        bool: 线程是否已经退出；等待超时时线程仍在read()里，会在read()返回后自行退出
+    """
+    global _grabber_thread, _grabber_running
+    
+    _grabber_running = False
+    if _grabber_thread is None:
+        return True
+    if release:
+        _grabber_release.set()
+    _grabber_stop.set()
+    with _frame_condition:
+        _frame_condition.notify_all()  # 唤醒wait_for_frame里等待的线程
+    _grabber_thread.join(timeout=1.0)
+    stopped = not _grabber_thread.is_alive()
+    if not stopped:
+        logger.warning("取帧线程仍阻塞在读取中，将在读取返回后退出%s", "并释放摄像头" if release else "")
+    _grabber_thread = None
+    return stopped
+
+
+def grabber_running():
+    """后台取帧线程是否在运行"""
+    return _grabber_running
+
+
+def get_source_id():
+    """当前图像来源标识，如"camera0"，未初始化时为None"""
+    return _source_id
+
+
+def get_frame_info():
+    """获取最新一帧及其序号和取帧时间（不阻塞）
+    
+    Returns:
+        (frame, seq, timestamp): 还没有取到帧时frame为None
+    """
+    with _frame_condition:
+        return _latest_frame, _latest_seq, _latest_timestamp
+
+
+def wait_for_frame(last_seq, timeout=None):
+    """等待比last_seq更新的一帧
+    
+    Args:
+        last_seq: 已经处理过的帧序号
+        timeout: 最长等待时间（秒），None表示一直等
+        
+    Returns:
+        (frame, seq, timestamp): 超时时返回当前最新帧
+    """
+    with _frame_condition:
+        _frame_condition.wait_for(lambda: _latest_seq > last_seq or not _grabber_running, timeout)
+        return _latest_frame, _latest_seq, _latest_timestamp
+
+
+def get_envelope():
+    """获取一帧图像及其序号、取帧时间和来源
+    
+    后台取帧线程运行时直接返回最新一帧（不阻塞、不排队），否则同步读取摄像头
+    
+    Returns:
+        FrameEnvelope，没有图像时返回None
+    """
+    global _latest_frame, _latest_seq, _latest_timestamp
+    
+    if _grabber_running:
+        with _frame_condition:
+            if _latest_frame is None:
+                return None
+            return FrameEnvelope(_latest_frame, _latest_seq, _latest_timestamp, _source_id)
     
     if camera is None:
         print("错误: 摄像头未初始化")
@@ -49,18 +248,56 @@ def get_frame():
     ret, frame = camera.read()
     
     if not ret:
-        print("无法获取图像帧")
+        logger.warning("无法获取图像帧")
         return None
     
-    return frame
+    # 同步读取时也编号，序号的间隔就是两次读取之间没有用到的帧（驱动缓冲区里的帧不计）
+    timestamp = time.monotonic()
+    frame = _wrap_frame(frame)
+    with _frame_condition:
+        _latest_frame = frame
+        _latest_seq += 1
+        _latest_timestamp = timestamp
+        return FrameEnvelope(frame, _latest_seq, timestamp, _source_id)
+
+
+def get_frame():
+    """获取一帧图像（不带元数据），同get_envelope()"""
+    envelope = get_envelope()
+    return None if envelope is None else envelope.frame
+
+
+def get_jpeg(quality=90):
+    """获取最新一帧的jpeg数据，用于推流
+    
+    原始MJPEG模式下直接返回摄像头输出的数据，不解码也不重新编码；普通模式下用cv2.imencode编码
+    
+    Returns:
+        jpeg字节，没有图像时返回None
+    """
+    frame = get_frame()
+    if frame is None:
+        return None
+    if isinstance(frame, JpegFrame):
+        return frame.jpeg
+    ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return data.tobytes() if ok else None
 
 
 def release_camera():
     """释放摄像头资源"""
     global camera
     
-    if camera is not None:
+    if camera is None:
+        stop_grabber()
+        return
+    if _grabber_thread is None:
         camera.release()
-        camera = None
+        released = True
+    else:
+        # 由取帧线程释放，保证不会在read()进行中释放摄像头
+        released = stop_grabber(release=True)
+    camera = None
+    if released:
         print("摄像头资源已释放")
 
@@ -0,0 +1,283 @@
+"""相机模型：把检测到的像素坐标换算成相对光轴的水平/垂直角度
+
+- linear：偏移 × 视场角 / 分辨率，和原来的算法一样，广角镜头在图像边缘误差较大
+- undistort：用标定的内参和畸变系数对检测到的点调用cv2.undistortPoints，只处理几个点，不校正整幅图像
+- table：由标定结果预先算出每个像素的角度，保存成.npy文件，以内存映射方式加载，检测时双线性插值查表
+
+角度约定：水平角度向右为正，垂直角度向上为正，单位度。
+
+用法（标定）：
+    python camera_model.py --calibrate 棋盘格图片目录 --board 9x6 --square 25   # 生成camera_calibration.npz
+    python camera_model.py --compare                                            # 比较linear和标定结果的角度差
+"""
+import argparse
+import glob
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+from config import CAMERA_CONFIG, CAMERA_MODEL_CONFIG
+from vision_log import get_logger
+
+logger = get_logger("camera_model")
+
+MODES = ("linear", "undistort", "table")
+
+
+def _local_path(path):
+    """相对路径按本目录计算"""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+
+def load_calibration(path, resolution=None):
+    """读取标定结果，返回(内参矩阵, 畸变系数)；标定时的分辨率和resolution不同时按比例缩放内参
+
+    文件不存在时返回None
+    """
+    if not os.path.exists(path):
+        return None
+    data = np.load(path)
+    camera_matrix = data["camera_matrix"].astype(np.float64)
+    dist_coeffs = data["dist_coeffs"].astype(np.float64)
+    if resolution is not None and "resolution" in data:
+        calib_width, calib_height = data["resolution"]
+        sx, sy = resolution[0] / calib_width, resolution[1] / calib_height
+        camera_matrix = camera_matrix.copy()
+        camera_matrix[0, :] *= sx
+        camera_matrix[1, :] *= sy
+    return camera_matrix, dist_coeffs
+
+
+def normalized_to_angles(x, y):
+    """去畸变后的归一化坐标（x向右、y向下）-> (水平角度, 垂直角度)，支持numpy数组"""
+    horizontal = np.degrees(np.arctan(x))
+    vertical = np.degrees(np.arctan2(-y, np.hypot(1.0, x)))
+    return horizontal, vertical
+
+
+class CameraModel:
+    """像素坐标 -> 角度，模式见CAMERA_MODEL_CONFIG"""
+
+    def __init__(self, mode=None, resolution=None, horizontal_fov=None, vertical_fov=None,
+                 calibration_path=None, table_path=None):
+        """
+        Args:
+            mode: "linear"、"undistort"或"table"，默认CAMERA_MODEL_CONFIG["mode"]；没有标定结果时退回linear
+            resolution: 图像分辨率(宽, 高)，默认CAMERA_CONFIG["resolution"]
+            horizontal_fov/vertical_fov: linear模式的视场角（度）
+            calibration_path/table_path: 标定结果和角度表文件
+        """
+        self.resolution = tuple(resolution or CAMERA_CONFIG["resolution"])
+        self.horizontal_fov = horizontal_fov or CAMERA_CONFIG.get("horizontal_fov", 60)
+        self.vertical_fov = vertical_fov or CAMERA_CONFIG.get("vertical_fov", 45)
+        self.center_x = self.resolution[0] / 2
+        self.center_y = self.resolution[1] / 2
+
+        self.mode = mode or CAMERA_MODEL_CONFIG.get("mode", "linear")
+        if self.mode not in MODES:
+            logger.warning("未知的相机模型%s，使用linear", self.mode)
+            self.mode = "linear"
+        self.camera_matrix = None
+        self.dist_coeffs = None
+        self.table = None
+
+        if self.mode != "linear":
+            path = _local_path(calibration_path or CAMERA_MODEL_CONFIG.get("calibration_path", "camera_calibration.npz"))
+            calibration = load_calibration(path, self.resolution)
+            if calibration is None:
+                logger.warning("没有找到标定结果%s，角度按linear计算", path)
+                self.mode = "linear"
+            else:
+                self.camera_matrix, self.dist_coeffs = calibration
+        if self.mode == "table":
+            path = _local_path(table_path or CAMERA_MODEL_CONFIG.get("bearing_table_path", "bearing_table.npy"))
+            self.table = self.load_or_build_table(path)
+
+    def angles(self, cx, cy):
+        """计算一个点相对光轴的(水平角度, 垂直角度)"""
+        if self.mode == "table":
+            return self._lookup(cx, cy)
+        if self.mode == "undistort":
+            horizontal, vertical = self.angles_many(np.array([[cx, cy]], dtype=np.float64))
+            return float(horizontal[0]), float(vertical[0])
+
+        # 水平方向偏移 × 每像素对应的角度
+        horizontal_angle = (cx - self.center_x) * self.horizontal_fov / self.resolution[0]
+        # 垂直方向偏移（上为正，下为负）
+        vertical_angle = (self.center_y - cy) * self.vertical_fov / self.resolution[1]
+        return horizontal_angle, vertical_angle
+
+    def angles_many(self, points):
+        """批量计算角度
+
+        Args:
+            points: (N, 2)的像素坐标数组
+
+        Returns:
+            (水平角度数组, 垂直角度数组)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.mode == "linear":
+            return ((points[:, 0] - self.center_x) * self.horizontal_fov / self.resolution[0],
+                    (self.center_y - points[:, 1]) * self.vertical_fov / self.resolution[1])
+        if self.mode == "table":
+            height, width = self.table.shape[:2]
+            x = np.clip(points[:, 0], 0, width - 1)
+            y = np.clip(points[:, 1], 0, height - 1)
+            x0 = np.minimum(x.astype(int), width - 2)
+            y0 = np.minimum(y.astype(int), height - 2)
+            fx, fy = (x - x0)[:, None], (y - y0)[:, None]
+            t = self.table
+            value = ((t[y0, x0] * (1 - fx) + t[y0, x0 + 1] * fx) * (1 - fy)
+                     + (t[y0 + 1, x0] * (1 - fx) + t[y0 + 1, x0 + 1] * fx) * fy)
+            return value[:, 0].astype(np.float64), value[:, 1].astype(np.float64)
+        normalized = cv2.undistortPoints(points.reshape(-1, 1, 2), self.camera_matrix, self.dist_coeffs)
+        return normalized_to_angles(normalized[:, 0, 0], normalized[:, 0, 1])
+
+    def _lookup(self, cx, cy):
+        """在角度表上双线性插值"""
+        table = self.table
+        height, width = table.shape[:2]
+        x = min(max(float(cx), 0.0), width - 1.0)
+        y = min(max(float(cy), 0.0), height - 1.0)
+        x0, y0 = min(int(x), width - 2), min(int(y), height - 2)
+        fx, fy = x - x0, y - y0
+        w00, w01, w10, w11 = (1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy
+        # 单个点用item()逐个取值，比numpy的小数组运算快
+        item = table.item
+        return tuple(w00 * item(y0, x0, i) + w01 * item(y0, x0 + 1, i)
+                     + w10 * item(y0 + 1, x0, i) + w11 * item(y0 + 1, x0 + 1, i) for i in (0, 1))
+
+    def build_table(self):
+        """对每个像素中心做一次undistortPoints，得到(高, 宽, 2)的角度表（float32，度）"""
+        width, height = self.resolution
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+        points = np.stack([xs.ravel(), ys.ravel()], axis=1).reshape(-1, 1, 2)
+        normalized = cv2.undistortPoints(points, self.camera_matrix, self.dist_coeffs)
+        horizontal, vertical = normalized_to_angles(normalized[:, 0, 0], normalized[:, 0, 1])
+        return np.stack([horizontal, vertical], axis=1).reshape(height, width, 2).astype(np.float32)
+
+    def signature(self):
+        """标定参数和分辨率的文本签名，用于判断保存的角度表是否过期"""
+        return json.dumps({
+            "resolution": list(self.resolution),
+            "camera_matrix": np.round(self.camera_matrix, 6).tolist(),
+            "dist_coeffs": np.round(self.dist_coeffs, 8).ravel().tolist(),
+        }, sort_keys=True)
+
+    def load_or_build_table(self, path):
+        """以内存映射方式加载角度表，文件不存在或标定结果、分辨率变化时重新生成并保存"""
+        signature_path = os.path.splitext(path)[0] + ".json"
+        if os.path.exists(path) and os.path.exists(signature_path):
+            with open(signature_path, "r", encoding="utf-8") as f:
+                saved_signature = f.read()
+            table = np.load(path, mmap_mode="r")
+            if saved_signature == self.signature() and table.shape == (self.resolution[1], self.resolution[0], 2):
+                return table
+
+        table = self.build_table()
+        try:
+            # 其他进程可能正以内存映射方式读着旧表，先写临时文件再原子替换，不会读到写了一半的表；
+            # 先删掉签名，中途出错时不会让旧签名配上新表
+            if os.path.exists(signature_path):
+                os.remove(signature_path)
+            _replace_file(path, "wb", lambda f: np.save(f, table))
+            _replace_file(signature_path, "w", lambda f: f.write(self.signature()))
+        except OSError as e:
+            logger.warning("保存角度表失败: %s", e)
+        return table
+
+
+def _replace_file(path, mode, write):
+    """把write(f)写出的内容先写到同目录的临时文件，再用os.replace原子地替换path"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=None if "b" in mode else "utf-8") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def calibrate(image_dir, board=(9, 6), square=25.0):
+    """用棋盘格图片标定相机
+
+    Args:
+        image_dir: 图片目录（jpg/png）
+        board: 棋盘格内角点数(列, 行)
+        square: 格子边长（毫米），只影响外参，不影响角度计算
+
+    Returns:
+        (重投影误差, 内参矩阵, 畸变系数, 分辨率)，可用的图片少于3张时返回None
+    """
+    pattern = np.zeros((board[0] * board[1], 3), np.float32)
+    pattern[:, :2] = np.mgrid[0:board[0], 0:board[1]].T.reshape(-1, 2) * square
+
+    object_points, image_points, resolution = [], [], None
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    names = sorted(glob.glob(os.path.join(image_dir, "*.jpg")) + glob.glob(os.path.join(image_dir, "*.png")))
+    for name in names:
+        gray = cv2.imread(name, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        found, corners = cv2.findChessboardCorners(gray, board)
+        if not found:
+            print(f"未找到棋盘格: {name}")
+            continue
+        corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+        object_points.append(pattern)
+        image_points.append(corners)
+        resolution = (gray.shape[1], gray.shape[0])
+
+    if len(image_points) < 3:
+        return None
+    rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(object_points, image_points, resolution, None, None)
+    return rms, camera_matrix, dist_coeffs, resolution
+
+
+def main():
+    parser = argparse.ArgumentParser(description="相机标定和角度模型检查")
+    parser.add_argument("--calibrate", metavar="DIR", help="用目录里的棋盘格图片标定，结果写入calibration_path")
+    parser.add_argument("--board", default="9x6", help="棋盘格内角点数，列x行")
+    parser.add_argument("--square", type=float, default=25.0, help="格子边长（毫米）")
+    parser.add_argument("--compare", action="store_true", help="打印linear和标定模型在图像各处的角度差")
+    args = parser.parse_args()
+
+    calibration_path = _local_path(CAMERA_MODEL_CONFIG.get("calibration_path", "camera_calibration.npz"))
+    if args.calibrate:
+        board = tuple(int(v) for v in args.board.lower().split("x"))
+        result = calibrate(args.calibrate, board, args.square)
+        if result is None:
+            print("可用的棋盘格图片少于3张，标定失败")
+            return
+        rms, camera_matrix, dist_coeffs, resolution = result
+        np.savez(calibration_path, camera_matrix=camera_matrix, dist_coeffs=dist_coeffs,
+                 resolution=np.array(resolution))
+        fov_x = 2 * math.degrees(math.atan(resolution[0] / (2 * camera_matrix[0, 0])))
+        fov_y = 2 * math.degrees(math.atan(resolution[1] / (2 * camera_matrix[1, 1])))
+        print(f"标定完成: 重投影误差={rms:.3f}px 分辨率={resolution} 等效视场角={fov_x:.1f}°x{fov_y:.1f}°")
+        print(f"已保存到 {calibration_path}")
+
+    if args.compare:
+        linear = CameraModel("linear")
+        calibrated = CameraModel("undistort")
+        if calibrated.mode != "undistort":
+            print("没有标定结果，无法比较")
+            return
+        width, height = linear.resolution
+        for x, y in ((width / 2, height / 2), (width * 0.75, height / 2), (width - 1, height / 2),
+                     (width - 1, height - 1), (0, 0)):
+            lh, lv = linear.angles(x, y)
+            ch, cv = calibrated.angles(x, y)
+            print(f"({x:.0f}, {y:.0f}): linear=({lh:.1f}°, {lv:.1f}°) 标定=({ch:.1f}°, {cv:.1f}°)")
+
+
+if __name__ == "__main__":
+    main()
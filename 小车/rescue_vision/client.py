@@ -1,5 +1,8 @@
 """在本地电脑运行"""
 import socket
+import struct
+import threading
+import time
 import cv2
 import numpy as np
 
@@ -37,13 +40,139 @@ class ReceiveImg(object):
             print("Error：连接出错！")
 
 
+class FrameReceiver(object):
+    """按服务端的长度前缀格式（<L长度 + jpeg数据 + <L 0）接收图像
+
+    * 用recv_into直接读进预先分配好的缓冲区，不拼接bytes，也不用搜索jpeg帧头帧尾
+    * 接收和解码分开在两个线程：解码来不及时只解码最新一帧，旧帧计为丢弃
+    * 三个缓冲区轮流使用：一个在接收、一个等待解码、一个在解码，互不覆盖"""
+
+    def __init__(self, host, port, buffer_size=1 << 20):
+        """初始化
+        * host: 树莓派的IP地址
+        * port: 端口号，与树莓派设置的端口号一致
+        * buffer_size: 单帧缓冲区初始大小，收到更大的帧时自动扩大"""
+        self.sock = socket.create_connection((host, port))
+        self.header = bytearray(4)
+        self.free_buffers = [bytearray(buffer_size) for _ in range(3)]
+
+        self.lock = threading.Condition()
+        self.pending = None                # 等待解码的(缓冲区, 长度)
+        self.image = None                  # 最新解码出的图像
+        self.image_seq = 0
+        self.read_seq = 0
+        self.running = True
+
+        # 统计
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.frames_decoded = 0
+        self.frames_dropped = 0
+        self._last_stats = (time.monotonic(), 0, 0, 0)
+
+        threading.Thread(target=self._receive_loop, name="receive", daemon=True).start()
+        threading.Thread(target=self._decode_loop, name="decode", daemon=True).start()
+
+        print(" ")
+        print("已连接到服务端：")
+        print("Host : ", host)
+        print("请按‘q’退出图像传输!")
+
+    def _recv_exact(self, view):
+        """把view填满，连接断开时抛出ConnectionError"""
+        received = 0
+        while received < len(view):
+            n = self.sock.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionError("服务端已断开")
+            received += n
+
+    def _receive_loop(self):
+        try:
+            while self.running:
+                self._recv_exact(memoryview(self.header))
+                length = struct.unpack('<L', self.header)[0]
+                if length == 0:
+                    continue                                        # 帧尾
+
+                with self.lock:
+                    buffer = self.free_buffers.pop()
+                if len(buffer) < length:
+                    buffer = bytearray(length * 2)
+                self._recv_exact(memoryview(buffer)[:length])
+                self.frames_received += 1
+                self.bytes_received += length + 8
+
+                with self.lock:
+                    if self.pending is not None:
+                        # 上一帧还没来得及解码，丢弃它，只解码最新的
+                        self.free_buffers.append(self.pending[0])
+                        self.frames_dropped += 1
+                    self.pending = (buffer, length)
+                    self.lock.notify_all()
+        except (ConnectionError, OSError) as e:
+            print("Error：连接出错！", e)
+        finally:
+            with self.lock:
+                self.running = False
+                self.lock.notify_all()
+
+    def _decode_loop(self):
+        while True:
+            with self.lock:
+                self.lock.wait_for(lambda: self.pending is not None or not self.running)
+                if self.pending is None:
+                    return
+                buffer, length = self.pending
+                self.pending = None
+
+            image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8, count=length), cv2.IMREAD_COLOR)
+            with self.lock:
+                self.free_buffers.append(buffer)
+                if image is not None:
+                    self.image = image
+                    self.image_seq += 1
+                    self.frames_decoded += 1
+                    self.lock.notify_all()
+
+    def read(self, timeout=1.0):
+        """等待并返回一帧新图像，超时或连接断开时返回None"""
+        with self.lock:
+            self.lock.wait_for(lambda: self.image_seq > self.read_seq or not self.running, timeout)
+            if self.image_seq == self.read_seq:
+                return None
+            self.read_seq = self.image_seq
+            return self.image
+
+    def stats(self):
+        """返回上次调用以来的 (接收帧率, 码率Mbps, 解码帧率, 累计丢弃帧数)"""
+        now = time.monotonic()
+        last_time, last_frames, last_bytes, last_decoded = self._last_stats
+        elapsed = max(now - last_time, 1e-6)
+        self._last_stats = (now, self.frames_received, self.bytes_received, self.frames_decoded)
+        return ((self.frames_received - last_frames) / elapsed,
+                (self.bytes_received - last_bytes) * 8 / elapsed / 1e6,
+                (self.frames_decoded - last_decoded) / elapsed,
+                self.frames_dropped)
+
+    def close(self):
+        self.running = False
+        self.sock.close()
+
+
 if __name__ == '__main__':
     # TODO: 将下面的IP地址改为发送端的IP地址
-    reveiver = ReceiveImg('192.168.137.112', 8000)
-    while True:
-        img = reveiver.read()
+    receiver = FrameReceiver('192.168.137.112', 8000)
+    last_report = time.monotonic()
+    while receiver.running:
+        img = receiver.read()
         if img is None:
             continue
         cv2.imshow('ori', img)
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
+        if time.monotonic() - last_report >= 1.0:
+            last_report = time.monotonic()
+            fps, mbps, decoded, dropped = receiver.stats()
+            print(f"接收 {fps:.1f} 帧/秒  {mbps:.2f} Mbps  解码 {decoded:.1f} 帧/秒  丢弃 {dropped} 帧")
+    receiver.close()
@@ -0,0 +1,436 @@
+import logging
+import re
+import time
+from collections import deque
+
+from config import ELECTRONIC_CONTROL_CONFIG, COMMAND_LATENCY_BUDGET, SNAPSHOT_CONFIG, TRACKER_CONFIG
+from ball_tracker import BallTracker
+from binary_protocol import (COMMAND_IDS, FLAG_FOUND, FLAG_UNKNOWN_COMMAND, decode_request, encode_frame_age,
+                             encode_response)
+from camera_capture import FrameEnvelope
+from camera_model import CameraModel
+from vision_log import get_logger
+
+logger = get_logger("command")
+
+DEFAULT_RESPONSE = "[0,0,0]"  # 未识别命令时的默认回复
+LATENCY_REPORT_INTERVAL = 50  # 每处理多少条命令打印一次延迟统计
+
+
+class SerialLineReader:
+    """增量读取串口数据，收到换行符就立即切出一条完整命令"""
+
+    def __init__(self, max_line_length=256):
+        self.buffer = bytearray()
+        self.max_line_length = max_line_length  # 没有换行的数据超过这个长度就丢弃，防止乱码堆积
+
+    def feed(self, data):
+        """放入新收到的字节，返回已经完整的命令行列表"""
+        self.buffer += data
+        lines = []
+        while True:
+            end = self.buffer.find(b"\n")
+            if end < 0:
+                break
+            line = bytes(self.buffer[:end])
+            del self.buffer[:end + 1]
+            lines.append(line.decode("utf-8", errors="ignore").strip())
+        if len(self.buffer) > self.max_line_length:
+            self.buffer.clear()
+        return lines
+
+    def read_lines(self, ser):
+        """从串口读取数据，有数据到达时立即返回
+
+        没有数据时阻塞在ser.read()里等待（不占CPU），最长等待串口的timeout时间
+        """
+        data = ser.read(ser.in_waiting or 1)
+        if not data:
+            return []
+        return self.feed(data)
+
+
+class LatencyStats:
+    """记录每种命令最近一段时间的处理延迟，并和延迟预算比较"""
+
+    def __init__(self, budgets=None, window=200):
+        self.budgets = budgets if budgets is not None else COMMAND_LATENCY_BUDGET
+        self.window = window
+        self.samples = {}      # {命令: deque(延迟毫秒)}
+        self.over_budget = {}  # {命令: 超出预算的次数}
+
+    def record(self, command, elapsed_ms):
+        """记录一次命令延迟，超出预算时返回True"""
+        if command not in self.samples:
+            self.samples[command] = deque(maxlen=self.window)
+            self.over_budget[command] = 0
+        self.samples[command].append(elapsed_ms)
+        budget = self.budgets.get(command)
+        if budget is not None and elapsed_ms > budget:
+            self.over_budget[command] += 1
+            return True
+        return False
+
+    def summary(self):
+        """返回 {命令: {"count", "p50", "p95", "max", "budget", "over_budget"}}"""
+        result = {}
+        for command, samples in self.samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            result[command] = {
+                "count": n,
+                "p50": ordered[n // 2],
+                "p95": ordered[min(n - 1, int(n * 0.95))],
+                "max": ordered[-1],
+                "budget": self.budgets.get(command),
+                "over_budget": self.over_budget[command],
+            }
+        return result
+
+    def format_summary(self):
+        lines = []
+        for command, s in self.summary().items():
+            lines.append(f"{command}: 次数={s['count']} p50={s['p50']:.1f}ms p95={s['p95']:.1f}ms "
+                         f"最大={s['max']:.1f}ms 预算={s['budget']}ms 超预算={s['over_budget']}")
+        return "\n".join(lines)
+
+
+class FrameLatencyStats:
+    """命令所用画面的取帧→检测→回复各段延迟（毫秒），以及两条命令之间没有用到的帧数"""
+
+    STAGES = ("取帧→检测", "检测→回复", "取帧→回复")
+
+    def __init__(self, window=200):
+        self.latency = LatencyStats(budgets={}, window=window)
+        self.last_seq = None
+        self.frames_used = 0     # 用到的不同帧数
+        self.frames_skipped = 0  # 序号间隔里没有用到的帧数
+        self.frames_reused = 0   # 和上一条命令用同一帧的次数
+
+    def record(self, seq, capture_time, detect_time, reply_time):
+        """记录一条命令所用画面的各个时间点（time.monotonic()）"""
+        if self.last_seq is not None and seq == self.last_seq:
+            self.frames_reused += 1
+        else:
+            if self.last_seq is not None and seq > self.last_seq:
+                self.frames_skipped += seq - self.last_seq - 1
+            self.frames_used += 1
+        self.last_seq = seq
+
+        capture_to_detect, detect_to_reply, capture_to_reply = self.STAGES
+        self.latency.record(capture_to_detect, (detect_time - capture_time) * 1000)
+        self.latency.record(detect_to_reply, (reply_time - detect_time) * 1000)
+        self.latency.record(capture_to_reply, (reply_time - capture_time) * 1000)
+
+    def format_summary(self):
+        lines = [f"{stage}: p50={s['p50']:.1f}ms p95={s['p95']:.1f}ms 最大={s['max']:.1f}ms"
+                 for stage, s in self.latency.summary().items()]
+        lines.append(f"用到帧数={self.frames_used} 跳过帧数={self.frames_skipped} 重复使用={self.frames_reused}")
+        return "\n".join(lines)
+
+
+class CommandHandler:
+    """处理电控发来的串口命令，返回要回复的字符串"""
+
+    def __init__(self, detector, team_color, frame_source, worker=None, reloader=None, camera_model=None):
+        """
+        Args:
+            detector: ObjectDetector对象
+            team_color: 队伍颜色
+            frame_source: 无参数函数，返回当前最新一帧（如camera_capture.get_frame），
+                返回FrameEnvelope（如camera_capture.get_envelope）时统计画面延迟和跳过的帧数
+            worker: 可选的DetectionWorker或mp_pipeline.DetectionPipeline，设置后直接使用后台检测的缓存结果回复
+            reloader: 可选的config_reload.DetectorReloader，用于响应[ReloadConfig]命令
+            camera_model: 像素坐标换算角度的camera_model.CameraModel，默认按CAMERA_MODEL_CONFIG创建
+        """
+        self.detector = detector
+        self.team_color = team_color
+        self.frame_source = frame_source
+        self.worker = worker
+        self.reloader = reloader
+        self.camera_model = camera_model or CameraModel()
+        self.result = None  # 当前命令使用的后台检测结果（只在worker模式下使用）
+        self.latency = LatencyStats()
+        self.frame_latency = FrameLatencyStats()
+        self.report_frame_age = ELECTRONIC_CONTROL_CONFIG.get("report_frame_age", False)
+        self.frame_seq = None       # 当前命令所用画面的序号和来源，没有画面时为None
+        self.frame_source_id = None
+        self.frame_age_ms = None    # 当前命令所用画面从取帧到检测完成的时间（毫秒），随回复发送
+        self.frame_envelope = None  # 当前命令所用画面（FrameEnvelope或DetectionResult）和检测完成时间，回复后记录延迟
+        self.frame_detect_time = None
+        self.frame_timestamp = None  # 当前命令所用画面的取帧时间（time.monotonic()）
+
+        self.ball_info = [0, 0, 0]  # [水平角度,垂直角度,距离]，没找到球时沿用上一次的结果
+        self.safe_zone_angle = 0    # 安全区角度，没找到安全区时沿用上一次的结果
+        self.safe_zone_distance = 0  # 安全区距离（厘米）
+        self.found = False          # 最近一条命令是否在当前帧里找到了目标（二进制协议的标志位）
+
+        # [Snapshot]返回的球颜色（按顺序）和每种颜色的球数
+        self.snapshot_colors = list(SNAPSHOT_CONFIG.get("colors") or (team_color, "black", "yellow"))
+        self.snapshot_top_k = SNAPSHOT_CONFIG.get("top_k", 2)
+
+        # 跟踪模式：每种球颜色一个跟踪器，只在球附近的小区域内检测（worker模式下不使用）
+        self.trackers = {}
+        if TRACKER_CONFIG.get("enabled", False) and worker is None:
+            self.trackers = {color: BallTracker(detector, color) for color in (team_color, "black", "yellow")}
+
+        # 命令 -> 处理函数
+        self.commands = [
+            ("[FindTeamColor]", self.find_team_color),
+            ("[FindBall]", self.find_ball),
+            ("[FindPlace]", self.find_place),
+            ("[ReloadConfig]", self.reload_config),
+            ("[Snapshot]", self.snapshot),
+        ]
+        self.command_funcs = dict(self.commands)
+        self.frameless_commands = {"[ReloadConfig]"}  # 不需要图像的命令，不取帧也不等待检测结果
+        # 文本命令，可以带最长可用时间（毫秒），如[FindBall:200]
+        names = "|".join(re.escape(command[1:-1]) for command, _ in self.commands)
+        self.command_pattern = re.compile(r"\[(%s)(?::(\d+))?\]" % names)
+
+    def execute(self, command, func, max_age_ms=None):
+        """取最新一帧（或后台检测结果）运行命令的处理函数，记录延迟，返回值列表"""
+        start = time.perf_counter()
+        self.found = False
+        envelope = None
+        if command in self.frameless_commands:
+            frame = None
+        elif self.worker is not None:
+            # worker模式下处理函数只用frame判断有没有结果，检测结果从self.result里取
+            self.result = self.worker.get(max_age_ms)
+            frame = envelope = self.result
+        else:
+            frame = self.frame_source()
+            if isinstance(frame, FrameEnvelope):
+                envelope, frame = frame, frame.frame
+        # 跟踪器按取帧时间计算两帧之间的时间间隔；frame_source只返回图像时为None，由跟踪器取当前时间
+        self.frame_timestamp = envelope.timestamp if envelope is not None else None
+        values = func(frame)
+        self.set_frame(envelope, time.monotonic())
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if self.latency.record(command, elapsed_ms):
+            logger.warning("%s处理耗时%.1fms，超出预算%sms", command, elapsed_ms, self.latency.budgets[command])
+        return values
+
+    def set_frame(self, envelope, finished):
+        """记下当前命令所用画面的序号、来源和年龄
+
+        envelope为FrameEnvelope或DetectionResult；DetectionResult带有后台检测完成的时间，
+        FrameEnvelope是收到命令后现场检测的，检测完成时间为处理函数返回的时间finished
+        """
+        self.frame_envelope = envelope
+        if envelope is None:
+            self.frame_seq = self.frame_source_id = self.frame_age_ms = self.frame_detect_time = None
+            return
+        self.frame_detect_time = getattr(envelope, "detect_time", None) or finished
+        self.frame_seq = envelope.seq
+        self.frame_source_id = envelope.source
+        self.frame_age_ms = (finished - envelope.timestamp) * 1000
+
+    def record_frame(self):
+        """回复构建完成后记录当前命令所用画面的取帧→检测→回复延迟"""
+        envelope = self.frame_envelope
+        if envelope is not None:
+            self.frame_latency.record(envelope.seq, envelope.timestamp, self.frame_detect_time, time.monotonic())
+
+    def frame_note(self):
+        """当前命令所用画面的说明，用于日志"""
+        if self.frame_seq is None:
+            return "无画面"
+        return f"{self.frame_source_id}第{self.frame_seq}帧，距取帧{self.frame_age_ms:.0f}ms"
+
+    def handle(self, line):
+        """处理一条文本命令，返回回复字符串"""
+        match = self.command_pattern.search(line)
+        if match is not None:
+            command = f"[{match.group(1)}]"
+            max_age_ms = int(match.group(2)) if match.group(2) else None
+            values = self.execute(command, self.command_funcs[command], max_age_ms)
+            if self.report_frame_age:
+                # 没有画面时年龄为-1
+                values = values + [self.frame_age_ms if self.frame_age_ms is not None else -1]
+            response = format_response(values)
+            self.record_frame()
+            logger.debug("收到%s命令（%s），发送响应: %s", command, self.frame_note(), response)
+            return response
+
+        logger.debug("未识别命令%r，发送默认响应: %s", line, DEFAULT_RESPONSE)
+        return DEFAULT_RESPONSE
+
+    def handle_frame(self, frame):
+        """处理一个二进制请求帧（见binary_protocol），返回回复帧"""
+        command_id, seq = decode_request(frame)
+        command = COMMAND_IDS.get(command_id)
+        func = self.command_funcs.get(command)
+        if func is None:
+            logger.debug("未知命令ID 0x%02X（序号%d）", command_id, seq)
+            return encode_response(command_id, seq, [], FLAG_UNKNOWN_COMMAND)
+
+        values = self.execute(command, func)
+        flags = FLAG_FOUND if self.found else 0
+        if self.report_frame_age:
+            flags |= encode_frame_age(self.frame_age_ms)
+        response = encode_response(command_id, seq, values, flags)
+        self.record_frame()
+        logger.debug("收到%s命令（序号%d，%s），发送响应: %s", command, seq, self.frame_note(), values)
+        return response
+
+    def set_detector(self, detector):
+        """换用新的检测器（热加载），正在处理的命令继续用原来的检测器，下一条命令起生效
+
+        跟踪器保留已有的轨迹，只换检测器
+        """
+        self.detector = detector
+        for tracker in self.trackers.values():
+            tracker.detector = detector
+
+    def ball_angles(self, cx, cy):
+        """计算目标中心相对于光轴的水平和垂直角度（度），标定过的相机会校正镜头畸变"""
+        return self.camera_model.angles(cx, cy)
+
+    def detect_balls(self, frame, color):
+        """检测某种颜色的球，返回按距离排序的(中心x, 中心y, 距离)列表
+
+        worker模式下直接取后台检测结果，跟踪模式下使用跟踪器
+        """
+        if self.result is not None:
+            return self.result.balls.get(color, [])
+        if color in self.trackers:
+            return self.trackers[color].update(frame, self.frame_timestamp)
+        balls, _ = self.detector.detect_color(frame, color)
+        return balls
+
+    def detect_scene(self, frame, colors):
+        """检测多种颜色的球和安全区，返回({颜色: 按距离排序的(中心x, 中心y, 距离)列表}, 安全区)
+
+        现场检测时球和安全区共用一次滤波和HSV转换（ObjectDetector.detect_scene）；
+        worker模式下直接取后台检测结果，跟踪模式下球由跟踪器检测
+        """
+        if self.result is not None or self.trackers:
+            return {color: self.detect_balls(frame, color) for color in colors}, self.detect_safe_zone(frame)
+        return self.detector.detect_scene(frame, colors, self.team_color)
+
+    def detect_safe_zone(self, frame):
+        """检测队伍颜色的安全区，返回(位置, 面积)"""
+        if self.result is not None:
+            return self.result.safe_zone
+        return self.detector.detect_safe_zone(frame, self.team_color)
+
+    def closest_ball_info(self, balls):
+        """把最近的球转换成[水平角度,垂直角度,距离(厘米)]，保留小数，发送时再按协议取整或转定点数"""
+        cx, cy, distance = min(balls, key=lambda x: x[2])[:3]
+        horizontal_angle, vertical_angle = self.ball_angles(cx, cy)
+        self.found = True
+        return [horizontal_angle, vertical_angle, distance / 10.0]
+
+    def find_team_color(self, frame):
+        """[FindTeamColor]：只找队伍颜色的球，没找到回复[0,0,0]"""
+        self.ball_info = [0, 0, 0]
+        if frame is not None:
+            balls = self.detect_balls(frame, self.team_color)
+            if balls:
+                self.ball_info = self.closest_ball_info(balls)
+        return self.ball_info
+
+    def find_ball(self, frame):
+        """[FindBall]：先找队伍颜色，再按配置找黑色，最后找黄色"""
+        if frame is None:
+            return self.ball_info
+
+        balls = self.detect_balls(frame, self.team_color)
+
+        # 如果没有检测到队伍颜色的球，尝试黑色球
+        if not balls and ELECTRONIC_CONTROL_CONFIG.get("prioritize_black", False):
+            balls = self.detect_balls(frame, "black")
+
+        # 如果还是没有检测到球，尝试黄色球
+        if not balls:
+            balls = self.detect_balls(frame, "yellow")
+
+        if balls:
+            self.ball_info = self.closest_ball_info(balls)
+        return self.ball_info
+
+    def find_place(self, frame):
+        """[FindPlace]：检测安全区，返回[角度,距离(厘米)]"""
+        if frame is not None:
+            self.found = self.update_safe_zone(frame)
+        return [self.safe_zone_angle, self.safe_zone_distance]
+
+    def update_safe_zone(self, frame, detected=None):
+        """检测安全区并更新self.safe_zone_angle/safe_zone_distance，返回是否找到；没找到时沿用上一次的结果
+
+        detected为已经检测好的(位置, 面积)时直接使用
+        """
+        safe_zone, contour_area = detected if detected is not None else self.detect_safe_zone(frame)
+        if safe_zone is not None:
+            x, y, w, h = safe_zone  # 安全区的坐标和大小 [x,y,width,height]
+            cx = x + w // 2  # 安全区中心x坐标
+            cy = y + h // 2  # 安全区中心y坐标
+            self.safe_zone_angle, _ = self.ball_angles(cx, cy)
+
+            # 安全区在图像中的面积与距离成反比，使用max确保分母至少为1
+            base_distance = self.detector.safe_zone_base_distance  # 基础距离（毫米）
+            base_area = self.detector.safe_zone_base_area  # 基础面积（像素²）
+            self.safe_zone_distance = (base_area / max(contour_area, 1)) * base_distance / 10
+            logger.debug("检测到安全区，位置: (%d, %d), 角度: %.1f°, 距离: %dcm",
+                         cx, cy, self.safe_zone_angle, self.safe_zone_distance)
+            return True
+
+        logger.debug("未检测到安全区")
+        return False
+
+    def snapshot(self, frame):
+        """[Snapshot]：同一帧里每种颜色最近的球（最多top_k个）和安全区，一次回复
+
+        回复：按snapshot_colors的顺序，每种颜色为[球数n, n组(水平角度,垂直角度,距离(厘米))]，没有补位；
+        最后是[是否找到安全区, 安全区角度, 安全区距离(厘米)]，没找到时角度和距离沿用上一次的结果
+        """
+        if frame is None:
+            balls, safe_zone = {}, (None, 0)
+        else:
+            balls, safe_zone = self.detect_scene(frame, self.snapshot_colors)
+        values = []
+        for color in self.snapshot_colors:
+            closest = balls.get(color, [])[:self.snapshot_top_k]
+            values.append(len(closest))
+            for cx, cy, distance in (ball[:3] for ball in closest):
+                horizontal_angle, vertical_angle = self.ball_angles(cx, cy)
+                values += [horizontal_angle, vertical_angle, distance / 10.0]
+
+        place_found = frame is not None and self.update_safe_zone(frame, safe_zone)
+        values += [int(place_found), self.safe_zone_angle, self.safe_zone_distance]
+        self.found = place_found or any(balls.values())
+        return values
+
+    def reload_config(self, frame):
+        """[ReloadConfig]：请求重新加载检测参数，立即回复[是否接受, 已完成的加载次数]
+
+        构建新检测器在热加载线程里进行，电控可以稍后再发一次，加载次数增加说明新参数已生效
+        """
+        if self.reloader is None:
+            return [0, 0]
+        accepted = self.reloader.reload()
+        self.found = accepted
+        return [int(accepted), self.reloader.generation]
+
+
+def format_response(values):
+    """按照[值1,值2,...]的格式构建回复，值取整数部分"""
+    return "[" + ",".join(str(int(v)) for v in values) + "]"
+
+
+def report_stats(handler, command_count, debug_mode=None):
+    """每处理LATENCY_REPORT_INTERVAL条命令打印一次命令延迟（调试模式）和检测各阶段耗时"""
+    if command_count % LATENCY_REPORT_INTERVAL != 0:
+        return
+    if debug_mode is None:
+        debug_mode = logger.isEnabledFor(logging.DEBUG)
+    if debug_mode:
+        logger.info("命令延迟统计:\n%s", handler.latency.format_summary())
+        logger.info("画面延迟统计:\n%s", handler.frame_latency.format_summary())
+        if handler.worker is not None:
+            logger.info("后台检测: %s", handler.worker.format_summary())
+    profiler = handler.detector.profiler
+    if profiler is not None:
+        logger.info("检测各阶段耗时:\n%s", profiler.format_summary())
@@ -2,13 +2,28 @@
 CAMERA_CONFIG = {
     "resolution": (640, 480),  # 相机分辨率
     "horizontal_fov": 60,       # 水平视场角（度），听说这个可以不用设置
+    "vertical_fov": 45,         # 垂直视场角（度），CAMERA_MODEL_CONFIG["mode"]为"linear"时用来计算垂直角度
+    "threaded_capture": True,   # 是否启用后台取帧线程，True时始终使用最新一帧，避免读到缓冲区里的旧帧
+    "raw_mjpeg": False,         # 是否直接读取摄像头的MJPEG数据：推流不用重新编码，检测按需要的比例解码（需要V4L2后端支持）
                }
 
+# 相机模型（camera_model.py）：像素坐标 -> 水平/垂直角度
+# "linear"：偏移 × 视场角 / 分辨率（不需要标定，图像边缘误差较大）
+# "undistort"：用标定的内参和畸变系数对检测到的点做cv2.undistortPoints，只处理点，不校正整幅图像
+# "table"：由标定结果预先算好每个像素的角度表，保存到文件，检测时只查表（最快，分辨率变化时自动重建）
+CAMERA_MODEL_CONFIG = {
+    "mode": "linear",
+    "calibration_path": "camera_calibration.npz",  # 标定结果（相对本目录），用python camera_model.py --calibrate生成
+    "bearing_table_path": "bearing_table.npy",     # 角度表缓存文件（相对本目录），标定结果变化时自动重新生成
+}
+
 # 目标参数配置
 TARGET_CONFIG = {
     "known_ball_diameter": 40,  # 已知球体直径（mm），配置方法：使用卡尺测量实际球的直径
     "min_contour_area": 20,     # 最小轮廓面积（像素），配置方法：在目标最小距离下测试并调整，过滤噪点
     "circularity_threshold": 0.65, # 圆形度阈值，配置方法：范围0-1，值越大越严格要求圆形，推荐0.6-0.8
+    "aspect_ratio_max": 3.0,    # 球外接矩形最大长宽比，只用于components方式的预筛选，应比圆形度阈值宽松
+    "fill_ratio_min": 0.4,      # 球面积占外接矩形的最小比例，只用于components方式的预筛选（圆约为0.785）
 }
 
 # 颜色HSV阈值配置
@@ -26,7 +41,9 @@ COLOR_RANGES = {
 # 视觉处理配置，这里很多设置都是多余的，用于测试用的代码
 VISION_CONFIG = {
     "display_result": True,     # 是否显示处理结果，配置方法：True显示实时图像，False不显示可提高性能
-    "debug_mode": True,         # 是否启用调试模式，配置方法：True输出详细信息，False静默运行
+    "debug_mode": True,         # 是否启用调试模式，配置方法：True输出详细信息，False静默运行（不做任何调试计算）
+    "profile_stages": False,    # 是否统计检测各阶段（滤波、HSV、inRange、形态学、轮廓）耗时，main.py会定期打印分位数
+    "log_rate_limit": 1.0,      # 日志限频间隔（秒），同一条日志在间隔内只输出一次，0表示不限频
     "morph_kernel_size": (5, 5), # 形态学处理内核大小，配置方法：(3,3)轻量处理，(5,5)标准，(7,7)强力
     "erode_iterations": 1,      # 腐蚀迭代次数，配置方法：增加可去除小噪声，但会缩小目标
     "dilate_iterations": 2,     # 膨胀迭代次数，配置方法：增加可连接断开的轮廓，使目标更完整
@@ -34,6 +51,52 @@ VISION_CONFIG = {
     "gaussian_blur_sigma": 0,   # 高斯滤波标准差，配置方法：0自动计算，或手动设置正数
     "ball_distance_scale": 15000,  # 距离计算缩放因子，配置方法：根据实际测试校准
     "ball_distance_offset": 0,     # 距离计算偏移量，配置方法：根据实际测试校准
+    "ball_scale": 1.0,            # 球检测的处理比例，1.0为原图分辨率，输出的坐标和距离始终按原图分辨率计算
+    "ball_coarse_to_fine": False, # 是否先粗后精检测球：先在缩小图上找候选色块，再只在候选区域内按原图分辨率检测
+    "ball_coarse_scale": 0.25,    # 粗检测比例，0.5或0.25（图像金字塔的1/2、1/4层）；0.25时最远处的小球在粗检测图上会丢失（合成基准召回率0.986→0.970）
+    "coarse_roi_margin": 8,       # 精检测区域在候选框外再扩出的像素数（原图分辨率），重叠的区域会合并
+    "jpeg_fine_scale": 0.5,       # 原始MJPEG帧（JpegFrame）精检测的解码比例，0.5按1/2直接解码，1.0为完整解码
+    "safe_zone_scale": 1.0,       # 安全区检测的处理比例，0.5可以省一半以上的时间，但位置和面积会略有变化
+    "blob_backend": "contours",   # 色块提取方式，"contours"逐个轮廓计算（默认，干净画面下更快：合成基准120帧/秒，components约70帧/秒），
+                                  # "components"连通域统计向量化筛选，只在掩码里小噪点很多时才可能更快，换用前请用benchmark_detection.py实测
+    "segmentation_backend": "inrange",  # 颜色分割方式，"inrange"逐个颜色cv2.inRange，"lut"分通道查找表一次分割所有颜色（3种及以上颜色时更快，单色时更慢）
+}
+
+# 小球跟踪配置：找到球后只在预测位置附近的小区域内检测，定期全图搜索
+TRACKER_CONFIG = {
+    "enabled": False,             # 是否启用跟踪模式，需要持续发送找球命令时效果最好
+    "full_search_interval": 10,   # 每隔多少次检测做一次全图搜索，用来发现新出现的球
+    "roi_scale": 2.0,             # 检测区域边长 = 球直径 × roi_scale × 2 + 预测移动距离
+    "min_roi_size": 48,           # 检测区域最小边长（像素）
+    "max_misses": 3,              # 连续多少次没检测到就放弃这个球，回到全图搜索
+    "process_noise": 200.0,       # 卡尔曼滤波过程噪声（像素/秒²），球移动越剧烈设得越大
+    "measurement_noise": 4.0,     # 卡尔曼滤波测量噪声（像素）
+    "distance_smoothing": 0.5,    # 距离平滑系数，0~1，越小越平滑
+}
+
+# 后台连续检测配置：每取到一帧就检测所有颜色的球和安全区，串口命令直接用最近的结果回复
+DETECTION_WORKER_CONFIG = {
+    "enabled": False,             # 是否启用，需要threaded_capture；会一直占用一个CPU核
+    "max_age_ms": 100,            # 缓存结果最长可用时间（从取帧时刻算），超过时现场检测；文本命令可以单独指定，如[FindBall:200]
+}
+
+# 多进程流水线配置：取帧进程写共享内存，多个检测进程并行检测不同的帧（mp_pipeline.py）
+PIPELINE_CONFIG = {
+    "enabled": False,             # 是否启用，启用后代替DETECTION_WORKER_CONFIG，摄像头由取帧进程打开
+    "workers": 3,                 # 检测进程数，多核时留一个核给取帧和串口；加速效果未在树莓派上实测，
+                                  # 单核开发机上多进程并不更快，启用前用 python mp_pipeline.py --workers 1 2 3 测量
+    "ring_slots": 8,              # 共享内存图像槽位数，至少比检测进程数多一个
+    "max_age_ms": 100,            # 结果太旧时最多等待下一帧结果的时间（毫秒）
+    "reorder_timeout_ms": 200,    # 某一帧的结果迟迟不到（检测进程退出）时最多等待的时间（毫秒），超过就跳过这一帧
+    "max_pending": 8,             # 缺失的帧后面最多积压多少帧结果，超过就不再等待
+}
+
+# 检测参数热加载（config_reload.py）：修改本文件的COLOR_RANGES、TARGET_CONFIG、VISION_CONFIG、SAFE_ZONE_CONFIG后
+# 不用重启，下一帧起使用新参数；也可以由电控发送[ReloadConfig]命令触发
+HOT_RELOAD_CONFIG = {
+    "enabled": False,             # 是否启用，默认关闭：启用后每隔interval秒检查一次本文件，调参时再打开
+    "path": "config.py",          # 监视的配置文件（相对本目录）
+    "interval": 1.0,              # 检查文件修改时间的间隔（秒），0表示只在收到[ReloadConfig]命令时重新加载
 }
 
 # 安全区检测配置
@@ -45,4 +108,79 @@ SAFE_ZONE_CONFIG = {
     "max_area": 50000,          # 最大面积（像素）
     "base_area": 1000,         # 基础面积（像素²），用于距离计算
     "base_distance": 520.0,     # 基础距离（毫米），用于距离计算
-}
\ No newline at end of file
+}
+
+# 电控系统串口通信配置
+ELECTRONIC_CONTROL_CONFIG = {
+    "serial_port": "/dev/ttyS0",  # 串口设备路径
+    "baud_rate": 9600,            # 波特率，需要和电控一致
+    "read_timeout": 1.0,          # 串口读取超时（秒），有数据到达时会立即返回，不影响响应速度
+    "prioritize_black": False,    # [FindBall]没找到队伍颜色的球时是否先找黑色球
+    "protocol": "text",           # "text"：[FindBall]/[12,-3,45]文本协议；"binary"：带序号和CRC的短帧（见binary_protocol.py），需要电控同时切换
+    "report_frame_age": False,    # 回复里是否附带画面年龄（从取帧到回复的毫秒数）：文本协议在末尾多一个值，二进制协议写在标志位里，需要电控同时支持
+    "runtime": "blocking",        # "blocking"：单线程阻塞循环（默认）；"asyncio"：事件循环读串口、检测在单独线程执行，检测时不耽误接收命令，上车验证后再切换
+}
+
+# [Snapshot]命令：同一帧里一次返回每种颜色最近的几个球和安全区，电控一个决策周期只需一次串口往返
+# 二进制协议下一次往返为 20 + 6×球数 字节（FindBall+FindTeamColor+FindPlace三次往返共37字节），
+# 文本协议每个球约多10字节；画面里球很多时top_k越大回复越长，按电控实际需要设置
+SNAPSHOT_CONFIG = {
+    "colors": None,               # 返回哪些颜色的球（按顺序），None表示队伍颜色、黑色、黄色
+    "top_k": 2,                   # 每种颜色最多返回几个球，每种颜色先发球数，没有补位
+}
+
+# 各命令从收到换行符到发出回复的延迟预算（毫秒），超出时打印警告
+# 预算 = 检测耗时 + 余量，检测耗时用640x480合成画面在开发机（x86）上实测，p95：
+#   FindTeamColor 约3.5ms，FindBall（队伍色没找到时再找黄色）约4.3ms，FindPlace 约3.8ms
+#   树莓派上预计慢一个数量级，上车后请用CommandHandler.latency的统计（main.py会定期打印）重新测量
+COMMAND_LATENCY_BUDGET = {
+    "[FindTeamColor]": 50,
+    "[FindBall]": 100,
+    "[FindPlace]": 50,
+    "[Snapshot]": 100,    # 所有颜色的球和安全区一起检测，只做一次预处理
+    "[ReloadConfig]": 5,  # 只提交重新加载请求，构建新检测器在后台线程进行
+}
+
+# 推流配置（server.py的VideoBroadcaster）
+STREAM_CONFIG = {
+    "enabled": False,             # main.py运行时是否同时推流
+    "host": "0.0.0.0",            # 监听地址，0.0.0.0表示所有网卡
+    "port": 8000,                 # 端口号，与client.py一致
+    "jpeg_quality": 80,           # 编码质量（原始MJPEG模式下直接转发，不重新编码）
+    "adaptive": True,             # 是否按每个观看端的链路状况自动调整画质
+    # 画质档位，从高到低：(分辨率比例, jpeg质量, 帧率)；第一档遇到原始MJPEG帧时直接转发
+    # 第一档的质量取jpeg_quality（这里写None），其余档位的质量不会高于jpeg_quality
+    "levels": [
+        (1.0, None, 30),
+        (1.0, 60, 30),
+        (0.75, 60, 20),
+        (0.5, 60, 15),
+        (0.5, 40, 10),
+        (0.25, 40, 5),
+    ],
+    "adapt_interval": 1.0,        # 统计和调整周期（秒）
+    "max_delay": 0.2,             # 平均发送延迟超过这个值（秒）或丢帧超过20%就降一档
+    "good_delay": 0.05,           # 平均发送延迟低于这个值视为链路良好
+    "upgrade_intervals": 3,       # 连续几个周期良好才升一档，避免来回切换
+    "send_buffer": 65536,         # 每个观看端的socket发送缓冲区（字节），太大时拥塞要积压很久才能发现
+}
+
+# 离线基准测试配置（benchmark_detection.py）
+BENCHMARK_CONFIG = {
+    "frames": 100,                        # 合成画面帧数
+    "baseline_path": "benchmark_baseline.json",  # 本机基准结果文件（相对本目录），用--save-baseline生成
+    "latency_tolerance": 0.2,             # p50/p95耗时超过基准的(1+容差)倍视为变慢
+    "min_ball_recall": 0.95,              # 球召回率下限
+    "min_ball_precision": 0.95,           # 球精确率下限
+    "min_safe_zone_recall": 0.9,          # 安全区召回率下限
+}
+
+# HSV阈值离线优化（hsv_optimizer.py）：用标注过的录像帧自动搜索COLOR_RANGES
+HSV_OPTIMIZER_CONFIG = {
+    "bins": (2, 4, 4),            # H、S、V的直方图分箱宽度，越小越精细，内存和搜索时间越多
+    "beta": 1.0,                  # F-beta中的beta，>1更看重召回（球不漏检），<1更看重精确（背景不误检）
+    "core_ratio": 0.8,            # 标注区域只取中间这个比例的部分作为前景，避开边缘的混色像素
+    "edge_margin": 4,             # 标注区域外扩这么多像素内的像素既不算前景也不算背景（像素）
+    "rounds": 20,                 # 随机扰动+坐标下降的轮数
+    "samples": 20000,             # 每轮随机扰动的候选阈值个数
+}
@@ -0,0 +1,119 @@
+"""检测参数热加载：比赛中改了HSV范围、轮廓面积、圆形度或安全区参数，不用重启main.py
+
+- 后台线程定期检查配置文件的修改时间，或者收到[ReloadConfig]命令时重新读取配置
+- 在后台线程里用新配置构建一个完整的ObjectDetector（包括颜色上下限、查找表等预编译数据），
+  构建完成后才交给CommandHandler/DetectionWorker等替换，正在处理的命令不受影响，下一帧开始使用新参数
+- 配置文件有语法错误或构建失败时保留原来的检测器
+"""
+import os
+import runpy
+import threading
+
+import config
+from config import HOT_RELOAD_CONFIG
+from object_detection import ObjectDetector
+from vision_log import get_logger
+
+logger = get_logger("reload")
+
+# 热加载的配置字典 -> ObjectDetector的参数名；摄像头、串口等配置仍需重启才能生效
+DETECTION_CONFIG_NAMES = {
+    "COLOR_RANGES": "color_ranges",
+    "TARGET_CONFIG": "target_config",
+    "VISION_CONFIG": "vision_config",
+    "SAFE_ZONE_CONFIG": "safe_zone_config",
+}
+
+
+def default_config_path():
+    """默认监视的配置文件：HOT_RELOAD_CONFIG["path"]，相对路径按本目录计算"""
+    path = HOT_RELOAD_CONFIG.get("path", "config.py")
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    return path
+
+
+def load_detection_config(path):
+    """重新执行配置文件，返回ObjectDetector的参数字典；文件里没有的字典沿用启动时导入的配置"""
+    namespace = runpy.run_path(path)
+    return {arg: namespace.get(name, getattr(config, name)) for name, arg in DETECTION_CONFIG_NAMES.items()}
+
+
+class DetectorReloader:
+    """监视配置文件，在后台线程构建新的检测器并替换到各个使用者"""
+
+    def __init__(self, path=None, interval=None):
+        """
+        Args:
+            path: 配置文件路径，默认default_config_path()
+            interval: 检查文件修改时间的间隔（秒），0表示只响应reload()请求
+        """
+        self.path = path or default_config_path()
+        self.interval = interval if interval is not None else HOT_RELOAD_CONFIG.get("interval", 1.0)
+        self.targets = []  # 提供set_detector(detector)方法的对象
+        self.generation = 0  # 成功替换的次数
+        self.last_error = None
+
+        self._requested = threading.Event()
+        self._mtime = self._read_mtime()
+        self.thread = None
+        self.running = False
+
+    def add_target(self, target):
+        """登记一个需要替换检测器的对象（CommandHandler、DetectionWorker、DetectionPipeline）"""
+        self.targets.append(target)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="config-reload", daemon=True)
+        self.thread.start()
+        logger.info("检测参数热加载已启动，监视: %s", self.path)
+        return True
+
+    def stop(self):
+        self.running = False
+        self._requested.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def reload(self):
+        """请求重新加载（不等待完成），可以在任何线程调用，返回请求是否被接受"""
+        if not self.running:
+            return False
+        self._requested.set()
+        return True
+
+    def _read_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _run(self):
+        while self.running:
+            requested = self._requested.wait(self.interval or None)
+            self._requested.clear()
+            if not self.running:
+                break
+            mtime = self._read_mtime()
+            if requested or mtime != self._mtime:
+                self._mtime = mtime
+                self.reload_now()
+
+    def reload_now(self):
+        """在当前线程读取配置、构建检测器并替换，返回新的检测器，失败时返回None"""
+        try:
+            detector = ObjectDetector(**load_detection_config(self.path))
+        except Exception as e:
+            # 改到一半保存的配置文件可能有语法错误，继续使用原来的检测器
+            self.last_error = e
+            logger.error("重新加载检测参数失败，继续使用原来的参数: %s", e)
+            return None
+
+        for target in self.targets:
+            target.set_detector(detector)
+        self.generation += 1
+        self.last_error = None
+        logger.info("检测参数已重新加载（第%d次）", self.generation)
+        return detector
@@ -0,0 +1,124 @@
+"""后台连续检测：每取到一帧新图像就检测所有颜色的球和安全区，把最近的结果缓存起来
+
+串口命令直接使用缓存的结果回复，不再等检测完成；结果太旧（超过max_age_ms）时才现场检测一次。
+需要camera_capture的后台取帧线程（CAMERA_CONFIG["threaded_capture"]）。
+"""
+import threading
+import time
+from collections import namedtuple
+
+from config import DETECTION_WORKER_CONFIG
+from camera_capture import grabber_running, get_frame_info, get_source_id, wait_for_frame
+from vision_log import get_logger
+
+logger = get_logger("worker")
+
+# seq/timestamp：检测所用帧的序号和取帧时间（time.monotonic()）
+# balls：{颜色: [(中心x, 中心y, 距离), ...]}；safe_zone：detect_safe_zone的返回值(位置, 面积)
+# source：图像来源标识；detect_time：检测完成时间（time.monotonic()）
+DetectionResult = namedtuple("DetectionResult", ["seq", "timestamp", "frame", "balls", "safe_zone",
+                                                 "source", "detect_time"], defaults=(None, None))
+
+
+class DetectionWorker:
+    """后台检测线程和结果缓存"""
+
+    def __init__(self, detector, team_color, colors=None, max_age_ms=None):
+        """
+        Args:
+            detector: ObjectDetector对象，之后只能通过本对象使用（内部加锁）
+            team_color: 队伍颜色，也决定安全区颜色
+            colors: 要检测的球颜色，默认队伍颜色、黑色、黄色
+            max_age_ms: 默认的结果最长可用时间（毫秒）
+        """
+        self.detector = detector
+        self.team_color = team_color
+        self.colors = list(colors) if colors else [team_color, "black", "yellow"]
+        self.max_age_ms = max_age_ms if max_age_ms is not None else DETECTION_WORKER_CONFIG.get("max_age_ms", 100)
+
+        self.detect_lock = threading.Lock()   # 检测器不是线程安全的
+        self.result_lock = threading.Lock()
+        self.result = None
+        self.thread = None
+        self.running = False
+
+        self.frames_detected = 0
+        self.cache_hits = 0    # 直接使用缓存结果的次数
+        self.cache_misses = 0  # 结果太旧、现场重新检测的次数
+        self.frames_skipped = 0  # 检测跟不上取帧、没有检测就被新帧覆盖的帧数
+
+    def start(self):
+        if not grabber_running():
+            logger.error("后台取帧线程没有运行，无法启动连续检测")
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="detection-worker", daemon=True)
+        self.thread.start()
+        logger.info("后台连续检测已启动，颜色: %s", self.colors)
+        return True
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def set_detector(self, detector):
+        """换用新的检测器（热加载），正在检测的帧继续用原来的检测器"""
+        self.detector = detector
+
+    def _run(self):
+        last_seq = 0
+        while self.running:
+            frame, seq, timestamp = wait_for_frame(last_seq, timeout=0.5)
+            if frame is None or seq <= last_seq:
+                if not grabber_running():
+                    break
+                continue
+            if last_seq:
+                self.frames_skipped += seq - last_seq - 1
+            last_seq = seq
+            self._detect(frame, seq, timestamp)
+
+    def _detect(self, frame, seq, timestamp):
+        """检测一帧并发布结果，已经有同一帧或更新帧的结果时直接返回缓存"""
+        with self.detect_lock:
+            current = self.result
+            if current is not None and current.seq >= seq:
+                return current
+            detector = self.detector  # 同一帧的所有检测用同一个检测器
+            results = detector.detect_many(frame, self.colors)
+            balls = {color: targets for color, (targets, _) in results.items()}
+            safe_zone = detector.detect_safe_zone(frame, self.team_color)
+            result = DetectionResult(seq, timestamp, frame, balls, safe_zone, get_source_id(), time.monotonic())
+            self.frames_detected += 1
+
+        with self.result_lock:
+            if self.result is None or self.result.seq < seq:
+                self.result = result
+        return result
+
+    def get(self, max_age_ms=None):
+        """返回最近的检测结果
+
+        结果的取帧时间超过max_age_ms时，如果已经有更新的帧就现场检测一次；没有更新的帧时返回缓存结果。
+        还没有任何帧时返回None。
+        """
+        if max_age_ms is None:
+            max_age_ms = self.max_age_ms
+        with self.result_lock:
+            result = self.result
+        if result is not None and (time.monotonic() - result.timestamp) * 1000 <= max_age_ms:
+            self.cache_hits += 1
+            return result
+
+        frame, seq, timestamp = get_frame_info()
+        if frame is None or (result is not None and seq <= result.seq):
+            self.cache_hits += 1
+            return result
+        self.cache_misses += 1
+        return self._detect(frame, seq, timestamp)
+
+    def format_summary(self):
+        return (f"连续检测帧数={self.frames_detected} 跳过帧数={self.frames_skipped} "
+                f"缓存命中={self.cache_hits} 重新检测={self.cache_misses}")
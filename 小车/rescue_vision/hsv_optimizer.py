@@ -0,0 +1,402 @@
+"""HSV阈值离线优化：用标注过的录像帧自动搜索每种颜色的COLOR_RANGES，代替--hsv.py里手动拖滑块
+
+- 标注只需要粗略地圈出球（圆）和安全区（矩形或多边形），每个区域只取中间部分作为前景，边缘一圈忽略
+- 所有帧先统计一次每种颜色前景、背景像素的三维HSV直方图，再做三维累加和（积分直方图）
+- 一个候选阈值[H,S,V]上下限框住的像素数只需要查8个角点，成批用numpy计算，每秒能评估几百万个候选
+- 红色等跨过H=0/180的颜色在H轴平移半圈后的直方图上搜索，结果自动拆成两个范围
+- 分数为F-beta（前景里被框住的比例和框住的像素里前景的比例），最后用cv2.inRange在原图上复核
+
+标注文件格式（JSON，图片路径相对标注文件）：
+    {"frames": [{"image": "0001.png",
+                 "regions": [{"color": "red", "circle": [cx, cy, r]},
+                             {"color": "red", "box": [x, y, w, h]},
+                             {"color": "blue", "polygon": [[x1, y1], [x2, y2], ...]}]}]}
+
+用法：
+    python hsv_optimizer.py --labels labels.json                  # 优化标注里出现的所有颜色并打印结果
+    python hsv_optimizer.py --labels labels.json --write-config   # 同时写回config.py（启用HOT_RELOAD_CONFIG时立即生效）
+    python hsv_optimizer.py --synthetic 50                        # 用合成画面自测
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+from config import COLOR_RANGES, HSV_OPTIMIZER_CONFIG
+from color_lut import get_color_bounds
+from object_detection import ObjectDetector
+from vision_log import setup_logging
+
+H_RANGE = 180  # OpenCV的H取值0~179
+
+
+def region_mask(shape, region, ratio=1.0, margin=0):
+    """把一个标注区域画成掩码
+
+    Args:
+        shape: 图像的(高, 宽)
+        region: {"circle": [cx, cy, r]}、{"box": [x, y, w, h]}或{"polygon": [[x, y], ...]}
+        ratio: 以区域中心为基准缩放的比例（取前景核心部分时小于1）
+        margin: 缩放后再外扩的像素数
+    """
+    mask = np.zeros(shape, dtype=np.uint8)
+    if "circle" in region:
+        cx, cy, r = region["circle"]
+        cv2.circle(mask, (int(round(cx)), int(round(cy))), max(int(round(r * ratio + margin)), 1), 255, -1)
+        return mask
+    if "box" in region:
+        x, y, w, h = region["box"]
+        points = np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.float64)
+    else:
+        points = np.array(region["polygon"], dtype=np.float64)
+    center = points.mean(axis=0)
+    points = center + (points - center) * ratio
+    cv2.fillPoly(mask, [np.round(points).astype(np.int32)], 255)
+    if margin > 0:
+        mask = cv2.dilate(mask, np.ones((2 * margin + 1, 2 * margin + 1), np.uint8))
+    return mask
+
+
+def load_labels(path):
+    """读取标注文件，返回[(BGR图像, 区域列表), ...]，读不到的图片跳过"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    samples = []
+    for entry in data["frames"]:
+        image_path = entry["image"] if os.path.isabs(entry["image"]) else os.path.join(base, entry["image"])
+        frame = cv2.imread(image_path)
+        if frame is None:
+            print(f"警告: 无法读取图片 {image_path}，跳过")
+            continue
+        samples.append((frame, entry["regions"]))
+    return samples
+
+
+def synthetic_labels(count, seed=0):
+    """用合成画面生成带标注的样本（球为圆，安全区为外接矩形），用于自测"""
+    from synthetic_scene import SceneGenerator
+
+    generator = SceneGenerator(seed)
+    samples = []
+    for _ in range(count):
+        frame, truth = generator.generate()
+        regions = [{"color": color, "circle": [cx, cy, d / 2]} for color, cx, cy, d in truth["balls"]]
+        if truth["safe_zone"] is not None:
+            color, box = truth["safe_zone"]
+            regions.append({"color": color, "box": list(box)})
+        samples.append((frame, regions))
+    return samples
+
+
+class HSVOptimizer:
+    """积分直方图上的HSV阈值搜索"""
+
+    def __init__(self, samples, colors=None, bins=None, core_ratio=None, edge_margin=None, beta=None,
+                 detector=None):
+        """
+        Args:
+            samples: [(BGR图像, 区域列表), ...]
+            colors: 要优化的颜色，默认标注里出现的所有颜色
+            bins: H、S、V的分箱宽度
+            core_ratio/edge_margin/beta: 见HSV_OPTIMIZER_CONFIG
+            detector: 用它的blur_hsv做预处理，和实际检测保持一致，默认ObjectDetector()
+        """
+        self.bins = tuple(bins or HSV_OPTIMIZER_CONFIG.get("bins", (2, 4, 4)))
+        self.core_ratio = core_ratio if core_ratio is not None else HSV_OPTIMIZER_CONFIG.get("core_ratio", 0.8)
+        self.edge_margin = edge_margin if edge_margin is not None else HSV_OPTIMIZER_CONFIG.get("edge_margin", 4)
+        self.beta = beta if beta is not None else HSV_OPTIMIZER_CONFIG.get("beta", 1.0)
+        self.detector = detector or ObjectDetector()
+        self.colors = list(colors) if colors else sorted({r["color"] for _, regions in samples for r in regions})
+        self.shape = (-(-H_RANGE // self.bins[0]), -(-256 // self.bins[1]), -(-256 // self.bins[2]))
+
+        self.evaluated = 0         # 已评估的候选阈值个数
+        self.search_seconds = 0.0
+        self._prepare(samples)
+
+    def _prepare(self, samples):
+        """预处理所有帧，统计每种颜色前景、背景的直方图并做积分；同时保留HSV图像和标签图用于复核"""
+        size = int(np.prod(self.shape))
+        fg_hist = {color: np.zeros(size, np.int64) for color in self.colors}
+        bg_hist = {color: np.zeros(size, np.int64) for color in self.colors}
+        self.images = []  # [(HSV图像, {颜色: 标签图})]，标签图1为前景、2为背景、0为忽略
+
+        for frame, regions in samples:
+            hsv = self.detector.blur_hsv(frame)
+            h_bin = hsv[..., 0] // self.bins[0]
+            s_bin = hsv[..., 1] // self.bins[1]
+            v_bin = hsv[..., 2] // self.bins[2]
+            index = ((h_bin.astype(np.int64) * self.shape[1] + s_bin) * self.shape[2] + v_bin).ravel()
+
+            # 所有区域的边缘带（外扩区域减去核心）不参与任何颜色的统计
+            shape = hsv.shape[:2]
+            core = {color: np.zeros(shape, np.uint8) for color in self.colors}
+            outer = {color: np.zeros(shape, np.uint8) for color in self.colors}
+            band = np.zeros(shape, np.uint8)
+            for region in regions:
+                inner = region_mask(shape, region, self.core_ratio)
+                expanded = region_mask(shape, region, 1.0, self.edge_margin)
+                band |= expanded & ~inner
+                if region["color"] in core:
+                    core[region["color"]] |= inner
+                    outer[region["color"]] |= expanded
+
+            labels = {}
+            for color in self.colors:
+                fg = core[color] > 0
+                bg = (outer[color] == 0) & (band == 0)
+                fg_hist[color] += np.bincount(index[fg.ravel()], minlength=size)
+                bg_hist[color] += np.bincount(index[bg.ravel()], minlength=size)
+                label = np.zeros(shape, np.uint8)
+                label[fg] = 1
+                label[bg] = 2
+                labels[color] = label
+            self.images.append((hsv, labels))
+
+        self.fg_total = {color: int(fg_hist[color].sum()) for color in self.colors}
+        self.bg_total = {color: int(bg_hist[color].sum()) for color in self.colors}
+        self.fg_hist = {color: fg_hist[color].reshape(self.shape) for color in self.colors}
+        self.bg_hist = {color: bg_hist[color].reshape(self.shape) for color in self.colors}
+
+    @staticmethod
+    def integral(hist):
+        """三维累加和，前面各补一层0，box_sums可以直接用上限+1、下限作下标"""
+        table = np.zeros(tuple(n + 1 for n in hist.shape), dtype=np.int64)
+        table[1:, 1:, 1:] = hist.cumsum(0).cumsum(1).cumsum(2)
+        return table
+
+    @staticmethod
+    def box_sums(table, lo, hi):
+        """成批计算分箱下标闭区间[lo, hi]内的像素数
+
+        Args:
+            table: integral()的结果
+            lo, hi: (N, 3)的分箱下标数组
+        """
+        h0, s0, v0 = lo[:, 0], lo[:, 1], lo[:, 2]
+        h1, s1, v1 = hi[:, 0] + 1, hi[:, 1] + 1, hi[:, 2] + 1
+        return (table[h1, s1, v1] - table[h0, s1, v1] - table[h1, s0, v1] - table[h1, s1, v0]
+                + table[h0, s0, v1] + table[h0, s1, v0] + table[h1, s0, v0] - table[h0, s0, v0])
+
+    def scores(self, fg_table, bg_table, fg_total, lo, hi):
+        """成批计算候选阈值的F-beta分数"""
+        tp = self.box_sums(fg_table, lo, hi)
+        fp = self.box_sums(bg_table, lo, hi)
+        beta2 = self.beta ** 2
+        self.evaluated += len(lo)
+        return (1 + beta2) * tp / np.maximum((1 + beta2) * tp + beta2 * (fg_total - tp) + fp, 1)
+
+    def _seeds(self, fg_hist):
+        """初始候选：前景分布各通道的分位数范围"""
+        seeds = []
+        marginals = [fg_hist.sum(axis=tuple(a for a in range(3) if a != axis)) for axis in range(3)]
+        cumulative = [np.cumsum(m) / max(m.sum(), 1) for m in marginals]
+        for low, high in ((0.01, 0.99), (0.05, 0.95), (0.1, 0.9)):
+            lo = [int(np.searchsorted(c, low)) for c in cumulative]
+            hi = [int(np.searchsorted(c, high)) for c in cumulative]
+            seeds.append((lo, hi))
+        return seeds
+
+    def _coordinate_descent(self, fg_table, bg_table, fg_total, lo, hi, best):
+        """每次固定其他5个边界，把一个边界的所有取值成批评估，取最好的，直到不再提高"""
+        improved = True
+        while improved:
+            improved = False
+            for axis in range(3):
+                for side in (0, 1):
+                    if side == 0:
+                        values = np.arange(0, hi[axis] + 1)
+                    else:
+                        values = np.arange(lo[axis], self.shape[axis])
+                    cand_lo = np.repeat(lo[None, :], len(values), axis=0)
+                    cand_hi = np.repeat(hi[None, :], len(values), axis=0)
+                    (cand_lo if side == 0 else cand_hi)[:, axis] = values
+                    scores = self.scores(fg_table, bg_table, fg_total, cand_lo, cand_hi)
+                    i = int(np.argmax(scores))
+                    if scores[i] > best + 1e-12:
+                        best = float(scores[i])
+                        lo, hi = cand_lo[i].copy(), cand_hi[i].copy()
+                        improved = True
+        return lo, hi, best
+
+    def _search(self, color, shift, rounds, samples, rng):
+        """在H轴平移shift个分箱后的直方图上搜索，返回(下限, 上限, 分数)（分箱下标，平移后的坐标）"""
+        fg_hist = np.roll(self.fg_hist[color], -shift, axis=0)
+        bg_hist = np.roll(self.bg_hist[color], -shift, axis=0)
+        fg_table, bg_table = self.integral(fg_hist), self.integral(bg_hist)
+        fg_total = self.fg_total[color]
+        limit = np.array(self.shape) - 1
+
+        best_lo, best_hi, best = None, None, -1.0
+        for lo, hi in self._seeds(fg_hist):
+            lo, hi = np.array(lo), np.array(hi)
+            score = float(self.scores(fg_table, bg_table, fg_total, lo[None], hi[None])[0])
+            lo, hi, score = self._coordinate_descent(fg_table, bg_table, fg_total, lo, hi, score)
+            if score > best:
+                best_lo, best_hi, best = lo, hi, score
+
+        # 在当前最优附近随机扰动，跳出坐标下降的局部最优
+        for round_index in range(rounds):
+            spread = np.maximum((limit + 1) // (4 + 2 * round_index), 1)
+            lo = best_lo + rng.integers(-spread, spread + 1, size=(samples, 3))
+            hi = best_hi + rng.integers(-spread, spread + 1, size=(samples, 3))
+            lo = np.clip(lo, 0, limit)
+            hi = np.clip(hi, 0, limit)
+            lo, hi = np.minimum(lo, hi), np.maximum(lo, hi)
+            scores = self.scores(fg_table, bg_table, fg_total, lo, hi)
+            i = int(np.argmax(scores))
+            if scores[i] > best + 1e-12:
+                best_lo, best_hi, best = self._coordinate_descent(fg_table, bg_table, fg_total,
+                                                                  lo[i].copy(), hi[i].copy(), float(scores[i]))
+        return best_lo, best_hi, best
+
+    def _to_ranges(self, lo, hi, shift):
+        """把分箱下标的搜索结果换算成COLOR_RANGES的格式，跨过H=0/180时拆成两个范围（12个数）"""
+        width = np.array(self.bins)
+        s_lo, v_lo = int(lo[1] * width[1]), int(lo[2] * width[2])
+        s_hi, v_hi = min(int((hi[1] + 1) * width[1]) - 1, 255), min(int((hi[2] + 1) * width[2]) - 1, 255)
+        h_bins = self.shape[0]
+        h_lo, h_hi = int(lo[0]) + shift, int(hi[0]) + shift
+        if h_hi < h_bins or h_lo >= h_bins:
+            h_lo, h_hi = h_lo % h_bins, h_hi % h_bins
+            return [h_lo * width[0], s_lo, v_lo, min((h_hi + 1) * width[0] - 1, H_RANGE - 1), s_hi, v_hi]
+        # 跨过了H轴的末端：[0, h_hi - h_bins]和[h_lo, 179]
+        return [0, s_lo, v_lo, min((h_hi - h_bins + 1) * width[0] - 1, H_RANGE - 1), s_hi, v_hi,
+                h_lo * width[0], s_lo, v_lo, H_RANGE - 1, s_hi, v_hi]
+
+    def optimize(self, rounds=None, samples=None, seed=0):
+        """搜索每种颜色的最优阈值
+
+        Returns:
+            {颜色: {"ranges": COLOR_RANGES格式的列表, "score": 直方图上的F-beta分数}}，没有前景像素的颜色跳过
+        """
+        rounds = rounds if rounds is not None else HSV_OPTIMIZER_CONFIG.get("rounds", 20)
+        samples = samples or HSV_OPTIMIZER_CONFIG.get("samples", 20000)
+        rng = np.random.default_rng(seed)
+        start = time.perf_counter()
+        results = {}
+        for color in self.colors:
+            if self.fg_total[color] == 0:
+                print(f"警告: {color}没有标注的前景像素，跳过")
+                continue
+            # 不平移和平移半圈各搜索一次，后者能找到跨过H=0/180的范围（红色）
+            best = None
+            for shift in (0, self.shape[0] // 2):
+                lo, hi, score = self._search(color, shift, rounds, samples, rng)
+                if best is None or score > best[2] + 1e-9:
+                    best = (lo, hi, score, shift)
+            lo, hi, score, shift = best
+            results[color] = {"ranges": [int(v) for v in self._to_ranges(lo, hi, shift)], "score": score}
+        self.search_seconds += time.perf_counter() - start
+        return results
+
+    def evaluate(self, color, ranges):
+        """用cv2.inRange在所有帧上复核某组阈值，返回{"precision", "recall", "f_beta"}"""
+        tp = fp = 0
+        bounds = get_color_bounds(color, ranges)
+        for hsv, labels in self.images:
+            mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
+            for lower, upper in bounds:
+                mask |= cv2.inRange(hsv, lower, upper)
+            hit = mask > 0
+            label = labels[color]
+            tp += int(np.count_nonzero(hit & (label == 1)))
+            fp += int(np.count_nonzero(hit & (label == 2)))
+        fg_total = self.fg_total[color]
+        beta2 = self.beta ** 2
+        return {
+            "precision": tp / (tp + fp) if tp + fp else 0.0,
+            "recall": tp / fg_total if fg_total else 0.0,
+            "f_beta": (1 + beta2) * tp / max((1 + beta2) * tp + beta2 * (fg_total - tp) + fp, 1),
+        }
+
+    @property
+    def rate(self):
+        """每秒评估的候选阈值个数"""
+        return self.evaluated / self.search_seconds if self.search_seconds > 0 else 0.0
+
+
+def write_config(ranges, path=None):
+    """把优化结果写回config.py里COLOR_RANGES对应颜色的那一行，保留行尾注释，其他内容不变
+
+    Returns:
+        实际更新的颜色列表
+    """
+    path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.py")
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    updated = []
+    inside = False
+    for i, line in enumerate(lines):
+        if line.startswith("COLOR_RANGES = {"):
+            inside = True
+            continue
+        if inside and line.strip() == "}":
+            break
+        if not inside:
+            continue
+        for color, values in ranges.items():
+            match = re.match(r'^(\s*"%s":\s*)\[.*\](,.*)?$' % re.escape(color), line.rstrip("\n"))
+            if match:
+                lines[i] = f"{match.group(1)}[{', '.join(str(int(v)) for v in values)}]{match.group(2) or ','}\n"
+                updated.append(color)
+
+    # 运行中的程序可能正在热加载这个文件，先写临时文件再原子替换，不会读到写了一半的配置
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用标注帧离线优化HSV阈值")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--labels", help="标注文件（JSON）")
+    source.add_argument("--synthetic", type=int, metavar="N", help="用N帧合成画面自测")
+    parser.add_argument("--colors", nargs="+", help="只优化这些颜色，默认标注里出现的所有颜色")
+    parser.add_argument("--rounds", type=int, default=None, help="随机扰动轮数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--write-config", action="store_true", help="把结果写回config.py的COLOR_RANGES")
+    args = parser.parse_args(argv)
+
+    setup_logging(debug_mode=False)
+    start = time.perf_counter()
+    samples = load_labels(args.labels) if args.labels else synthetic_labels(args.synthetic, args.seed)
+    if not samples:
+        print("没有可用的标注帧")
+        return 1
+    optimizer = HSVOptimizer(samples, colors=args.colors)
+    prepare_seconds = time.perf_counter() - start
+    results = optimizer.optimize(rounds=args.rounds, seed=args.seed)
+
+    print(f"{len(samples)}帧，预处理和统计直方图{prepare_seconds:.2f}s，"
+          f"搜索{optimizer.search_seconds:.2f}s（评估{optimizer.evaluated}个候选，{optimizer.rate / 1e6:.1f}M个/秒）")
+    for color, result in results.items():
+        new = optimizer.evaluate(color, result["ranges"])
+        line = (f"{color}: {result['ranges']}\n"
+                f"    优化后 精确率={new['precision']:.3f} 召回率={new['recall']:.3f} F={new['f_beta']:.3f}")
+        if color in COLOR_RANGES:
+            old = optimizer.evaluate(color, COLOR_RANGES[color])
+            line += f"\n    当前配置 精确率={old['precision']:.3f} 召回率={old['recall']:.3f} F={old['f_beta']:.3f}"
+        print(line)
+
+    if args.write_config:
+        updated = write_config({color: result["ranges"] for color, result in results.items()})
+        missing = sorted(set(results) - set(updated))
+        print(f"已写回config.py: {updated}" + (f"，COLOR_RANGES里没有这些颜色: {missing}" if missing else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+"""摄像头原始MJPEG帧：保留压缩数据，需要时才解码，并且可以直接按1/2、1/4、1/8比例解码
+
+推流时直接转发jpeg字节，不用解码再编码；检测只需要缩小的图像时（如安全区），
+用IMREAD_REDUCED_COLOR_*在解码时缩小，比先完整解码再cv2.resize快得多。
+"""
+import cv2
+import numpy as np
+
+# 处理比例 -> 按比例解码的标志
+REDUCED_DECODE_FLAGS = {
+    0.5: cv2.IMREAD_REDUCED_COLOR_2,
+    0.25: cv2.IMREAD_REDUCED_COLOR_4,
+    0.125: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class JpegFrame:
+    """一帧压缩图像，按比例解码的结果会缓存，同一帧只解码一次"""
+
+    def __init__(self, data):
+        """
+        Args:
+            data: jpeg数据（bytes或一维uint8数组）
+        """
+        self.data = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray)) else data.reshape(-1)
+        self._decoded = {}  # {比例: BGR图像}
+
+    @property
+    def jpeg(self):
+        """jpeg字节，可以直接发送"""
+        return self.data.tobytes()
+
+    def decode(self, scale=1.0):
+        """解码成BGR图像，scale为0.5/0.25/0.125时在解码时直接缩小，其他比例先完整解码再缩小
+
+        解码失败时返回None
+        """
+        image = self._decoded.get(scale)
+        if image is not None:
+            return image
+
+        if scale == 1.0:
+            image = cv2.imdecode(self.data, cv2.IMREAD_COLOR)
+        elif scale in REDUCED_DECODE_FLAGS:
+            image = cv2.imdecode(self.data, REDUCED_DECODE_FLAGS[scale])
+        else:
+            full = self.decode(1.0)
+            image = None if full is None else cv2.resize(full, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        self._decoded[scale] = image
+        return image
+
+    @property
+    def shape(self):
+        """原图尺寸；解码失败时为(0, 0, 3)，按空图像处理（如跟踪区域裁剪后为空）"""
+        image = self.decode(1.0)
+        return (0, 0, 3) if image is None else image.shape
+
+    def __getitem__(self, key):
+        """切片时按原图分辨率解码，如frame[y:y + h, x:x + w]"""
+        return self.decode(1.0)[key]
+
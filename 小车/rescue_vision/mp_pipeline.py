@@ -0,0 +1,366 @@
+"""多进程流水线：一个取帧进程把图像写入共享内存环形缓冲区，多个检测进程并行检测不同的帧
+
+- 图像只在共享内存里复制一次，进程之间只传递(序号, 取帧时间, 槽位号)，不序列化像素数据
+- 每个检测进程有自己的ObjectDetector，检测队伍颜色、黑色、黄色的球和安全区
+- 热加载时只把新的配置字典发给检测进程，每个进程在自己的后台线程里构建新检测器后替换
+- 主进程按帧序号重新排序检测结果，对外接口同detection_worker.DetectionWorker，可以直接交给CommandHandler
+- 检测进程意外退出时，它手上那一帧的结果永远不会到达：等待超时或后面积压的帧太多时跳过缺失的序号，并重启流水线
+
+多进程只有在多核上才可能提高吞吐量，是否值得启用要在目标硬件上实测；在单核开发机上实测1个进程117帧/秒、2个进程104帧/秒，
+进程多了只会增加切换开销（取帧进程也在同一个核上）。
+
+用法（测量吞吐量随进程数的变化）：
+    python mp_pipeline.py --source synthetic:60 --workers 1 2 3 4 --seconds 5
+"""
+import argparse
+import heapq
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from config import CAMERA_CONFIG, PIPELINE_CONFIG
+from detection_worker import DetectionResult
+from vision_log import get_logger
+
+logger = get_logger("pipeline")
+
+
+class SharedFrameRing:
+    """共享内存里的固定大小图像槽位"""
+
+    def __init__(self, slots, shape, name=None):
+        """
+        Args:
+            slots: 槽位数
+            shape: 单帧形状(高, 宽, 3)
+            name: 已有共享内存的名字；为None时新建
+        """
+        self.slots = slots
+        self.shape = tuple(shape)
+        size = slots * int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self, unlink=False):
+        self.frames = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _open_source(source, fps):
+    """在取帧进程里打开图像来源：None为摄像头，否则同replay.ReplayCapture"""
+    if source is None:
+        import camera_capture
+        if not camera_capture.init_camera():
+            return None
+        return camera_capture.camera
+    from replay import ReplayCapture
+    capture = ReplayCapture(source, fps=fps)
+    return capture if capture.isOpened() else None
+
+
+def _capture_loop(ring_name, slots, shape, source, fps, free_slots, tasks, stop, drop_frames, dropped):
+    """取帧进程：读取图像写入空闲槽位，把(序号, 取帧时间, 槽位)交给检测进程，槽位用完丢弃的帧数记在dropped里"""
+    ring = SharedFrameRing(slots, shape, ring_name)
+    capture = _open_source(source, fps)
+    seq = 0
+    while capture is not None and not stop.is_set():
+        ret, frame = capture.read()
+        if not ret:
+            time.sleep(0.005)
+            continue
+        timestamp = time.monotonic()
+        try:
+            # 实时模式下所有槽位都在检测时直接丢弃这一帧，保证检测的总是较新的帧
+            slot = free_slots.get_nowait() if drop_frames else free_slots.get(timeout=0.5)
+        except queue.Empty:
+            with dropped.get_lock():
+                dropped.value += 1
+            continue
+        if frame.shape != ring.shape:
+            frame = cv2.resize(frame, (shape[1], shape[0]))
+        ring.frames[slot] = frame
+        seq += 1
+        tasks.put((seq, timestamp, slot))
+
+    if capture is not None:
+        capture.release()
+    ring.close()
+
+
+def _rebuild_loop(configs, holder):
+    """检测进程里的热加载线程：收到新配置就构建检测器，构建完成后再替换，不占用检测循环的时间"""
+    from object_detection import ObjectDetector
+
+    while True:
+        config = configs.get()
+        if config is None:
+            break
+        try:
+            holder[0] = ObjectDetector(**config)
+        except Exception as e:
+            logger.error("检测进程重新构建检测器失败: %s", e)
+
+
+def _detect_loop(ring_name, slots, shape, team_color, colors, free_slots, tasks, results, configs):
+    """检测进程：从槽位里取图像检测，把结果（不含图像）发回主进程"""
+    from object_detection import ObjectDetector
+
+    # 并行靠多进程，每个进程里OpenCV只用一个线程，避免线程数超过核数互相抢占
+    cv2.setNumThreads(1)
+    ring = SharedFrameRing(slots, shape, ring_name)
+    holder = [ObjectDetector()]  # 当前检测器，热加载线程替换holder[0]
+    threading.Thread(target=_rebuild_loop, args=(configs, holder), name="detector-rebuild", daemon=True).start()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, timestamp, slot = task
+        balls, safe_zone = {}, (None, 0)
+        detector = holder[0]
+        try:
+            frame = ring.frames[slot]
+            detected = detector.detect_many(frame, colors)
+            balls = {color: targets for color, (targets, _) in detected.items()}
+            safe_zone = detector.detect_safe_zone(frame, team_color)
+        except Exception as e:
+            # 出错时也要发回结果，否则合并时会一直等这一帧
+            logger.error("检测第%d帧时出错: %s", seq, e)
+        finally:
+            free_slots.put(slot)
+        # 各进程的time.monotonic()是同一个系统时钟，检测完成时间可以直接和取帧时间相减
+        results.put((seq, timestamp, balls, safe_zone, time.monotonic()))
+    ring.close()
+
+
+class DetectionPipeline:
+    """多进程检测流水线，接口同DetectionWorker（get/start/stop/format_summary）"""
+
+    def __init__(self, team_color, workers=None, slots=None, source=None, fps=30, colors=None,
+                 drop_frames=True, resolution=None):
+        """
+        Args:
+            team_color: 队伍颜色，也决定安全区颜色
+            workers: 检测进程数，默认PIPELINE_CONFIG["workers"]
+            slots: 共享内存槽位数，至少比检测进程数多一个
+            source: 图像来源，None为摄像头，否则同replay.ReplayCapture的source参数
+            fps: 回放帧率（只用于source不为None时）
+            colors: 要检测的球颜色，默认队伍颜色、黑色、黄色
+            drop_frames: 槽位用完时丢弃新帧（实时）还是等待（测量吞吐量）
+        """
+        self.team_color = team_color
+        self.workers = workers or PIPELINE_CONFIG.get("workers", 3)
+        self.slots = max(slots or PIPELINE_CONFIG.get("ring_slots", 8), self.workers + 1)
+        self.colors = list(colors) if colors else [team_color, "black", "yellow"]
+        self.source = source
+        self.fps = fps
+        self.drop_frames = drop_frames
+        self.source_id = "camera0" if source is None else f"replay:{source}"
+        width, height = resolution or CAMERA_CONFIG["resolution"]
+        self.shape = (height, width, 3)
+
+        self.ring = None
+        self.dropped = None  # 取帧进程因槽位用完丢弃的帧数（共享计数）
+        self.processes = []
+        self.merge_thread = None
+        self.running = False
+
+        self.result = None
+        self.result_condition = threading.Condition()
+        self.frames_detected = 0
+        self.max_reorder = 0  # 等待乱序结果时缓冲的最大帧数
+        self.frames_lost = 0  # 结果一直没到达、合并时跳过的帧数
+        self.restarts = 0     # 重启退出的检测进程的次数
+        # 缺失的序号最多等多久（毫秒）、后面最多积压多少帧，超过就跳过
+        self.reorder_timeout_ms = PIPELINE_CONFIG.get("reorder_timeout_ms", 200)
+        self.max_pending = PIPELINE_CONFIG.get("max_pending", 2 * self.workers + 2)
+        self.detector_config = None  # 最近一次热加载的配置，重启检测进程时使用
+
+    def start(self):
+        self.dropped = mp.Value("i", 0)
+        self._spawn()
+        self.running = True
+        self.merge_thread = threading.Thread(target=self._merge, name="pipeline-merge", daemon=True)
+        self.merge_thread.start()
+        logger.info("多进程流水线已启动: %d个检测进程, %d个槽位", self.workers, self.slots)
+        return True
+
+    def _spawn(self):
+        """创建共享内存、队列，启动取帧进程和检测进程"""
+        self.ring = SharedFrameRing(self.slots, self.shape)
+        self.free_slots = mp.Queue()
+        for slot in range(self.slots):
+            self.free_slots.put(slot)
+        self.tasks = mp.Queue()
+        self.results = mp.Queue()
+        self.stop_event = mp.Event()
+        self.configs = [mp.Queue() for _ in range(self.workers)]  # 每个检测进程一个，用于热加载
+        if self.detector_config is not None:
+            for configs in self.configs:
+                configs.put(self.detector_config)
+
+        for i in range(self.workers):
+            process = mp.Process(target=_detect_loop, name=f"detector-{i}", daemon=True,
+                                 args=(self.ring.name, self.slots, self.shape, self.team_color, self.colors,
+                                       self.free_slots, self.tasks, self.results, self.configs[i]))
+            process.start()
+            self.processes.append(process)
+        self.capture_process = mp.Process(target=_capture_loop, name="capture", daemon=True,
+                                          args=(self.ring.name, self.slots, self.shape, self.source, self.fps,
+                                                self.free_slots, self.tasks, self.stop_event, self.drop_frames,
+                                                self.dropped))
+        self.capture_process.start()
+
+    def _shutdown(self, graceful=True):
+        """停止取帧进程和检测进程，释放共享内存；graceful为False时直接结束进程（队列可能已经卡住）"""
+        self.stop_event.set()
+        self.capture_process.join(timeout=2.0 if graceful else 0.5)
+        if graceful:
+            for configs in self.configs:
+                configs.put(None)
+            for _ in self.processes:
+                self.tasks.put(None)
+        for process in self.processes + [self.capture_process]:
+            if graceful:
+                process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=1.0)
+        self.processes = []
+        self.ring.close(unlink=True)
+
+    def _dead_detectors(self):
+        return [process for process in self.processes if not process.is_alive()]
+
+    def _restart(self, dead):
+        """有检测进程意外退出时重启整条流水线
+
+        只重启这一个进程不够：被杀死时它可能正拿着任务队列的锁（其他进程随之全部卡住），占用的槽位也收不回来
+        """
+        for process in dead:
+            logger.error("检测进程%s已退出（退出码%s），重启流水线", process.name, process.exitcode)
+        self._shutdown(graceful=False)
+        self._spawn()
+        self.restarts += 1
+
+    def _merge(self):
+        """按帧序号顺序发布结果，先到的后续帧在堆里等待
+
+        缺失的序号（检测进程退出或卡住）等待超过reorder_timeout_ms、或后面积压超过max_pending帧时跳过；
+        定期检查检测进程，有进程退出时重启流水线，重启后帧序号接着之前发布的序号继续
+        """
+        pending = []
+        next_seq = 1
+        seq_base = 0          # 重启后取帧进程的序号从1开始，发布时加上重启前的最后一个序号
+        waiting_since = None  # 开始等待缺失序号的时间
+        last_check = time.monotonic()
+        while self.running:
+            try:
+                result = self.results.get(timeout=0.1)
+            except queue.Empty:
+                result = None
+            if result is not None:
+                heapq.heappush(pending, result)
+                self.max_reorder = max(self.max_reorder, len(pending))
+
+            if pending and pending[0][0] > next_seq:
+                now = time.monotonic()
+                if waiting_since is None:
+                    waiting_since = now
+                if (now - waiting_since) * 1000 > self.reorder_timeout_ms or len(pending) > self.max_pending:
+                    logger.warning("第%d~%d帧的检测结果没有到达，跳过", seq_base + next_seq, seq_base + pending[0][0] - 1)
+                    self.frames_lost += pending[0][0] - next_seq
+                    next_seq = pending[0][0]
+            if not pending or pending[0][0] == next_seq:
+                waiting_since = None
+
+            while pending and pending[0][0] == next_seq:
+                seq, timestamp, balls, safe_zone, detect_time = heapq.heappop(pending)
+                with self.result_condition:
+                    self.result = DetectionResult(seq_base + seq, timestamp, None, balls, safe_zone,
+                                                  self.source_id, detect_time)
+                    self.frames_detected += 1
+                    self.result_condition.notify_all()
+                next_seq += 1
+
+            if time.monotonic() - last_check > 0.5:
+                last_check = time.monotonic()
+                dead = self._dead_detectors()
+                if dead and self.running:
+                    # 已经到达的结果按顺序发布完再重启，没到达的帧算作跳过
+                    for seq, timestamp, balls, safe_zone, detect_time in sorted(pending):
+                        with self.result_condition:
+                            self.result = DetectionResult(seq_base + seq, timestamp, None, balls, safe_zone,
+                                                          self.source_id, detect_time)
+                            self.frames_detected += 1
+                        self.frames_lost += seq - next_seq
+                        next_seq = seq + 1
+                    seq_base += next_seq - 1
+                    pending, next_seq, waiting_since = [], 1, None
+                    self._restart(dead)
+
+    def set_detector(self, detector):
+        """热加载：把新检测器的配置发给每个检测进程，由它们各自构建（检测器本身不跨进程传递）"""
+        if not self.running:
+            return
+        self.detector_config = detector.config
+        for configs in self.configs:
+            configs.put(detector.config)
+
+    def get(self, max_age_ms=None):
+        """返回最近的检测结果；结果太旧时最多再等max_age_ms等待下一帧的结果"""
+        if max_age_ms is None:
+            max_age_ms = PIPELINE_CONFIG.get("max_age_ms", 100)
+        with self.result_condition:
+            result = self.result
+            if result is None or (time.monotonic() - result.timestamp) * 1000 > max_age_ms:
+                self.result_condition.wait_for(lambda: self.result is not result, max_age_ms / 1000)
+            return self.result
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.merge_thread.join(timeout=1.0)
+        self._shutdown()
+
+    def format_summary(self):
+        dropped = self.dropped.value if self.dropped is not None else 0
+        return (f"检测进程={self.workers} 已检测帧数={self.frames_detected} 丢弃帧数={dropped} "
+                f"最大乱序缓冲={self.max_reorder} 跳过帧数={self.frames_lost} 进程重启={self.restarts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量多进程流水线的吞吐量")
+    parser.add_argument("--source", default="synthetic:60", help="视频文件、图片目录或synthetic[:帧数]")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 3, 4], help="要测试的检测进程数")
+    parser.add_argument("--seconds", type=float, default=5.0, help="每种进程数的测量时间")
+    parser.add_argument("--team-color", default="red", help="队伍颜色")
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        # 不限帧率、槽位用完时等待，测量的是检测能力本身
+        pipeline = DetectionPipeline(args.team_color, workers=workers, source=args.source, fps=0, drop_frames=False)
+        pipeline.start()
+        while pipeline.get(1000) is None:
+            pass
+        start_frames, start = pipeline.frames_detected, time.perf_counter()
+        time.sleep(args.seconds)
+        frames = pipeline.frames_detected - start_frames
+        elapsed = time.perf_counter() - start
+        pipeline.stop()
+        print(f"{workers}个检测进程: {frames / elapsed:.1f} 帧/秒  ({pipeline.format_summary()})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,87 @@
+import time
+import logging
 import cv2
 import numpy as np
 from config import COLOR_RANGES, TARGET_CONFIG, VISION_CONFIG, SAFE_ZONE_CONFIG
+from color_lut import ColorLUT, get_color_bounds
+from vision_log import get_logger
+from stage_profiler import StageProfiler
+from jpeg_frame import JpegFrame
+from target_geometry import TargetGeometry, color_id, empty_targets, to_tuples
+
+logger = get_logger("detect")
 
 class ObjectDetector:
-    def __init__(self):
+    def __init__(self, color_ranges=None, target_config=None, vision_config=None, safe_zone_config=None):
+        """
+        Args:
+            color_ranges/target_config/vision_config/safe_zone_config: 检测参数，默认使用config.py里对应的字典，
+                热加载（config_reload.py）时传入重新读取的配置
+        """
+        color_ranges = COLOR_RANGES if color_ranges is None else color_ranges
+        target_config = TARGET_CONFIG if target_config is None else target_config
+        vision_config = VISION_CONFIG if vision_config is None else vision_config
+        safe_zone_config = SAFE_ZONE_CONFIG if safe_zone_config is None else safe_zone_config
+        self.config = {"color_ranges": color_ranges, "target_config": target_config,
+                       "vision_config": vision_config, "safe_zone_config": safe_zone_config}
+
         # 从配置文件加载颜色范围
-        self.color_ranges = COLOR_RANGES
+        self.color_ranges = color_ranges
+        # 预先把每种颜色的范围转换成inRange用的上下限数组，检测时不再逐帧解析
+        self.color_bounds = {color: get_color_bounds(color, data) for color, data in color_ranges.items()}
         
         # 基本目标参数
-        self.min_contour_area = TARGET_CONFIG.get("min_contour_area", 20)  # 最小轮廓面积
-        self.circularity_threshold = TARGET_CONFIG.get("circularity_threshold", 0.7)  # 圆形度阈值
+        self.min_contour_area = target_config.get("min_contour_area", 20)  # 最小轮廓面积
+        self.circularity_threshold = target_config.get("circularity_threshold", 0.7)  # 圆形度阈值
         
         # 像素-距离转换参数
-        self.pixel_distance_scale = VISION_CONFIG.get("ball_distance_scale", 15000)  # 缩放因子
-        self.pixel_distance_offset = VISION_CONFIG.get("ball_distance_offset", 0)  # 偏移量
+        self.pixel_distance_scale = vision_config.get("ball_distance_scale", 15000)  # 缩放因子
+        self.pixel_distance_offset = vision_config.get("ball_distance_offset", 0)  # 偏移量
+        self.geometry = TargetGeometry(self.pixel_distance_scale, self.pixel_distance_offset)  # 批量计算距离、角度
         
         # 高斯滤波参数 
-        self.gaussian_blur_ksize = VISION_CONFIG.get("gaussian_blur_ksize", (5, 5))
-        self.gaussian_blur_sigma = VISION_CONFIG.get("gaussian_blur_sigma", 1)
+        self.gaussian_blur_ksize = vision_config.get("gaussian_blur_ksize", (5, 5))
+        self.gaussian_blur_sigma = vision_config.get("gaussian_blur_sigma", 1)
         
         # 简化的形态学处理参数
         self.kernel = np.ones((3, 3), np.uint8)
         
         # 安全区检测参数
-        self.safe_zone_min_area = SAFE_ZONE_CONFIG.get("min_area", 500)
-        self.safe_zone_max_area = SAFE_ZONE_CONFIG.get("max_area", 50000)
-        self.safe_zone_aspect_ratio_min = SAFE_ZONE_CONFIG.get("aspect_ratio_min", 2)
-        self.safe_zone_aspect_ratio_max = SAFE_ZONE_CONFIG.get("aspect_ratio_max", 4)
+        self.safe_zone_min_area = safe_zone_config.get("min_area", 500)
+        self.safe_zone_max_area = safe_zone_config.get("max_area", 50000)
+        self.safe_zone_aspect_ratio_min = safe_zone_config.get("aspect_ratio_min", 2)
+        self.safe_zone_aspect_ratio_max = safe_zone_config.get("aspect_ratio_max", 4)
+        self.safe_zone_base_area = safe_zone_config.get("base_area", 1000)          # 距离换算用的基础面积（像素²）
+        self.safe_zone_base_distance = safe_zone_config.get("base_distance", 520.0)  # 基础面积对应的距离（毫米）
+        
+        # 每类目标的处理比例：安全区是大目标，可以在缩小的图像上检测；球可以先粗后精
+        self.ball_scale = vision_config.get("ball_scale", 1.0)
+        self.safe_zone_scale = vision_config.get("safe_zone_scale", 1.0)
+        self.ball_coarse_to_fine = vision_config.get("ball_coarse_to_fine", False)
+        self.ball_coarse_scale = vision_config.get("ball_coarse_scale", 0.25)
+        self.coarse_roi_margin = vision_config.get("coarse_roi_margin", 8)
+        self.jpeg_fine_scale = vision_config.get("jpeg_fine_scale", 0.5)  # 原始MJPEG帧精检测时的解码比例
+        
+        # 每帧预处理缓存，同一帧上的多次检测共用一次滤波和HSV转换结果，{处理比例: HSV图像}
+        self._cache_frame = None
+        self._cache_hsv = {}
+
+        # 色块提取方式："contours"逐个轮廓计算（默认），"components"用连通域统计一次性向量化筛选
+        # components方式对整幅掩码做连通域标记，色块少时比轮廓方式慢，只在小噪点很多时才有优势
+        self.blob_backend = vision_config.get("blob_backend", "contours")
+        self.ball_aspect_ratio_max = target_config.get("aspect_ratio_max", 3.0)  # 球外接矩形最大长宽比（预筛选）
+        self.ball_fill_ratio_min = target_config.get("fill_ratio_min", 0.4)      # 球面积/外接矩形面积的最小值（预筛选）
+        
+        # 分阶段耗时统计，关闭时每个阶段只多一次判断
+        self.profiler = StageProfiler() if vision_config.get("profile_stages", False) else None
+        
+        # 颜色分割方式："inrange"每种颜色单独cv2.inRange，"lut"用分通道查找表一次得到所有颜色
+        self.segmentation_backend = vision_config.get("segmentation_backend", "inrange")
+        self.color_lut = None
+        self._cache_labels_hsv = None
+        self._cache_labels = None
+        if self.segmentation_backend == "lut":
+            self.color_lut = ColorLUT(self.color_ranges)
 
     def calculate_distance(self, ball_diameter_pixels):
         """根据球体在图像中的直径计算实际距离
@@ -49,79 +104,152 @@ class ObjectDetector:
             
         return distance
     
-    def detect_color(self, frame, color):
-        """根据颜色检测目标"""
-        print(f"调试: 检测{color}颜色")
-        # 直接使用原图
-        processed_frame = frame
-        
+    def blur_hsv(self, image):
+        """高斯滤波后转换到HSV色彩空间（不使用缓存）"""
+        prof = self.profiler
+        if prof:
+            t = time.perf_counter()
         # 应用高斯滤波减少噪声
-        blurred_frame = cv2.GaussianBlur(processed_frame, self.gaussian_blur_ksize, self.gaussian_blur_sigma)
-        
+        blurred_frame = cv2.GaussianBlur(image, self.gaussian_blur_ksize, self.gaussian_blur_sigma)
+        if prof:
+            t = prof.lap("blur", t)
         # 转换到HSV色彩空间
         hsv = cv2.cvtColor(blurred_frame, cv2.COLOR_BGR2HSV)
+        if prof:
+            prof.lap("hsv", t)
+        return hsv
+    
+    def preprocess(self, frame, scale=1.0):
+        """对一帧图像做高斯滤波和HSV转换，同一帧同一比例只计算一次
+        
+        缓存以帧对象本身为键，同一帧上的多次检测（多种颜色、安全区）共用一份HSV图像。
+        如果调用方原地改写了帧数据，需要先调用clear_cache()。
+        
+        Args:
+            frame: BGR图像，或摄像头原始MJPEG帧（jpeg_frame.JpegFrame）
+            scale: 处理比例，小于1时先缩小图像再处理
+            
+        Returns:
+            hsv: 模糊后的HSV图像；JpegFrame解码失败（数据损坏）时返回None，调用方按没有检测到目标处理
+        """
+        if frame is not self._cache_frame:
+            self._cache_frame = frame
+            self._cache_hsv = {}
         
-        # 根据颜色获取对应的HSV范围并创建掩码
-        mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
-        if color in self.color_ranges:
-            color_data = self.color_ranges[color]
-            
-            if color == 'red':
-                # 红色需要特殊处理，使用两个范围
-                if len(color_data) == 4:
-                    # 格式: [lower1, upper1, lower2, upper2]
-                    lower1, upper1, lower2, upper2 = color_data
-                    mask1 = cv2.inRange(hsv, np.array(lower1), np.array(upper1))
-                    mask2 = cv2.inRange(hsv, np.array(lower2), np.array(upper2))
-                    mask = cv2.bitwise_or(mask1, mask2)
-                elif len(color_data) == 12:
-                    # 格式: [H1_min, S1_min, V1_min, H1_max, S1_max, V1_max, H2_min, S2_min, V2_min, H2_max, S2_max, V2_max]
-                    lower1 = np.array(color_data[:3])
-                    upper1 = np.array(color_data[3:6])
-                    lower2 = np.array(color_data[6:9])
-                    upper2 = np.array(color_data[9:12])
-                   
-                    mask1 = cv2.inRange(hsv, lower1, upper1)
-                    mask2 = cv2.inRange(hsv, lower2, upper2)
-                    mask = cv2.bitwise_or(mask1, mask2)
-                else:
-                    # 默认红色范围
-                    mask1 = cv2.inRange(hsv, np.array([0, 100, 100]), np.array([10, 255, 255]))
-                    mask2 = cv2.inRange(hsv, np.array([160, 100, 100]), np.array([180, 255, 255]))
-                    mask = cv2.bitwise_or(mask1, mask2)
+        hsv = self._cache_hsv.get(scale)
+        if hsv is None:
+            if isinstance(frame, JpegFrame):
+                # 摄像头原始MJPEG帧：解码时直接缩小，不需要先完整解码再resize
+                if self.profiler:
+                    t = time.perf_counter()
+                image = frame.decode(scale)
+                if self.profiler:
+                    self.profiler.lap("decode", t)
+                if image is None:
+                    logger.warning("JPEG帧解码失败，跳过这一帧的检测")
+                    return None
+            elif scale != 1.0:
+                if self.profiler:
+                    t = time.perf_counter()
+                image = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                if self.profiler:
+                    self.profiler.lap("resize", t)
             else:
-                # 其他颜色处理
-                if len(color_data) == 2:
-                    # 格式: [(H_min,S_min,V_min),(H_max,S_max,V_max)]
-                    lower, upper = color_data
-                    print(f"调试: {color}的HSV范围: {lower} - {upper}")
-                    mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
-                elif len(color_data) == 6:
-                    # 格式: [H_min,S_min,V_min,H_max,S_max,V_max]
-                    lower = np.array(color_data[:3])
-                    upper = np.array(color_data[3:])
-                    print(f"调试: {color}的HSV范围: {lower} - {upper}")
-                    mask = cv2.inRange(hsv, lower, upper)
-        else:
-            print(f"调试: 未找到{color}的HSV范围配置")
+                image = frame
+            hsv = self.blur_hsv(image)
+            self._cache_hsv[scale] = hsv
+        return hsv
+
+    def clear_cache(self):
+        """清空预处理缓存"""
+        self._cache_frame = None
+        self._cache_hsv = {}
+        self._cache_labels_hsv = None
+        self._cache_labels = None
+
+    def color_labels(self, hsv):
+        """查找表模式下，一次查表得到所有颜色的位掩码图，同一HSV图像只查一次"""
+        if hsv is not self._cache_labels_hsv:
+            self._cache_labels = self.color_lut.classify(hsv)
+            self._cache_labels_hsv = hsv
+        return self._cache_labels
+
+    def color_mask(self, hsv, color):
+        """根据颜色在HSV图像上生成掩码"""
+        if color not in self.color_ranges:
+            logger.warning("未找到%s的HSV范围配置", color)
+            return np.zeros(hsv.shape[:2], dtype=np.uint8)
+        
+        prof = self.profiler
+        if prof:
+            t = time.perf_counter()
+        
+        if self.color_lut is not None:
+            mask = self.color_lut.mask(self.color_labels(hsv), color)
+            if prof:
+                prof.lap("lut", t)
+            return mask
+        
+        mask = None
+        for lower, upper in self.color_bounds[color]:
+            range_mask = cv2.inRange(hsv, lower, upper)
+            mask = range_mask if mask is None else cv2.bitwise_or(mask, range_mask)
+        if prof:
+            prof.lap("inrange", t)
+        if mask is None:
+            return np.zeros(hsv.shape[:2], dtype=np.uint8)
+        return mask
+
+    def find_balls(self, mask, scale=1.0):
+        """在掩码中查找圆形目标，返回按距离排序的(中心x, 中心y, 距离)列表
+        
+        scale为掩码相对原图的比例，返回的坐标和距离都换算回原图分辨率
+        """
+        targets, mask = self.find_targets(mask, scale)
+        return to_tuples(targets), mask
+    
+    def find_targets(self, mask, scale=1.0, color=None):
+        """在掩码中查找圆形目标，返回按距离排序的目标数组（target_geometry.TARGET_DTYPE）和处理后的掩码
         
-        # 调试掩码信息
-        mask_non_zero = cv2.countNonZero(mask)
-        print(f"调试: {color}的掩码非零像素数: {mask_non_zero}")
+        逐个色块只做形状判断，距离计算、无效目标过滤和排序对所有目标一次完成
+        """
+        prof = self.profiler
+        if prof:
+            t = time.perf_counter()
         
         # 简化的形态学处理
         mask = cv2.dilate(mask, self.kernel, iterations=1)
         mask = cv2.erode(mask, self.kernel, iterations=1)
+        if prof:
+            t = prof.lap("morphology", t)
+        
+        if self.blob_backend == "components":
+            candidates = self.find_balls_components(mask, scale)
+            if prof:
+                t = prof.lap("components", t)
+        else:
+            candidates = self.find_balls_contours(mask, scale)
+            if prof:
+                t = prof.lap("contour_loop", t)
         
+        if color is not None:
+            candidates["color"] = color_id(color)
+        targets = self.geometry.compute(candidates)
+        if prof:
+            prof.lap("geometry", t)
+        return targets, mask
+    
+    def find_balls_contours(self, mask, scale=1.0):
+        """逐个轮廓计算面积和圆形度，返回候选目标数组（未计算距离）"""
         # 查找轮廓，筛选球体目标
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        targets = []  # 存储(中心x, 中心y, 距离)元组
+        rows = []  # (中心x, 中心y, 直径, 面积)
         
         for cnt in contours:
             area = cv2.contourArea(cnt)
             
-            # 过滤小噪点
-            if area < self.min_contour_area:
+            # 过滤小噪点（面积阈值按原图分辨率配置）
+            if area < self.min_contour_area * scale * scale:
                 continue
             
             # 计算圆形度
@@ -133,71 +261,317 @@ class ObjectDetector:
                 # 计算中心坐标
                 M = cv2.moments(cnt)
                 if M["m00"] > 0:
-                    cx = int(M["m10"] / M["m00"])
-                    cy = int(M["m01"] / M["m00"])
+                    cx = int(M["m10"] / M["m00"] / scale)
+                    cy = int(M["m01"] / M["m00"] / scale)
                     
                     # 获取外接矩形计算直径
                     x, y, w, h = cv2.boundingRect(cnt)
-                    ball_diameter_pixels = max(w, h)
-                    
-                    # 计算距离
-                    distance = self.calculate_distance(ball_diameter_pixels)
-                    
-                    if distance < float('inf'):
-                        targets.append((cx, cy, distance))
+                    rows.append((cx, cy, max(w, h) / scale, area / (scale * scale)))
+        
+        targets = empty_targets(len(rows))
+        if rows:
+            rows = np.array(rows)
+            targets["cx"], targets["cy"] = rows[:, 0], rows[:, 1]
+            targets["diameter"], targets["area"] = rows[:, 2], rows[:, 3]
+        return targets
+    
+    def find_balls_components(self, mask, scale=1.0):
+        """用连通域统计提取球体目标，面积、尺寸、长宽比、填充率用数组运算一次筛完
+        
+        只有通过预筛选的少数色块才提取轮廓，面积、圆形度、中心（轮廓矩）和目标顺序都与轮廓方式相同；
+        唯一的差别是被另一个色块包围在孔洞里的色块：轮廓方式（RETR_EXTERNAL）看不到，这里会保留。
+        返回候选目标数组（未计算距离）
+        """
+        count, labels, stats, _ = _connected_components(mask)
+        if count <= 1:
+            return empty_targets()
+        
+        # 去掉背景（第0个连通域）
+        stats = stats[1:]
+        widths = stats[:, cv2.CC_STAT_WIDTH]
+        heights = stats[:, cv2.CC_STAT_HEIGHT]
+        areas = stats[:, cv2.CC_STAT_AREA]
+        
+        # 向量化预筛选
+        diameters = np.maximum(widths, heights) / scale
+        aspect = np.maximum(widths, heights) / np.minimum(widths, heights)
+        fill = areas / (widths * heights)
+        keep = ((areas >= self.min_contour_area * scale * scale)
+                & (diameters > 5)
+                & (aspect <= self.ball_aspect_ratio_max)
+                & (fill >= self.ball_fill_ratio_min))
+        
+        rows = []  # (中心x, 中心y, 直径, 面积)
+        # 连通域按首个像素的光栅顺序编号，findContours返回的外轮廓顺序正好相反，倒序遍历使距离相同的目标顺序一致
+        for i in np.nonzero(keep)[0][::-1]:
+            x, y, w, h = stats[i, :4]
+            cnt = _component_contour(labels, i + 1, x, y, w, h)
+            area = cv2.contourArea(cnt)
+            
+            # 与轮廓方式相同的面积和圆形度判断
+            if area < self.min_contour_area * scale * scale:
+                continue
+            perimeter = cv2.arcLength(cnt, True)
+            circularity = 4 * np.pi * area / (perimeter ** 2) if perimeter > 0 else 0
+            if circularity <= self.circularity_threshold:
+                continue
+            # 与轮廓方式相同，中心取轮廓矩（不用连通域的像素重心，两者会差1像素）
+            M = cv2.moments(cnt)
+            if M["m00"] > 0:
+                cx = int((M["m10"] / M["m00"] + x) / scale)
+                cy = int((M["m01"] / M["m00"] + y) / scale)
+                rows.append((cx, cy, diameters[i], area / (scale * scale)))
+        
+        targets = empty_targets(len(rows))
+        if rows:
+            rows = np.array(rows)
+            targets["cx"], targets["cy"] = rows[:, 0], rows[:, 1]
+            targets["diameter"], targets["area"] = rows[:, 2], rows[:, 3]
+        return targets
+    
+    def ball_diameter(self, distance):
+        """calculate_distance的反运算，根据距离估算球体在图像中的直径（像素）"""
+        return self.pixel_distance_scale / max(distance - self.pixel_distance_offset, 1)
+    
+    def detect_color(self, frame, color, roi=None):
+        """根据颜色检测目标
         
-        # 按距离排序
-        targets.sort(key=lambda x: x[2])
+        Args:
+            frame: BGR图像
+            color: 颜色名称
+            roi: 只在(x, y, w, h)区域内检测，返回的坐标仍是整幅图像的坐标；None表示全图检测
             
+        Returns:
+            targets: 按距离排序的(中心x, 中心y, 距离)列表
+            mask: 掩码
+        """
+        targets, mask = self.detect_color_targets(frame, color, roi)
+        return to_tuples(targets), mask
+    
+    def detect_color_targets(self, frame, color, roi=None):
+        """同detect_color，返回目标数组（target_geometry.TARGET_DTYPE）"""
+        logger.debug("检测%s颜色", color)
+        if roi is not None:
+            return self.detect_color_in_roi(frame, color, roi)
+        if self.ball_coarse_to_fine:
+            return self.detect_color_coarse_to_fine(frame, color)
+        
+        hsv = self.preprocess(frame, self.ball_scale)
+        if hsv is None:
+            return empty_targets(), None
+        mask = self.color_mask(hsv, color)
+        
+        # 调试掩码信息，只在调试模式下计算
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s的掩码非零像素数: %d", color, cv2.countNonZero(mask))
+        
+        return self.find_targets(mask, self.ball_scale, color)
+
+    def detect_color_in_roi(self, frame, color, roi, scale=1.0):
+        """只在(x, y, w, h)区域（原图坐标）内检测，返回整幅图像坐标下的目标数组
+        
+        scale为处理比例，默认按原图分辨率；JpegFrame按scale解码整帧（同一帧只解码一次）后截取
+        """
+        x, y, w, h = roi
+        sx, sy = int(x * scale), int(y * scale)
+        sw, sh = int(np.ceil(w * scale)), int(np.ceil(h * scale))
+        cached_hsv = self._cache_hsv.get(scale) if frame is self._cache_frame else None
+        if cached_hsv is not None:
+            # 这一帧已经做过同一比例的全图预处理，直接截取
+            hsv = cached_hsv[sy:sy + sh, sx:sx + sw]
+        elif isinstance(frame, JpegFrame):
+            image = frame.decode(scale)
+            if image is None:
+                logger.warning("JPEG帧解码失败，跳过这一帧的检测")
+                return empty_targets(), None
+            hsv = self.blur_hsv(image[sy:sy + sh, sx:sx + sw])
+        elif scale != 1.0:
+            roi_image = frame[y:y + h, x:x + w]
+            hsv = self.blur_hsv(cv2.resize(roi_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+        else:
+            hsv = self.blur_hsv(frame[y:y + h, x:x + w])
+        
+        # find_targets按scale把坐标换算回原图分辨率（相对于区域左上角）
+        targets, mask = self.find_targets(self.color_mask(hsv, color), scale, color)
+        targets["cx"] += int(sx / scale)
+        targets["cy"] += int(sy / scale)
         return targets, mask
 
-    def detect_safe_zone(self, frame, team_color=None):
-        """改进的安全区检测，避免将小球误识别为安全区"""
-        # 应用高斯滤波
-        blurred_frame = cv2.GaussianBlur(frame, self.gaussian_blur_ksize, self.gaussian_blur_sigma)
+    def coarse_rois(self, coarse_mask, scale, frame_size):
+        """粗检测掩码中的候选色块 -> 精检测区域列表（原图坐标），相互重叠或相接的区域合并成一个
         
-        # 转换到HSV色彩空间
-        hsv = cv2.cvtColor(blurred_frame, cv2.COLOR_BGR2HSV)
+        相邻色块扩出边距后区域会重叠，不合并的话同一个球会在两个区域里各检测一次
+        """
+        # 候选色块：面积阈值换算到粗检测分辨率，并放宽一半，避免漏掉远处的小球
+        count, _, stats, _ = cv2.connectedComponentsWithStats(coarse_mask, connectivity=8)
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        candidates = np.nonzero(areas >= self.min_contour_area * scale * scale * 0.5)[0] + 1
+        
+        width, height = frame_size
+        margin = self.coarse_roi_margin
+        boxes = []  # [x0, y0, x1, y1]
+        for i in candidates:
+            x, y, w, h = stats[i, :4]
+            boxes.append([max(int(x / scale) - margin, 0), max(int(y / scale) - margin, 0),
+                          min(int((x + w) / scale) + margin, width), min(int((y + h) / scale) + margin, height)])
+        
+        # 反复合并重叠的区域，直到没有重叠（候选色块一般只有几个）
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]:
+                        boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in boxes]
+
+    def detect_color_coarse_to_fine(self, frame, color):
+        """先在缩小的图像上找候选色块，再只在候选区域内精确检测
+        
+        精检测按原图分辨率；JpegFrame按jpeg_fine_scale解码（默认1/2），不做整帧的全分辨率解码
+        
+        Returns:
+            targets: 按距离排序的目标数组（原图坐标）
+            mask: 粗检测的掩码
+        """
+        scale = self.ball_coarse_scale
+        hsv = self.preprocess(frame, scale)
+        if hsv is None:
+            return empty_targets(), None
+        coarse_mask = self.color_mask(hsv, color)
+        coarse_mask = cv2.dilate(coarse_mask, self.kernel, iterations=1)
+        
+        # 原图尺寸由粗检测图像换算，JpegFrame取frame.shape会触发全分辨率解码
+        frame_size = (int(round(coarse_mask.shape[1] / scale)), int(round(coarse_mask.shape[0] / scale)))
+        fine_scale = self.jpeg_fine_scale if isinstance(frame, JpegFrame) else 1.0
+        found = [empty_targets()]
+        for roi in self.coarse_rois(coarse_mask, scale, frame_size):
+            targets, _ = self.detect_color_in_roi(frame, color, roi, fine_scale)
+            found.append(targets)
+        
+        targets = np.concatenate(found)
+        return targets[np.argsort(targets["distance"], kind="stable")], coarse_mask
+
+    def detect_many(self, frame, colors):
+        """在同一帧上一次性检测多种颜色，只做一次滤波和HSV转换
+        
+        Args:
+            frame: BGR图像
+            colors: 颜色名称列表，如["red", "black", "yellow"]
+            
+        Returns:
+            results: {颜色: (targets, mask)}，格式与detect_color的返回值一致
+        """
+        return {color: (to_tuples(targets), mask)
+                for color, (targets, mask) in self.detect_many_targets(frame, colors).items()}
+
+    def detect_many_targets(self, frame, colors):
+        """同detect_many，每种颜色返回目标数组"""
+        if self.ball_coarse_to_fine:
+            return {color: self.detect_color_coarse_to_fine(frame, color) for color in colors}
+        
+        hsv = self.preprocess(frame, self.ball_scale)
+        if hsv is None:
+            return {color: (empty_targets(), None) for color in colors}
+        results = {}
+        for color in colors:
+            results[color] = self.find_targets(self.color_mask(hsv, color), self.ball_scale, color)
+        return results
+
+    def detect_targets(self, frame, colors, angles=True):
+        """检测多种颜色的球，所有目标放在一个按距离排序的数组里，同时算好角度
+        
+        Args:
+            frame: BGR图像
+            colors: 颜色名称列表
+            angles: 是否计算水平/垂直角度（使用self.geometry的相机模型）
+            
+        Returns:
+            targets: target_geometry.TARGET_DTYPE数组，用target_geometry.select_color按颜色取出
+        """
+        found = [targets for targets, _ in self.detect_many_targets(frame, colors).values()]
+        targets = np.concatenate(found) if found else empty_targets()
+        targets = targets[np.argsort(targets["distance"], kind="stable")]
+        if angles and len(targets):
+            points = np.stack([targets["cx"], targets["cy"]], axis=1)
+            targets["horizontal"], targets["vertical"] = self.geometry.camera_model.angles_many(points)
+        return targets
+
+    def detect_scene(self, frame, colors, team_color=None):
+        """在同一帧上检测多种颜色的球和安全区，所有检测只做一次滤波和HSV转换
+        
+        安全区不按safe_zone_scale，而是用球检测已经算好的那一份HSV图像（ball_scale，粗到细模式下为粗检测比例）
+        
+        Returns:
+            balls: {颜色: 按距离排序的(中心x, 中心y, 距离)列表}
+            safe_zone: detect_safe_zone的返回值(位置, 面积)
+        """
+        balls = {color: targets for color, (targets, _) in self.detect_many(frame, colors).items()}
+        shared_scale = self.ball_coarse_scale if self.ball_coarse_to_fine else self.ball_scale
+        return balls, self.detect_safe_zone(frame, team_color, shared_scale)
+
+    def detect_safe_zone(self, frame, team_color=None, scale=None):
+        """改进的安全区检测，避免将小球误识别为安全区
+        
+        在按scale（默认safe_zone_scale）缩小的图像上检测，返回的位置和面积都换算回原图分辨率
+        """
+        if scale is None:
+            scale = self.safe_zone_scale
+        hsv = self.preprocess(frame, scale)
+        if hsv is None:
+            return None, 0
         
         # 根据队伍颜色创建安全区掩码
         safe_mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
         
         if team_color == "red" or team_color is None:
             # 红色安全区，使用配置文件中的颜色阈值
-            red_data = self.color_ranges.get("red", [0, 120, 70, 10, 255, 255, 170, 120, 70, 180, 255, 255])
-            if len(red_data) == 12:
-                # 格式: [H1_min, S1_min, V1_min, H1_max, S1_max, V1_max, H2_min, S2_min, V2_min, H2_max, S2_max, V2_max]
-                red_mask1 = cv2.inRange(hsv, np.array(red_data[:3]), np.array(red_data[3:6]))
-                red_mask2 = cv2.inRange(hsv, np.array(red_data[6:9]), np.array(red_data[9:12]))
-                red_mask = cv2.bitwise_or(red_mask1, red_mask2)
-                safe_mask = cv2.bitwise_or(safe_mask, red_mask)
+            safe_mask = cv2.bitwise_or(safe_mask, self.color_mask(hsv, "red"))
         
         if team_color == "blue" or team_color is None:
             # 蓝色安全区，使用配置文件中的颜色阈值
-            blue_data = self.color_ranges.get("blue", [110, 120, 70, 130, 255, 255])
-            if len(blue_data) == 6:
-                # 格式: [H_min, S_min, V_min, H_max, S_max, V_max]
-                blue_mask = cv2.inRange(hsv, np.array(blue_data[:3]), np.array(blue_data[3:]))
-                safe_mask = cv2.bitwise_or(safe_mask, blue_mask)
+            safe_mask = cv2.bitwise_or(safe_mask, self.color_mask(hsv, "blue"))
+        
+        prof = self.profiler
+        if prof:
+            t = time.perf_counter()
         
         # 改进的形态学处理，增强噪声去除能力
-        safe_mask = cv2.dilate(safe_mask, self.kernel, iterations=2)
-        safe_mask = cv2.erode(safe_mask, self.kernel, iterations=2)
+        # 缩小图像上同样的迭代次数作用范围更大，按比例减少，保持原图上的效果
+        iterations = max(1, int(round(2 * scale)))
+        safe_mask = cv2.dilate(safe_mask, self.kernel, iterations=iterations)
+        safe_mask = cv2.erode(safe_mask, self.kernel, iterations=iterations)
+        if prof:
+            t = prof.lap("safe_zone_morphology", t)
+        
+        if self.blob_backend == "components":
+            result = self.find_safe_zone_components(safe_mask, scale)
+            if prof:
+                prof.lap("safe_zone_components", t)
+            return result
         
         # 查找轮廓
         contours, _ = cv2.findContours(safe_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if prof:
+            t = prof.lap("safe_zone_find_contours", t)
         safe_zone = None
         contour_area = 0
         
         for cnt in contours:
-            area = cv2.contourArea(cnt)
+            area = cv2.contourArea(cnt) / (scale * scale)  # 换算成原图面积
             
             # 1. 面积判断：安全区应该比小球大，且在合理范围内
             if area < self.safe_zone_min_area or area > self.safe_zone_max_area:
                 continue
             
-            # 获取外接矩形
-            x, y, w, h = cv2.boundingRect(cnt)
+            # 获取外接矩形（换算成原图坐标）
+            x, y, w, h = (int(round(v / scale)) for v in cv2.boundingRect(cnt))
             
             # 2. 尺寸判断：安全区应该有一定的高度和宽度
             if w < 10 or h < 3:  # 进一步降低最小宽度和高度的要求，更容易识别矩形安全区
@@ -209,15 +583,65 @@ class ObjectDetector:
                 continue
             
             # 4. 圆形度判断：小球是圆形的，安全区应该是非圆形的（更严格的条件）
-            perimeter = cv2.arcLength(cnt, True)
+            perimeter = cv2.arcLength(cnt, True) / scale
             circularity = 4 * np.pi * area / (perimeter ** 2) if perimeter > 0 else 0
             if circularity > 0.3:  # 降低圆形度阈值，更严格地排除圆形物体
                 continue
             
-            # 所有条件都满足，认为是安全区
-            safe_zone = (x, y, w, h)
-            contour_area = area
-            break  # 找到第一个符合条件的区域就返回
+            # 所有条件都满足，认为是安全区；有多个时取面积最大的（与轮廓顺序无关，两种色块提取方式结果一致）
+            if area > contour_area:
+                safe_zone = (x, y, w, h)
+                contour_area = area
         
+        if prof:
+            prof.lap("safe_zone_contour_loop", t)
         return safe_zone, contour_area
-    
+
+    def find_safe_zone_components(self, safe_mask, scale=1.0):
+        """用连通域统计筛选安全区，条件和多个候选时取面积最大的规则与detect_safe_zone的轮廓方式相同"""
+        count, labels, stats, _ = _connected_components(safe_mask)
+        if count <= 1:
+            return None, 0
+        
+        # 换算成原图分辨率后向量化预筛选
+        stats = stats[1:]
+        xs = np.round(stats[:, cv2.CC_STAT_LEFT] / scale).astype(int)
+        ys = np.round(stats[:, cv2.CC_STAT_TOP] / scale).astype(int)
+        ws = np.round(stats[:, cv2.CC_STAT_WIDTH] / scale).astype(int)
+        hs = np.round(stats[:, cv2.CC_STAT_HEIGHT] / scale).astype(int)
+        areas = stats[:, cv2.CC_STAT_AREA] / (scale * scale)
+        aspect = ws / np.maximum(hs, 1)
+        keep = ((areas >= self.safe_zone_min_area * 0.8)  # 像素数略大于轮廓面积，这里放宽，精确面积下面再判断
+                & (ws >= 10) & (hs >= 3)
+                & (aspect >= self.safe_zone_aspect_ratio_min)
+                & (aspect <= self.safe_zone_aspect_ratio_max))
+        
+        safe_zone = None
+        contour_area = 0
+        for i in np.nonzero(keep)[0]:
+            x, y, w, h = stats[i, :4]
+            cnt = _component_contour(labels, i + 1, x, y, w, h)
+            area = cv2.contourArea(cnt) / (scale * scale)
+            perimeter = cv2.arcLength(cnt, True) / scale
+            if area < self.safe_zone_min_area or area > self.safe_zone_max_area:
+                continue
+            circularity = 4 * np.pi * area / (perimeter ** 2) if perimeter > 0 else 0
+            if circularity > 0.3:
+                continue
+            if area > contour_area:
+                safe_zone = (int(xs[i]), int(ys[i]), int(ws[i]), int(hs[i]))
+                contour_area = area
+        
+        return safe_zone, contour_area
+
+
+def _connected_components(mask):
+    """8连通域标记并统计，使用Grana（BBDT）算法，比默认算法快"""
+    return cv2.connectedComponentsWithStatsWithAlgorithm(mask, 8, cv2.CV_32S, cv2.CCL_GRANA)
+
+
+def _component_contour(labels, label, x, y, w, h):
+    """提取单个连通域的外轮廓，坐标相对外接矩形左上角(x, y)"""
+    component = (labels[y:y + h, x:x + w] == label).astype(np.uint8)
+    contours, _ = cv2.findContours(component, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return max(contours, key=cv2.contourArea)
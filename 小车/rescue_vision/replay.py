@@ -0,0 +1,325 @@
+"""回放模式：用录像或图片目录代替摄像头，用Linux伪终端(pty)代替串口，离线测量整个命令循环的延迟
+
+用法：
+    python replay.py --source match.mp4 --fps 30 --count 500
+    python replay.py --source frames/ --commands "[FindBall],[FindPlace]" --rate 20
+    python replay.py --source synthetic --commands "[Snapshot]" --protocol binary
+    python replay.py --source synthetic --protocol binary
+    python replay.py --source synthetic --serve-only   # 只打开pty，由外部程序打开打印出的路径发命令
+        例：exec 3<>/dev/pts/N; echo "[FindBall]" >&3; head -c 20 <&3
+
+脚本化的对端从pty主端发送命令，记录从发出换行符到收到完整回复的时间，最后打印各命令的延迟分布和吞吐量。
+pty没有波特率限制，实车9600波特率下每个字节还要再加约1ms的传输时间。
+"""
+import argparse
+import asyncio
+import os
+import select
+import threading
+import time
+import tty
+
+import cv2
+
+from config import CAMERA_CONFIG, ELECTRONIC_CONTROL_CONFIG
+from camera_capture import init_source, get_envelope, get_frame_info, release_camera
+from command_handler import CommandHandler, LatencyStats
+from main import open_serial, serve
+from async_runtime import AsyncSerialServer, serve_async
+from detection_worker import DetectionWorker
+from binary_protocol import COMMAND_NAMES, SEQ_MASK, decode_response, encode_request, response_size
+from object_detection import ObjectDetector
+from vision_log import get_logger
+
+logger = get_logger("replay")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class ReplayCapture:
+    """按固定帧率回放录像、图片目录或合成画面，接口同cv2.VideoCapture（只实现用到的部分）"""
+
+    def __init__(self, source, fps=30, loop=True):
+        """
+        Args:
+            source: 视频文件路径、图片目录，或"synthetic"/"synthetic:帧数"使用合成画面
+            fps: 回放帧率，0表示不限速
+            loop: 播放完后是否从头开始
+        """
+        self.fps = fps
+        self.loop = loop
+        self.source_id = f"replay:{source}"  # camera_capture.init_source用作帧的来源标识
+        self.frames_read = 0
+        self.video = None
+        self.frames = None   # 预先载入内存的帧（图片目录、合成画面）
+
+        if source.startswith("synthetic"):
+            from synthetic_scene import SceneGenerator
+            count = int(source.split(":")[1]) if ":" in source else 100
+            generator = SceneGenerator()
+            self.frames = [generator.generate()[0] for _ in range(count)]
+        elif os.path.isdir(source):
+            names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+            self.frames = [cv2.imread(os.path.join(source, n)) for n in names]
+            self.frames = [f for f in self.frames if f is not None]
+        else:
+            self.video = cv2.VideoCapture(source)
+        self.index = 0
+        self.start_time = None
+
+    def isOpened(self):
+        if self.video is not None:
+            return self.video.isOpened()
+        return bool(self.frames)
+
+    def _next_frame(self):
+        if self.video is not None:
+            ret, frame = self.video.read()
+            if not ret and self.loop:
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self.video.read()
+            return frame if ret else None
+
+        if self.index >= len(self.frames):
+            if not self.loop:
+                return None
+            self.index = 0
+        frame = self.frames[self.index]
+        self.index += 1
+        # 每次返回新的数组，和摄像头一样，避免检测器的逐帧缓存误命中
+        return frame.copy()
+
+    def read(self):
+        """按帧率等到下一帧的时刻再返回，模拟摄像头的节奏"""
+        if self.fps > 0:
+            if self.start_time is None:
+                self.start_time = time.monotonic()
+            delay = self.start_time + self.frames_read / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        frame = self._next_frame()
+        if frame is None:
+            return False, None
+        self.frames_read += 1
+        return True, frame
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0
+
+    def release(self):
+        if self.video is not None:
+            self.video.release()
+        self.frames = None
+
+
+def open_pty():
+    """创建伪终端，返回(主端fd, 从端fd, 从端路径)；从端路径可以像/dev/ttyS0一样用serial.Serial打开"""
+    master_fd, slave_fd = os.openpty()
+    return master_fd, slave_fd, os.ttyname(slave_fd)
+
+
+def open_external_pty(master_fd):
+    """再创建一个伪终端给外部程序用，后台线程在两个主端之间转发数据（相当于socat的pty桥接）
+
+    主端不能通过/proc/<pid>/fd/<fd>重新打开（那样会打开新的/dev/ptmx，得到另一对无关的伪终端），
+    所以外部程序要连接的是第二个伪终端的从端；从端设为raw模式，避免回显把回复又送回命令处理循环
+
+    Returns:
+        从端路径，外部程序像串口一样打开它发送命令、读取回复
+    """
+    peer_master_fd, peer_slave_fd, peer_slave_path = open_pty()
+    tty.setraw(peer_slave_fd)
+    routes = {master_fd: peer_master_fd, peer_master_fd: master_fd}
+
+    def forward():
+        while True:
+            ready, _, _ = select.select(list(routes), [], [])
+            for fd in ready:
+                try:
+                    data = os.read(fd, 4096)
+                except OSError:
+                    # 外部程序关闭从端时主端读取会报EIO，等它重新打开
+                    time.sleep(0.05)
+                    continue
+                os.write(routes[fd], data)
+
+    threading.Thread(target=forward, name="pty-bridge", daemon=True).start()
+    return peer_slave_path
+
+
+class ScriptedPeer:
+    """模拟电控：从pty主端轮流发送命令，等待完整回复并记录延迟"""
+
+    def __init__(self, fd, commands, count=300, rate=0, timeout=1.0, protocol="text"):
+        """
+        Args:
+            fd: pty主端fd
+            commands: 依次循环发送的命令列表，如["[FindBall]", "[FindPlace]"]
+            count: 发送命令总数
+            rate: 每秒发送命令数，0表示收到回复后立即发下一条
+            timeout: 等待回复的最长时间（秒），超时记为丢失
+            protocol: "text"或"binary"
+        """
+        self.fd = fd
+        self.commands = commands
+        self.count = count
+        self.rate = rate
+        self.timeout = timeout
+        self.protocol = protocol
+        self.latency = LatencyStats(window=count)
+        self.timeouts = 0
+        self.errors = 0    # 二进制协议下CRC或序号不对的回复数
+        self.elapsed = 0.0
+
+    def _read_response(self, deadline):
+        """读取一条完整回复（文本以"]"结尾，二进制为定长或不定长帧），超时返回None"""
+        data = bytearray()
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return None
+            data += os.read(self.fd, 256)
+            if self.protocol == "binary":
+                size = response_size(data)
+                if size is not None and len(data) >= size:
+                    return bytes(data[:size])
+                continue
+            if self.protocol != "binary" and data.endswith(b"]"):
+                return bytes(data)
+
+    def _request(self, command, seq):
+        if self.protocol == "binary":
+            return encode_request(COMMAND_NAMES[command], seq)
+        return (command + "\n").encode("utf-8")
+
+    def _check(self, response, seq):
+        """二进制协议下检查回复的CRC和序号"""
+        if self.protocol != "binary":
+            return True
+        decoded = decode_response(response)
+        return decoded is not None and decoded[1] == seq & SEQ_MASK
+
+    def run(self):
+        start = time.perf_counter()
+        for i in range(self.count):
+            if self.rate > 0:
+                delay = start + i / self.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            command = self.commands[i % len(self.commands)]
+            sent = time.perf_counter()
+            os.write(self.fd, self._request(command, i))
+            response = self._read_response(sent + self.timeout)
+            if response is None:
+                self.timeouts += 1
+                logger.warning("%s等待回复超时", command)
+                continue
+            if not self._check(response, i):
+                self.errors += 1
+                logger.warning("%s回复校验失败: %s", command, response.hex())
+                continue
+            self.latency.record(command, (time.perf_counter() - sent) * 1000)
+        self.elapsed = time.perf_counter() - start
+
+    def format_report(self):
+        received = self.count - self.timeouts - self.errors
+        throughput = received / self.elapsed if self.elapsed > 0 else 0.0
+        return (f"发送{self.count}条命令，收到{received}条正确回复，超时{self.timeouts}条，错误{self.errors}条，"
+                f"用时{self.elapsed:.2f}s，吞吐量{throughput:.1f}条/秒\n{self.latency.format_summary()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用录像和伪终端回放整个命令循环")
+    parser.add_argument("--source", required=True, help="视频文件、图片目录或synthetic[:帧数]")
+    parser.add_argument("--fps", type=float, default=30, help="回放帧率，0表示不限速")
+    parser.add_argument("--no-loop", action="store_true", help="播放完后停在最后一帧")
+    parser.add_argument("--team-color", default="red", help="队伍颜色")
+    parser.add_argument("--commands", default="[FindBall],[FindTeamColor],[FindPlace]", help="逗号分隔的命令列表")
+    parser.add_argument("--count", type=int, default=300, help="发送命令总数")
+    parser.add_argument("--rate", type=float, default=0, help="每秒发送命令数，0表示收到回复后立即发下一条")
+    parser.add_argument("--protocol", choices=("text", "binary"), default=None,
+                        help="串口协议，默认读取ELECTRONIC_CONTROL_CONFIG")
+    parser.add_argument("--runtime", choices=("blocking", "asyncio"), default=None,
+                        help="串口运行方式，默认读取ELECTRONIC_CONTROL_CONFIG")
+    parser.add_argument("--worker", action="store_true", help="启用后台连续检测，命令直接用缓存结果回复")
+    parser.add_argument("--serve-only", action="store_true", help="只打开pty并处理命令，由外部程序发送")
+    args = parser.parse_args()
+
+    capture = ReplayCapture(args.source, fps=args.fps, loop=not args.no_loop)
+    if not init_source(capture, threaded=CAMERA_CONFIG.get("threaded_capture", True)):
+        return
+    # 等到第一帧到达再开始，避免前几条命令拿不到图像
+    while get_frame_info()[0] is None and capture.isOpened():
+        time.sleep(0.01)
+
+    detector = ObjectDetector()
+    worker = None
+    if args.worker:
+        worker = DetectionWorker(detector, args.team_color)
+        worker.start()
+    handler = CommandHandler(detector, args.team_color, get_envelope, worker)
+
+    master_fd, slave_fd, slave_path = open_pty()
+    ser = open_serial(slave_path, timeout=0.1)
+    if ser is None:
+        release_camera()
+        return
+
+    use_asyncio = (args.runtime or ELECTRONIC_CONTROL_CONFIG.get("runtime", "blocking")) == "asyncio"
+    if args.serve_only:
+        peer_path = open_external_pty(master_fd)
+        print(f"伪终端已打开: {peer_path}，请用串口工具打开它发送命令，Ctrl+C结束")
+        if use_asyncio:
+            serve_async(ser, handler, protocol=args.protocol)
+        else:
+            serve(ser, handler, protocol=args.protocol)
+    else:
+        if use_asyncio:
+            server = AsyncSerialServer(ser, handler, args.protocol)
+            server_thread = threading.Thread(target=lambda: asyncio.run(server.run()), daemon=True)
+            stop = server.stop
+        else:
+            stop_event = threading.Event()
+            server_thread = threading.Thread(target=serve, args=(ser, handler, stop_event, args.protocol), daemon=True)
+            stop = stop_event.set
+        server_thread.start()
+        peer = ScriptedPeer(master_fd, [c.strip() for c in args.commands.split(",") if c.strip()],
+                            count=args.count, rate=args.rate,
+                            protocol=args.protocol or ELECTRONIC_CONTROL_CONFIG.get("protocol", "text"))
+        peer.run()
+        stop()
+        server_thread.join(timeout=1.0)
+
+        print("端到端延迟（对端发出命令到收到回复）:")
+        print(peer.format_report())
+        print("命令处理延迟（CommandHandler内部）:")
+        print(handler.latency.format_summary())
+        print("画面延迟（取帧→检测→回复）:")
+        print(handler.frame_latency.format_summary())
+        print(f"回放帧数: {capture.frames_read}")
+        if worker is not None:
+            print(worker.format_summary())
+        if detector.profiler is not None:
+            print("检测各阶段耗时:")
+            print(detector.profiler.format_summary())
+
+    if worker is not None:
+        worker.stop()
+    ser.close()
+    os.close(master_fd)
+    os.close(slave_fd)
+    release_camera()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,16 @@ import socket
 import io
 import struct
 import time
+import asyncio
+import threading
+
+from config import STREAM_CONFIG
+from jpeg_frame import JpegFrame
+from vision_log import get_logger
+
+logger = get_logger("stream")
+
+FRAME_END = struct.pack('<L', 0)  # 帧尾，与VideoStreaming的格式一致
 
 
 class VideoStreaming(object):
@@ -45,14 +55,17 @@ class VideoStreaming(object):
     def send(self, _img:cv2.typing.MatLike) -> bool:
         """发送图像数据
         ----
-        * _img: 传入的图像数据"""
+        * _img: 传入的图像数据，也可以是摄像头原始MJPEG帧（JpegFrame），这时直接转发，不解码也不重新编码"""
         try:
-            try:
-                img_encode = cv2.imencode('.jpg', _img)[1]						# 编码
-            except:
-                print('没有读取到图像')
-                return False
-            data_encode = np.array(img_encode)								# 将编码数据转换成二进制数据
+            if isinstance(_img, JpegFrame):
+                data_encode = _img.data											# 摄像头输出的jpeg数据，直接发送
+            else:
+                try:
+                    img_encode = cv2.imencode('.jpg', _img)[1]					# 编码
+                except:
+                    print('没有读取到图像')
+                    return False
+                data_encode = np.array(img_encode)							# 将编码数据转换成二进制数据
             self.stream.write(data_encode)										# 将二进制数据存放到io流
             self.connect.write(struct.pack('<L', self.stream.tell()))			# struct.pack()将数据转换成什么格式    stream.tell()获得目前指针的位置，将数据写入io流后，数据指针跟着后移，
                                                                             # 也就是将数据长度转换成'<L'类型（无符号长整型），写入makefile传输文件
@@ -72,17 +85,306 @@ class VideoStreaming(object):
 
 
 
-if __name__ == '__main__':
-    # TODO: 将下面IP地址改为发送端的IP地址
-    # host, port
-    host = '192.168.137.112'
-    port = 8000
+class _Viewer:
+    """一个观看端：深度为1的发送队列，来不及发送的旧帧直接被新帧替换
+
+    自适应模式下按测量到的发送延迟和丢帧情况在STREAM_CONFIG["levels"]之间切换画质档位
+    """
+
+    def __init__(self, address, level=0):
+        self.address = address
+        self.queue = asyncio.Queue(maxsize=1)
+        self.level = level          # 当前档位，0为最高画质
+        self.next_time = 0.0        # 按档位帧率，下一帧最早的提交时间
+        self.sent = 0
+        self.dropped = 0
+        self.skipped = 0            # 按档位帧率跳过的帧
+        self.good_intervals = 0     # 连续几个统计周期链路状况良好
+        self.capacity = None        # 估计的链路带宽（bps），拥塞时按实际码率估计，之后缓慢上调试探
+        self.bitrate = 0.0          # 最近一个统计周期的实际码率（bps）
+        self.queue_delay = 0.0      # 最近一个统计周期的平均延迟（秒，从提交到发送完成）
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_bytes = 0
+        self.window_sent = 0
+        self.window_dropped = 0
+        self.window_delay = 0.0
+
+    def wants_frame(self, now, fps):
+        """按档位帧率决定这一帧要不要发给这个观看端"""
+        if now < self.next_time:
+            self.skipped += 1
+            return False
+        # 以理想时刻累加，避免帧率因为抖动系统性偏低；落后太多时从现在重新开始
+        self.next_time = max(self.next_time + 1.0 / fps, now)
+        return True
+
+    def offer(self, data, now):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.window_dropped += 1
+        self.queue.put_nowait((data, now))
+
+    def record_send(self, size, delay):
+        self.sent += 1
+        self.window_sent += 1
+        self.window_bytes += size
+        self.window_delay += delay
+
+
+class VideoBroadcaster:
+    """可同时连接任意多个观看端的推流服务，在自己的线程里运行asyncio事件循环
+
+    publish()只是把最新一帧交给推流线程就返回，不会被网络阻塞；每帧每个画质档位只编码一次，
+    每个观看端只保留最新一帧，网速慢的观看端只会丢帧，不会拖慢主循环和其他观看端。
+    自适应模式下每个观看端根据自己的发送延迟和丢帧情况独立升降画质（质量、分辨率、帧率）。
+    数据格式与VideoStreaming相同：<L长度 + jpeg数据 + <L 0。
+    """
+
+    def __init__(self, host=None, port=None, quality=None, adaptive=None):
+        self.host = host or STREAM_CONFIG.get("host", "0.0.0.0")
+        self.port = port or STREAM_CONFIG.get("port", 8000)
+        self.quality = quality or STREAM_CONFIG.get("jpeg_quality", 80)
+        self.adaptive = STREAM_CONFIG.get("adaptive", False) if adaptive is None else adaptive
+        # 档位：(分辨率比例, jpeg质量, 帧率)；不自适应时只用第一档且不限帧率
+        # 第一档的质量取self.quality，其余档位不高于它
+        levels = STREAM_CONFIG.get("levels") or [(1.0, None, 30)]
+        self.levels = [(levels[0][0], self.quality, levels[0][2])]
+        self.levels += [(scale, min(q, self.quality), fps) for scale, q, fps in levels[1:]]
+        self.adapt_interval = STREAM_CONFIG.get("adapt_interval", 1.0)
+        self.max_delay = STREAM_CONFIG.get("max_delay", 0.2)
+        self.good_delay = STREAM_CONFIG.get("good_delay", 0.05)
+        self.upgrade_intervals = STREAM_CONFIG.get("upgrade_intervals", 3)
+        self.send_buffer = STREAM_CONFIG.get("send_buffer", 65536)
+
+        self.viewers = set()
+        self.loop = None
+        self.thread = None
+        self.feed_thread = None
+        self.running = False
+        self.ready = threading.Event()
+        self.frames_encoded = 0
+        self.level_bytes = {}  # {档位: 平均每帧字节数}，用来估计升档后的码率
+
+    def start(self):
+        """启动推流线程，等到开始监听后返回"""
+        self.running = True
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._serve()), name="video-broadcaster", daemon=True)
+        self.thread.start()
+        self.ready.wait(timeout=2.0)
+        return self.loop is not None
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.frame_event = asyncio.Event()
+        self.latest = None
+        try:
+            server = await asyncio.start_server(self._handle_viewer, self.host, self.port)
+        except OSError as e:
+            logger.error("推流服务无法监听%s:%d: %s", self.host, self.port, e)
+            self.loop = None
+            self.ready.set()
+            return
+        logger.info("推流服务已启动: %s:%d", self.host, self.port)
+        self.ready.set()
+        tasks = [asyncio.create_task(self._encode_loop())]
+        if self.adaptive:
+            tasks.append(asyncio.create_task(self._adapt_loop()))
+        async with server:
+            await self.stop_event.wait()
+        for task in tasks:
+            task.cancel()
+
+    async def _handle_viewer(self, reader, writer):
+        viewer = _Viewer(writer.get_extra_info("peername"))
+        # 减小发送缓冲区，数据不会大量积压在内核里，发送延迟才能反映真实的链路速度
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        writer.transport.set_write_buffer_limits(high=0)
+        self.viewers.add(viewer)
+        logger.info("观看端已连接: %s", viewer.address)
+        try:
+            while True:
+                data, offered = await viewer.queue.get()
+                writer.write(struct.pack('<L', len(data)) + data + FRAME_END)
+                await writer.drain()
+                viewer.record_send(len(data) + 8, time.monotonic() - offered)
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            # 观看端断开，或推流服务停止
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            writer.close()
+            logger.info("观看端已断开: %s（发送%d帧，丢弃%d帧）", viewer.address, viewer.sent, viewer.dropped)
 
-    cap = cv2.VideoCapture(0)
+    def _encode(self, frame, level):
+        """按档位编码；第一档遇到摄像头原始MJPEG帧时直接转发"""
+        scale, quality, _ = self.levels[level]
+        if isinstance(frame, JpegFrame):
+            if level == 0 and scale == 1.0:
+                return frame.jpeg
+            image = frame.decode(scale)
+        elif scale != 1.0:
+            image = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            image = frame
+        ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return data.tobytes() if ok else None
 
-    streamer = VideoStreaming(host, port)
-    streamer.start()
+    async def _encode_loop(self):
+        """取最新一帧，每个需要的档位编码一次，分发给对应的观看端；编码期间到达的帧只保留最新的"""
+        while True:
+            await self.frame_event.wait()
+            self.frame_event.clear()
+            frame, self.latest = self.latest, None
+            if frame is None or not self.viewers:
+                continue
 
-    while True:
-        ret, frame = cap.read()
-        streamer.send(frame)
+            now = time.monotonic()
+            by_level = {}
+            for viewer in list(self.viewers):
+                if not self.adaptive:
+                    by_level.setdefault(0, []).append(viewer)
+                elif viewer.wants_frame(now, self.levels[viewer.level][2]):
+                    by_level.setdefault(viewer.level, []).append(viewer)
+
+            for level, viewers in by_level.items():
+                data = await self.loop.run_in_executor(None, self._encode, frame, level)
+                if data is None:
+                    continue
+                self.frames_encoded += 1
+                average = self.level_bytes.get(level, len(data))
+                self.level_bytes[level] = 0.9 * average + 0.1 * len(data)
+                now = time.monotonic()
+                for viewer in viewers:
+                    viewer.offer(data, now)
+
+    def _level_bitrate(self, level):
+        """估计某一档的码率（bps），还没有编码过这一档时返回None"""
+        size = self.level_bytes.get(level)
+        return None if size is None else (size + 8) * 8 * self.levels[level][2]
+
+    async def _adapt_loop(self):
+        """定期根据每个观看端的发送延迟和丢帧调整档位
+
+        链路跟不上时立即降一档，并把这个周期的实际码率记为链路带宽；
+        连续几个周期良好、且上一档的估计码率不超过带宽的80%时才升一档，避免在两档之间来回切换
+        """
+        while True:
+            await asyncio.sleep(self.adapt_interval)
+            for viewer in list(self.viewers):
+                attempts = viewer.window_sent + viewer.window_dropped
+                viewer.bitrate = viewer.window_bytes * 8 / self.adapt_interval
+                viewer.queue_delay = viewer.window_delay / viewer.window_sent if viewer.window_sent else 0.0
+                drop_ratio = viewer.window_dropped / attempts if attempts else 0.0
+
+                congested = viewer.queue_delay > self.max_delay or drop_ratio > 0.2 or (attempts and not viewer.window_sent)
+                if congested:
+                    viewer.good_intervals = 0
+                    if viewer.bitrate > 0:
+                        viewer.capacity = viewer.bitrate
+                    if viewer.level < len(self.levels) - 1:
+                        viewer.level += 1
+                        logger.info("观看端%s链路拥塞（延迟%.0fms，丢帧%.0f%%），降到档位%d: %s",
+                                    viewer.address, viewer.queue_delay * 1000, drop_ratio * 100,
+                                    viewer.level, self.levels[viewer.level])
+                elif viewer.queue_delay < self.good_delay and attempts:
+                    viewer.good_intervals += 1
+                    if viewer.capacity is not None:
+                        viewer.capacity *= 1.05  # 缓慢上调，链路变好时最终能升回去
+                    target = self._level_bitrate(viewer.level - 1) if viewer.level > 0 else None
+                    fits = viewer.capacity is None or target is None or target <= 0.8 * viewer.capacity
+                    if viewer.good_intervals >= self.upgrade_intervals and viewer.level > 0 and fits:
+                        viewer.level -= 1
+                        viewer.good_intervals = 0
+                        logger.info("观看端%s链路良好，升到档位%d: %s",
+                                    viewer.address, viewer.level, self.levels[viewer.level])
+                viewer._reset_window()
+
+    def _set_latest(self, frame):
+        self.latest = frame
+        self.frame_event.set()
+
+    def publish(self, frame):
+        """提交一帧图像（BGR图像或JpegFrame），可以在任意线程调用，立即返回"""
+        if self.loop is None or not self.viewers or frame is None:
+            return
+        self.loop.call_soon_threadsafe(self._set_latest, frame)
+
+    def follow_camera(self):
+        """启动一个线程，把camera_capture后台取帧线程的每一帧都提交推流，返回是否启动
+
+        需要后台取帧线程（CAMERA_CONFIG["threaded_capture"]）：没有它时wait_for_frame立即返回，推流线程会空转占满CPU
+        """
+        from camera_capture import grabber_running, wait_for_frame
+
+        if not grabber_running():
+            logger.error("后台取帧线程没有运行，无法推流摄像头画面")
+            return False
+
+        def feed():
+            last_seq = 0
+            while self.running:
+                frame, seq, _ = wait_for_frame(last_seq, timeout=0.5)
+                if seq > last_seq:
+                    last_seq = seq
+                    self.publish(frame)
+                elif not grabber_running():
+                    logger.warning("后台取帧线程已停止，推流结束")
+                    break
+
+        self.feed_thread = threading.Thread(target=feed, name="broadcast-feed", daemon=True)
+        self.feed_thread.start()
+        return True
+
+    def stats(self):
+        """返回每个观看端的统计：{地址: {"sent", "dropped", "skipped", "level", "scale", "quality", "fps",
+        "bitrate_kbps", "delay_ms", "capacity_kbps"}}，码率和延迟为最近一个统计周期的值（只在自适应模式下更新）"""
+        result = {}
+        for viewer in list(self.viewers):
+            scale, quality, fps = self.levels[viewer.level]
+            result[viewer.address] = {
+                "sent": viewer.sent,
+                "dropped": viewer.dropped,
+                "skipped": viewer.skipped,
+                "level": viewer.level,
+                "scale": scale,
+                "quality": quality,
+                "fps": fps,
+                "bitrate_kbps": viewer.bitrate / 1000,
+                "delay_ms": viewer.queue_delay * 1000,
+                "capacity_kbps": viewer.capacity / 1000 if viewer.capacity is not None else None,
+            }
+        return result
+
+    def stop(self):
+        self.running = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+        if self.feed_thread is not None:
+            self.feed_thread.join(timeout=1.0)
+
+
+if __name__ == '__main__':
+    # 直接读取摄像头的MJPEG数据转发，后端不支持时自动退回解码+编码
+    from camera_capture import init_camera, release_camera
+    init_camera(threaded=True, raw_mjpeg=True)
+
+    # 监听所有网卡，任意多个电脑可以同时用client.py连接观看
+    broadcaster = VideoBroadcaster()
+    if broadcaster.start():
+        broadcaster.follow_camera()
+        try:
+            while True:
+                time.sleep(5)
+                logger.info("观看端统计: %s", broadcaster.stats())
+        except KeyboardInterrupt:
+            pass
+        broadcaster.stop()
+    release_camera()
@@ -0,0 +1,79 @@
+"""检测流水线各阶段耗时统计：每个阶段一个固定大小的对数分桶直方图
+
+记录一次只需要一次log10和一次列表加法，内存占用固定，可以长时间在树莓派上开着。
+"""
+import math
+import time
+
+
+class StageProfiler:
+    """按阶段统计耗时，提供分位数查询"""
+
+    def __init__(self, min_seconds=1e-6, max_seconds=1.0, bins_per_decade=20):
+        """
+        Args:
+            min_seconds: 直方图下限，更短的耗时计入第一个桶
+            max_seconds: 直方图上限，更长的耗时计入最后一个桶
+            bins_per_decade: 每个数量级的桶数，20个桶时相对误差约12%
+        """
+        self.log_min = math.log10(min_seconds)
+        self.bins_per_decade = bins_per_decade
+        self.bin_count = int(round((math.log10(max_seconds) - self.log_min) * bins_per_decade)) + 1
+        self.histograms = {}  # {阶段: [各桶计数]}
+        self.totals = {}      # {阶段: 总耗时（秒）}
+
+    def record(self, stage, seconds):
+        """记录一个阶段的一次耗时"""
+        hist = self.histograms.get(stage)
+        if hist is None:
+            hist = self.histograms[stage] = [0] * self.bin_count
+            self.totals[stage] = 0.0
+        if seconds > 0:
+            index = int((math.log10(seconds) - self.log_min) * self.bins_per_decade)
+            index = min(max(index, 0), self.bin_count - 1)
+        else:
+            index = 0
+        hist[index] += 1
+        self.totals[stage] += seconds
+
+    def lap(self, stage, start):
+        """记录从start到现在的耗时，返回现在的时间，方便连续计时：t = prof.lap("blur", t)"""
+        now = time.perf_counter()
+        self.record(stage, now - start)
+        return now
+
+    def _bin_value(self, index):
+        """桶的代表值（桶中点，对数意义上）"""
+        return 10 ** (self.log_min + (index + 0.5) / self.bins_per_decade)
+
+    def percentiles(self, percents=(50, 95, 99)):
+        """返回 {阶段: {"count": 次数, "mean": 平均秒数, 分位数: 秒数, ...}}"""
+        result = {}
+        for stage, hist in self.histograms.items():
+            count = sum(hist)
+            stats = {"count": count, "mean": self.totals[stage] / count if count else 0.0}
+            for p in percents:
+                target = count * p / 100.0
+                cumulative = 0
+                for index, n in enumerate(hist):
+                    cumulative += n
+                    if cumulative >= target and n:
+                        stats[p] = self._bin_value(index)
+                        break
+                else:
+                    stats[p] = 0.0
+            result[stage] = stats
+        return result
+
+    def format_summary(self, percents=(50, 95, 99)):
+        """格式化成多行文本，单位毫秒，按平均耗时从大到小排序"""
+        stats = self.percentiles(percents)
+        lines = []
+        for stage, s in sorted(stats.items(), key=lambda item: -item[1]["mean"]):
+            values = " ".join(f"p{p}={s[p] * 1000:.2f}ms" for p in percents)
+            lines.append(f"{stage}: 次数={s['count']} 平均={s['mean'] * 1000:.2f}ms {values}")
+        return "\n".join(lines)
+
+    def reset(self):
+        self.histograms = {}
+        self.totals = {}
@@ -0,0 +1,97 @@
+"""合成测试画面：在已知位置画出指定颜色和直径的小球、红/蓝安全区色带和背景干扰
+
+颜色取自config.COLOR_RANGES各范围的中心，所以检测结果只受几何和噪声影响，
+可以在没有摄像头的电脑上重复测量检测速度和准确率。
+"""
+import cv2
+import numpy as np
+
+from config import COLOR_RANGES, CAMERA_CONFIG
+from color_lut import get_color_bounds
+
+
+def color_bgr(color, color_ranges=COLOR_RANGES):
+    """取颜色第一个HSV范围的中心，转换成BGR"""
+    lower, upper = get_color_bounds(color, color_ranges[color])[0]
+    center = ((lower + upper) // 2).clip(0, 255).astype(np.uint8)
+    return tuple(int(v) for v in cv2.cvtColor(center.reshape(1, 1, 3), cv2.COLOR_HSV2BGR).ravel())
+
+
+class SceneGenerator:
+    """生成带真值的合成画面"""
+
+    def __init__(self, seed=0, resolution=None, color_ranges=COLOR_RANGES):
+        self.rng = np.random.default_rng(seed)
+        self.width, self.height = resolution or CAMERA_CONFIG["resolution"]
+        self.colors = {color: color_bgr(color, color_ranges) for color in color_ranges}
+
+    def background(self, clutter=20):
+        """低饱和度、中等亮度的背景，加一些灰色干扰块和线条（不会落入任何颜色范围）"""
+        rng = self.rng
+        base = rng.integers(90, 160)
+        frame = np.full((self.height, self.width, 3), base, dtype=np.uint8)
+        for _ in range(clutter):
+            gray = int(rng.integers(70, 180))
+            tint = rng.integers(-12, 13, size=3)
+            fill = tuple(int(np.clip(gray + t, 60, 190)) for t in tint)
+            x, y = int(rng.integers(0, self.width)), int(rng.integers(0, self.height))
+            if rng.random() < 0.5:
+                w, h = int(rng.integers(10, 120)), int(rng.integers(10, 120))
+                cv2.rectangle(frame, (x, y), (x + w, y + h), fill, -1)
+            else:
+                x2, y2 = int(rng.integers(0, self.width)), int(rng.integers(0, self.height))
+                cv2.line(frame, (x, y), (x2, y2), fill, int(rng.integers(1, 6)))
+        return frame
+
+    def draw_safe_zone(self, frame, color, y_min=300):
+        """画一条有透视和边缘缺口的安全区色带，返回外接矩形(x, y, w, h)"""
+        rng = self.rng
+        # 长宽比控制在SAFE_ZONE_CONFIG的范围内（约3~6）
+        w = int(rng.integers(200, 300))
+        h = int(rng.integers(50, 75))
+        x = int(rng.integers(10, self.width - w - 10))
+        y = int(rng.integers(y_min, self.height - h - 5))
+        skew = int(rng.integers(5, 25))
+        pts = np.array([[x + skew, y], [x + w - skew, y], [x + w, y + h], [x, y + h]], np.int32)
+        cv2.fillPoly(frame, [pts], self.colors[color])
+
+        # 边缘缺口（地面胶带的磨损），让色带明显不是规则矩形
+        background = tuple(int(v) for v in frame[max(y - 3, 0), x + w // 2])
+        for gx in range(x + skew + 6, x + w - skew - 14, 16):
+            cv2.rectangle(frame, (gx, y), (gx + 8, y + 12), background, -1)
+            cv2.rectangle(frame, (gx + 8, y + h - 12), (gx + 16, y + h), background, -1)
+        return x, y, w, h + 1
+
+    def generate(self, ball_colors=("red", "blue", "yellow", "black"), balls_per_color=2,
+                 diameter_range=(14, 60), safe_zone_color="red", clutter=20, noise=4.0):
+        """生成一帧画面
+
+        Returns:
+            frame: BGR图像
+            truth: {"balls": [(颜色, 中心x, 中心y, 直径), ...], "safe_zone": (颜色, (x, y, w, h)) 或 None}
+        """
+        rng = self.rng
+        frame = self.background(clutter)
+
+        safe_zone = None
+        if safe_zone_color is not None:
+            safe_zone = (safe_zone_color, self.draw_safe_zone(frame, safe_zone_color))
+        zone_top = safe_zone[1][1] - 10 if safe_zone else self.height
+
+        balls = []
+        for color in ball_colors:
+            for _ in range(balls_per_color):
+                for _attempt in range(50):
+                    d = int(rng.integers(diameter_range[0], diameter_range[1] + 1))
+                    r = d // 2
+                    cx = int(rng.integers(r + 2, self.width - r - 2))
+                    cy = int(rng.integers(r + 2, max(zone_top - r, r + 3)))
+                    # 球之间留出间隙，避免粘连
+                    if all(np.hypot(cx - bx, cy - by) > r + bd / 2 + 6 for _, bx, by, bd in balls):
+                        cv2.circle(frame, (cx, cy), r, self.colors[color], -1, lineType=cv2.LINE_AA)
+                        balls.append((color, cx, cy, 2 * r))
+                        break
+
+        if noise > 0:
+            frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+        return frame, {"balls": balls, "safe_zone": safe_zone}
@@ -0,0 +1,113 @@
+"""目标几何计算：检测到的所有色块放在一个numpy结构化数组里，距离、角度、筛选和排序一次性向量化完成
+
+每个目标一行，字段见TARGET_DTYPE；颜色用COLOR_IDS里的编号存储。
+原来的(中心x, 中心y, 距离)元组列表可以用to_tuples()得到，CommandHandler等调用方不用改。
+"""
+import numpy as np
+
+from config import COLOR_RANGES, VISION_CONFIG
+
+# cx/cy：中心坐标（原图像素）；diameter：外接矩形长边（像素）；area：轮廓面积（像素²）；color：颜色编号
+# distance：距离（毫米）；horizontal/vertical：相对光轴的角度（度），没有计算时为0
+TARGET_DTYPE = np.dtype([
+    ("cx", np.int32),
+    ("cy", np.int32),
+    ("diameter", np.float32),
+    ("area", np.float32),
+    ("color", np.uint8),
+    ("distance", np.float32),
+    ("horizontal", np.float32),
+    ("vertical", np.float32),
+])
+
+# 颜色名 <-> 编号，按COLOR_RANGES的顺序
+COLOR_NAMES = list(COLOR_RANGES.keys())
+COLOR_IDS = {color: i for i, color in enumerate(COLOR_NAMES)}
+
+MAX_DISTANCE = 5000  # 超过这个距离（毫米）的目标视为无效，同ObjectDetector.calculate_distance
+MIN_DIAMETER = 5     # 直径不超过这个值（像素）的目标视为无效
+
+
+def empty_targets(count=0):
+    """创建count行的目标数组（各字段为0）"""
+    return np.zeros(count, dtype=TARGET_DTYPE)
+
+
+def color_id(color):
+    """颜色名 -> 编号，不在COLOR_RANGES里的颜色排在已知颜色后面"""
+    if color not in COLOR_IDS:
+        COLOR_IDS[color] = len(COLOR_NAMES)
+        COLOR_NAMES.append(color)
+    return COLOR_IDS[color]
+
+
+def to_tuples(targets):
+    """目标数组 -> [(中心x, 中心y, 距离), ...]，与detect_color原来的返回格式一致"""
+    return [(int(cx), int(cy), float(distance))
+            for cx, cy, distance in zip(targets["cx"].tolist(), targets["cy"].tolist(), targets["distance"].tolist())]
+
+
+def select_color(targets, color):
+    """取出某种颜色的目标（保持原来的顺序）"""
+    return targets[targets["color"] == color_id(color)]
+
+
+class TargetGeometry:
+    """批量计算目标的距离和角度"""
+
+    def __init__(self, distance_scale=None, distance_offset=None, camera_model=None):
+        """
+        Args:
+            distance_scale/distance_offset: 距离 = distance_scale / 直径 + distance_offset，默认读取VISION_CONFIG
+            camera_model: camera_model.CameraModel，计算角度时才需要，默认按CAMERA_MODEL_CONFIG创建
+        """
+        self.distance_scale = (distance_scale if distance_scale is not None
+                               else VISION_CONFIG.get("ball_distance_scale", 15000))
+        self.distance_offset = (distance_offset if distance_offset is not None
+                                else VISION_CONFIG.get("ball_distance_offset", 0))
+        self._camera_model = camera_model
+
+    @property
+    def camera_model(self):
+        if self._camera_model is None:
+            from camera_model import CameraModel
+            self._camera_model = CameraModel()
+        return self._camera_model
+
+    def distances(self, diameters):
+        """直径数组 -> 距离数组（毫米），直径太小或距离太远的为inf"""
+        diameters = np.asarray(diameters, dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            distances = self.distance_scale / diameters + self.distance_offset
+        distances[(diameters <= MIN_DIAMETER) | (distances > MAX_DISTANCE)] = np.inf
+        return distances
+
+    def compute(self, targets, angles=False):
+        """计算距离（可选计算角度），去掉无效目标，按距离从近到远排序
+
+        Args:
+            targets: 目标数组，需要已经填好cx/cy/diameter
+            angles: 是否同时计算水平/垂直角度
+
+        Returns:
+            新的目标数组
+        """
+        distances = self.distances(targets["diameter"])
+        valid = np.isfinite(distances)
+        targets = targets[valid]
+        targets["distance"] = distances[valid]
+        # 稳定排序，距离相同时保持检测顺序，与list.sort一致
+        targets = targets[np.argsort(targets["distance"], kind="stable")]
+        if angles and len(targets):
+            points = np.stack([targets["cx"], targets["cy"]], axis=1)
+            targets["horizontal"], targets["vertical"] = self.camera_model.angles_many(points)
+        return targets
+
+    @staticmethod
+    def closest(targets, color=None):
+        """最近的目标（数组的一行），没有时返回None；compute()之后数组已经按距离排序"""
+        if color is not None:
+            targets = select_color(targets, color)
+        if not len(targets):
+            return None
+        return targets[int(np.argmin(targets["distance"]))]
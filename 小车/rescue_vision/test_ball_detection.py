@@ -3,6 +3,7 @@ import numpy as np
 import math
 from config import CAMERA_CONFIG, COLOR_RANGES, TARGET_CONFIG, VISION_CONFIG, SAFE_ZONE_CONFIG
 from object_detection import ObjectDetector
+from camera_model import CameraModel
 
 class BallDetectionTester:
     def __init__(self):
@@ -16,10 +17,9 @@ class BallDetectionTester:
         
         # 配置参数
         self.team_color = "red"  # 可以更改为"blue"或其他颜色
-        self.fov_horizontal = CAMERA_CONFIG.get("horizontal_fov", 60)  # 水平视场角
-        self.fov_vertical = CAMERA_CONFIG.get("vertical_fov", 45)  # 垂直视场角
-        self.img_center_x = CAMERA_CONFIG["resolution"][0] / 2  # 图像中心x坐标
-        self.img_center_y = CAMERA_CONFIG["resolution"][1] / 2  # 图像中心y坐标
+        self.camera_model = CameraModel()  # 像素坐标 -> 角度，与main.py相同
+        self.img_center_x = CAMERA_CONFIG["resolution"][0] / 2  # 图像中心x坐标（用于绘制）
+        self.img_center_y = CAMERA_CONFIG["resolution"][1] / 2  # 图像中心y坐标（用于绘制）
         
         # 距离计算参数
         self.pixel_distance_scale = VISION_CONFIG.get("ball_distance_scale", 15000)
@@ -33,18 +33,8 @@ class BallDetectionTester:
         print("按'y'键切换到黄色小球检测")
     
     def calculate_angle(self, cx, cy):
-        """计算相对于图像中心的水平和垂直角度"""
-        # 水平角度计算
-        horizontal_offset = cx - self.img_center_x
-        angle_per_pixel_horizontal = self.fov_horizontal / CAMERA_CONFIG["resolution"][0]
-        horizontal_angle = horizontal_offset * angle_per_pixel_horizontal
-        
-        # 垂直角度计算
-        vertical_offset = self.img_center_y - cy  # 上为正，下为负
-        angle_per_pixel_vertical = self.fov_vertical / CAMERA_CONFIG["resolution"][1]
-        vertical_angle = vertical_offset * angle_per_pixel_vertical
-        
-        return horizontal_angle, vertical_angle
+        """计算相对于光轴的水平和垂直角度"""
+        return self.camera_model.angles(cx, cy)
     
     def run(self):
         show_vertical_angle = False  # 控制是否显示垂直角度
@@ -135,9 +125,7 @@ class BallDetectionTester:
                 cv2.circle(frame, (cx, cy), 5, (0, 255, 0), -1)
                 
                 # 计算安全区角度
-                horizontal_offset = cx - self.img_center_x  # 水平方向偏移量
-                angle_per_pixel = self.fov_horizontal / CAMERA_CONFIG["resolution"][0]  # 每像素对应的角度
-                safe_zone_angle = horizontal_offset * angle_per_pixel  # 计算安全区相对于中心的角度
+                safe_zone_angle, _ = self.calculate_angle(cx, cy)
                 
                 # 计算安全区距离（与main.py保持一致的方法）
                 safe_zone_area = contour_area  # 使用实际轮廓面积
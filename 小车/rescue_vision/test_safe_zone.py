@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 from config import CAMERA_CONFIG, SAFE_ZONE_CONFIG
 from object_detection import ObjectDetector
+from camera_model import CameraModel
 
 class SafeZoneTester:
     def __init__(self):
@@ -14,9 +15,7 @@ class SafeZoneTester:
         self.detector = ObjectDetector()
         
         # 配置参数
-        self.fov_horizontal = CAMERA_CONFIG.get("horizontal_fov", 60)  # 水平视场角
-        self.img_center_x = CAMERA_CONFIG["resolution"][0] / 2  # 图像中心x坐标
-        self.img_center_y = CAMERA_CONFIG["resolution"][1] / 2  # 图像中心y坐标
+        self.camera_model = CameraModel()  # 像素坐标 -> 角度，与main.py相同
         
         # 安全区距离计算参数
         self.base_distance = SAFE_ZONE_CONFIG["base_distance"]  # 基础距离（毫米）
@@ -88,9 +87,7 @@ class SafeZoneTester:
                             cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
                 
                 # 计算安全区角度
-                horizontal_offset = cx - self.img_center_x
-                angle_per_pixel = self.fov_horizontal / CAMERA_CONFIG["resolution"][0]
-                safe_zone_angle = horizontal_offset * angle_per_pixel
+                safe_zone_angle, _ = self.camera_model.angles(cx, cy)
                 
                 # 计算安全区距离
                 safe_zone_area = contour_area  # 使用实际轮廓面积
@@ -0,0 +1,66 @@
+"""分级、限频的日志输出，用来替换检测和串口循环里的print
+
+debug_mode关闭时调试日志直接被过滤，调用方可以用logger.isEnabledFor(logging.DEBUG)
+跳过只为打印而做的计算（如掩码非零像素数）。同一条消息模板在限频间隔内只输出一次。
+"""
+import logging
+import time
+
+from config import VISION_CONFIG
+
+_configured = False
+
+
+class RateLimitFilter(logging.Filter):
+    """同一条消息模板（同一级别）在interval秒内最多输出一次，被跳过的条数附加在下一次输出后面"""
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.last_emit = {}   # {(级别, 模板): 上次输出时间}
+        self.suppressed = {}  # {(级别, 模板): 被跳过的条数}
+
+    def filter(self, record):
+        if self.interval <= 0:
+            return True
+        key = (record.levelno, record.msg)
+        now = time.monotonic()
+        last = self.last_emit.get(key)
+        if last is not None and now - last < self.interval:
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return False
+
+        self.last_emit[key] = now
+        skipped = self.suppressed.pop(key, 0)
+        if skipped:
+            record.msg = f"{record.msg}（期间省略{skipped}条）"
+        return True
+
+
+def setup_logging(debug_mode=None, rate_limit=None):
+    """配置日志级别和限频，默认读取VISION_CONFIG，可以重复调用修改设置"""
+    global _configured
+
+    if debug_mode is None:
+        debug_mode = VISION_CONFIG.get("debug_mode", False)
+    if rate_limit is None:
+        rate_limit = VISION_CONFIG.get("log_rate_limit", 1.0)
+
+    root = logging.getLogger("vision")
+    root.setLevel(logging.DEBUG if debug_mode else logging.INFO)
+    if not _configured:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S"))
+        root.addHandler(handler)
+        root.propagate = False
+    for handler in root.handlers:
+        handler.filters = [f for f in handler.filters if not isinstance(f, RateLimitFilter)]
+        handler.addFilter(RateLimitFilter(rate_limit))
+    _configured = True
+
+
+def get_logger(name):
+    """获取模块日志对象，如get_logger("detect")；第一次调用时按配置初始化"""
+    if not _configured:
+        setup_logging()
+    return logging.getLogger(f"vision.{name}")